@@ -0,0 +1,150 @@
+import os
+from typing import Any
+import streamlit as st
+from pydantic import Field
+# Import the prompt primitive used to rebuild the ReAct template from the bundled local copy
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+# Import the Google Gemini chat model interface
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain.agents import create_react_agent, create_tool_calling_agent
+from cancellation import LLM_REQUEST_TIMEOUT
+# Import the shared per-key token bucket (quota pacing + coordinated 429 backoff)
+from rate_limiter import RateLimitedChatMixin, get_rate_limiter, GEMINI_RPM
+# Import the agent modes (defined apart, so the UI can list them without this module's imports)
+from agent_modes import AGENT_MODES, DEFAULT_AGENT_MODE
+
+# Location of the bundled copy of the 'hwchase17/react-chat' Hub prompt.
+# Shipping it with the app means a cold start never needs a LangChain Hub round trip.
+REACT_PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts", "react_chat.txt")
+
+# Data rules shared by both agent modes: the persona, the schema digest, retrieved examples, and SQL rules.
+# NOTE: These are regular templates (NOT f-strings). '{chosen_language}', '{schema_digest}', and
+# '{retrieved_examples}' stay prompt variables and are filled in on every 'invoke', so switching
+# languages (or databases) never rebuilds the agent.
+DATA_ANALYST_PROMPT = """
+You are an expert Data Analyst and SQL Analyst.
+Your goal is to answer user questions by querying a database.
+
+DATABASE PROFILE (every table, column type, value range, and the complete value set of categorical columns):
+{schema_digest}
+
+{retrieved_examples}
+
+RULES:
+1. Use the DATABASE PROFILE above as your map of the data. DO NOT call 'sql_db_list_tables' or run 'SELECT DISTINCT' probes for information it already contains.
+2. Only call 'sql_db_schema' if you need something the profile does not cover (e.g., sample rows).
+3. Construct a syntactically correct SQL query using the exact values listed in the profile. Quote column names that contain spaces (e.g., "Pattern Type").
+4. Execute the query using 'sql_db_query'.
+5. If you get an error, check your query and try again.
+6. DO NOT execute DML statements (INSERT, UPDATE, DELETE).
+"""
+
+# System instructions & persona of the text-based ReAct agent (prepended to the ReAct-Chat template)
+PREFIX_PROMPT = DATA_ANALYST_PROMPT + """7. CRITICAL LANGUAGE OUTPUT RULE: When you have the answer, you MUST strictly use the format: "Final Answer: [Your answer in {chosen_language}]".
+   - The User's chosen output language is: "{chosen_language}".
+   - IGNORE the user's language for the final output; IT MUST BE IN {chosen_language}.
+   - LOGIC CHECK:
+     * IF User asks in Indonesian AND "{chosen_language}" is English -> ANSWER IN ENGLISH.
+     * IF User asks in English AND "{chosen_language}" is Indonesian -> ANSWER IN INDONESIAN.
+   - You MUST perform this translation step before giving the Final Answer.
+   - DO NOT mimic the user's language. STICK TO "{chosen_language}".
+   - If you do not start your final response with "Final Answer:", the system will crash.
+   - Format: "Final Answer: [Your answer strictly in {chosen_language}]".
+   - Provide context and reasoning in your answer, not just numbers.
+8. SPECIAL RULE FOR CASUAL CHAT (NO TOOL USED):
+   - Even if you do not use a tool (e.g., greetings like "Halo", "Hi"), you MUST STILL translate your response to "{chosen_language}".
+   - Example: If User says "Halo" (Indo) and target is English -> Final Answer: "Hello! How can I help you with the database?"
+   - NEVER reply in the user's language just to be polite. Stick to the target language.
+"""
+
+# System instructions of the function-calling agent. Tools are passed to Gemini as
+# structured declarations, so there is no Thought/Action/Final Answer format to get wrong.
+TOOL_CALLING_PROMPT = DATA_ANALYST_PROMPT + """7. PARALLEL CALLS: When you need several independent pieces of information (e.g., the schema of several tables, or queries that do not depend on each other's results), request ALL of those tool calls in the SAME turn. They are executed at the same time.
+8. LANGUAGE: Your answer (the reply without tool calls) MUST be written in {chosen_language}, whatever language the user writes in. This also applies to casual chat such as greetings ("Halo", "Hi").
+   - Provide context and reasoning in your answer, not just numbers.
+
+Previous conversation history:
+{chat_history}
+"""
+
+@st.cache_resource(show_spinner=False)
+def load_react_prompt():
+    """
+    Builds the agent's prompt template ONCE per process.
+    Reads the bundled ReAct-Chat template from disk (no network) and prepends
+    our custom rules so they take priority over the conversation history.
+    """
+    with open(REACT_PROMPT_PATH, encoding="utf-8") as f:
+        base_template = f.read()
+
+    # Prepend the system instructions to the base template.
+    # 'retrieved_examples' defaults to empty, for callers that do not use the question index.
+    return PromptTemplate.from_template(PREFIX_PROMPT + "\n\n" + base_template).partial(retrieved_examples="")
+
+@st.cache_resource(show_spinner=False)
+def load_tool_calling_prompt():
+    """
+    Builds the function-calling agent's prompt ONCE per process: the system instructions
+    (with the conversation history), the question, and the tool call / result messages.
+    """
+    return ChatPromptTemplate.from_messages([
+        ("system", TOOL_CALLING_PROMPT),
+        ("human", "{input}"),
+        MessagesPlaceholder("agent_scratchpad"),
+    ]).partial(retrieved_examples="")
+
+class RateLimitedGemini(RateLimitedChatMixin, ChatGoogleGenerativeAI):
+    """
+    Gemini chat model whose requests are paced by a shared token bucket.
+    A 429 / "resource exhausted" answer pauses every caller of the same key and is retried,
+    so sessions and batch workers saturate the quota instead of failing on it.
+    """
+
+    quota_limiter: Any = Field(default=None, exclude=True)
+
+@st.cache_resource(show_spinner=False)
+def get_llm(google_api_key, requests_per_minute=GEMINI_RPM):
+    """
+    Returns the Gemini chat model shared by every session using the same API key.
+    Cached at process level, so a rerun (or a new browser tab) never re-creates the client.
+    """
+    return RateLimitedGemini(
+        model="gemini-2.5-flash",
+        google_api_key=google_api_key,
+        # Requests are paced (and 429s retried) by the key's shared limiter,
+        # so the client's own uncoordinated retries are turned off.
+        quota_limiter=get_rate_limiter(google_api_key, requests_per_minute),
+        max_retries=1,
+        # Set temperature to 0.3 to ensure the model outputs are deterministic and precise,
+        # which is critical for generating accurate SQL queries.
+        temperature=0.3,
+        # Bound every Gemini request so a hung call cannot pin a worker forever
+        timeout=LLM_REQUEST_TIMEOUT
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_agent_brain(google_api_key, _tools, requests_per_minute=GEMINI_RPM):
+    """
+    Returns the ReAct agent graph (Prompt -> LLM -> Output Parser), built once per API key.
+    '_tools' is excluded from the cache key (leading underscore): the agent only uses the
+    tool names/descriptions to render the prompt, and those are identical for every session.
+    The language is NOT part of the graph; it is passed as 'chosen_language' on each invoke.
+    """
+    return create_react_agent(
+        llm=get_llm(google_api_key, requests_per_minute),
+        tools=_tools,
+        prompt=load_react_prompt()
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_tool_calling_agent(google_api_key, _tools, requests_per_minute=GEMINI_RPM):
+    """
+    Returns the function-calling agent graph (Prompt -> LLM with bound tools -> tool calls), built once per API key.
+    Gemini returns structured calls (several per turn when they are independent), so a
+    malformed "Action:" can never cost a retry.
+    """
+    return create_tool_calling_agent(
+        llm=get_llm(google_api_key, requests_per_minute),
+        tools=_tools,
+        prompt=load_tool_calling_prompt()
+    )
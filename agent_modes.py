@@ -0,0 +1,7 @@
+import os
+
+# Agent modes a session can use: the text-parsing ReAct agent, or Gemini's structured function calling
+# (no output parsing, independent tool calls issued and executed in parallel).
+# Kept apart from agent.py so the UI can list them without importing LangChain / Gemini.
+AGENT_MODES = {"react": "ReAct (text)", "tools": "Function calling (parallel)"}
+DEFAULT_AGENT_MODE = os.environ.get("INSIGHTSQL_AGENT_MODE", "react")
@@ -0,0 +1,56 @@
+import threading
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Marker the ReAct prompt requires before the answer shown to the user
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+class FinalAnswerStreamHandler(BaseCallbackHandler):
+    """
+    Watches the tokens of every LLM step and exposes the text that follows
+    "Final Answer:" as it is generated, so the UI can render the answer
+    token by token instead of waiting for the whole agent run to finish.
+    With marker=None (function-calling agent) a step's whole text is the answer,
+    until the step turns out to be a tool call.
+    Intermediate steps (Thought / Action / Observation) are ignored here;
+    they keep rendering through the StreamlitCallbackHandler.
+    """
+
+    def __init__(self, marker=FINAL_ANSWER_MARKER):
+        self.marker = marker
+        self._buffer = ""
+        self._answer = ""
+        self._lock = threading.Lock()
+
+    @property
+    def text(self):
+        """
+        The part of the final answer generated so far ("" until the marker appears).
+        """
+        with self._lock:
+            return self._answer
+
+    def _new_step(self):
+        with self._lock:
+            self._buffer = ""
+            self._answer = ""
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._new_step()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._new_step()
+
+    def on_llm_new_token(self, token, **kwargs):
+        with self._lock:
+            self._buffer += token
+            if self.marker is None:
+                self._answer = self._buffer.lstrip()
+                return
+            # The marker may be split across tokens, so search the whole step's text
+            index = self._buffer.find(self.marker)
+            if index >= 0:
+                self._answer = self._buffer[index + len(self.marker):].lstrip()
+
+    def on_agent_action(self, action, **kwargs):
+        # The step turned out to be a tool call after all: drop anything shown
+        self._new_step()
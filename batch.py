@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import warnings
+from langchain.agents import AgentExecutor, create_react_agent, create_tool_calling_agent
+from agent import (
+    AGENT_MODES, DEFAULT_AGENT_MODE, get_agent_brain, get_llm, get_tool_calling_agent,
+    load_react_prompt, load_tool_calling_prompt
+)
+from database import DB_URI, DB_BACKEND, get_database
+from profiler import get_schema_digest
+from sql_tools import InsightSQLToolkit
+from query_cache import get_query_cache
+from query_log import get_query_log
+from question_index import ExampleRecorder, get_question_index, schema_fingerprint
+from duckdb_mirror import resolve_backend
+from cancellation import RunControl, RunCancelled, CancellationCallbackHandler, activate, MAX_ITERATIONS
+from tracing import TraceCallbackHandler
+from rate_limiter import GEMINI_RPM, get_rate_limiter, is_rate_limit_error
+from tool_calling import tool_input_text
+
+# Questions answered at the same time (model calls are still paced by the rate limiter)
+DEFAULT_CONCURRENCY = 4
+
+# Per-question wall-clock budget in batch mode (seconds). Higher than the UI's, since
+# time spent waiting for quota is expected when hundreds of questions share one key.
+BATCH_TIME_BUDGET = 600
+
+def load_questions(path):
+    """
+    Reads a JSONL file of questions. Every line is either a JSON string or an object
+    with "question" and optional "id" / "language". Blank lines are skipped.
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {"question": entry}
+            entry.setdefault("id", str(line_number))
+            questions.append(entry)
+    return questions
+
+def build_executor(agent, tools, time_budget):
+    """
+    The app's AgentExecutor without conversation memory: batch questions are independent.
+    Questions run with 'ainvoke', whose steps already run several tool calls concurrently.
+    """
+    return AgentExecutor(
+        agent=agent,
+        tools=tools,
+        handle_parsing_errors=True,
+        max_iterations=MAX_ITERATIONS,
+        max_execution_time=time_budget,
+        early_stopping_method="force",
+        # The generated SQL is read from the intermediate steps
+        return_intermediate_steps=True,
+    )
+
+async def answer(executor, entry, schema_digest, language, time_budget, index=None, query_tool=None):
+    """
+    Answers one question and returns its output record (never raises).
+    With a question 'index', similar past questions are added to the prompt,
+    repeats reuse their stored SQL, and successful answers are recorded.
+    """
+    question = entry["question"]
+    record = {"id": entry["id"], "question": question, "answer": None, "sql": [], "status": "ok", "error": None, "reused_sql": False}
+
+    # The budget starts when the question actually runs, not while it waits for a worker slot
+    control = RunControl(time_budget=time_budget)
+    trace = TraceCallbackHandler(question=question, trace_path=None)
+    recorder = ExampleRecorder()
+    retrieval = None
+    started = time.perf_counter()
+    try:
+        with activate(control):
+            if index is not None:
+                # A repeat question runs its stored SQL: off the event loop, like the agent's own tools
+                retrieval = await asyncio.to_thread(index.retrieve, question, query_tool.run if query_tool else None)
+            response = await executor.ainvoke(
+                {
+                    "input": question,
+                    "chosen_language": entry.get("language", language),
+                    "schema_digest": schema_digest,
+                    "chat_history": "",
+                    "retrieved_examples": retrieval.prompt_text if retrieval else "",
+                },
+                {"callbacks": [trace, CancellationCallbackHandler(control), recorder]}
+            )
+        record["answer"] = response.get("output")
+        record["sql"] = [tool_input_text(action.tool_input) for action, _ in response.get("intermediate_steps", []) if action.tool == "sql_db_query"]
+        if retrieval is not None:
+            record["reused_sql"] = retrieval.direct_hit is not None
+            recorder.record(index, question, record["answer"], retrieval)
+    except RunCancelled as e:
+        record["status"], record["error"] = "timeout", str(e)
+    except Exception as e:
+        record["status"] = "rate_limited" if is_rate_limit_error(e) else "error"
+        record["error"] = f"{type(e).__name__}: {e}"[:1000]
+
+    summary = trace.summary()
+    record["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    record["timings"] = summary["by_kind"]
+    return record
+
+async def run_batch(questions, executor, schema_digest, output_path, concurrency=DEFAULT_CONCURRENCY,
+                    language="English", time_budget=BATCH_TIME_BUDGET, index=None, query_tool=None):
+    """
+    Answers every question with at most 'concurrency' in flight and appends each
+    record to 'output_path' as soon as it is done (completion order; match on "id").
+    Returns the per-status counts.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {}
+
+    async def worker(entry):
+        async with semaphore:
+            return await answer(executor, entry, schema_digest, language, time_budget, index, query_tool)
+
+    with open(output_path, "w", encoding="utf-8") as out:
+        tasks = [asyncio.create_task(worker(entry)) for entry in questions]
+        for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+            record = await task
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+            print(f"[{done}/{len(questions)}] {record['status']:<12} {record['latency_ms'] / 1000:7.1f}s  {record['question'][:70]}", file=sys.stderr)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions headlessly with the InsightSQL agent.")
+    parser.add_argument("questions", help="Input JSONL: one question per line (string or {\"id\", \"question\", \"language\"})")
+    parser.add_argument("output", help="Output JSONL: answer, generated SQL, status, and timings per question")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Questions answered at the same time")
+    parser.add_argument("--rpm", type=float, default=GEMINI_RPM, help="Gemini requests per minute allowed for this API key")
+    parser.add_argument("--language", default="English", help="Answer language when a question does not set one")
+    parser.add_argument("--db-uri", default=DB_URI, help="SQLAlchemy URI of the database (or Parquet files with --backend duckdb)")
+    parser.add_argument("--backend", choices=("sqlite", "duckdb"), default=DB_BACKEND,
+                        help="'duckdb' answers from a columnar DuckDB mirror of the database (needs duckdb + duckdb-engine)")
+    parser.add_argument("--time-budget", type=float, default=BATCH_TIME_BUDGET, help="Seconds allowed per question")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"), help="Google API key (default: $GOOGLE_API_KEY)")
+    parser.add_argument("--scripted", metavar="TRANSCRIPTS", default=None,
+                        help="Run offline: replay recorded ReAct transcripts instead of calling Gemini")
+    parser.add_argument("--agent-mode", choices=list(AGENT_MODES), default=DEFAULT_AGENT_MODE,
+                        help="'react' parses Thought/Action text; 'tools' uses native function calling (parallel tool calls)")
+    parser.add_argument("--no-index", action="store_true",
+                        help="Do not use or update the index of past question -> SQL pairs (always off with --scripted)")
+    args = parser.parse_args()
+
+    # LangChain deprecation notices are noise in a batch log
+    warnings.filterwarnings("ignore", message=".*deprecated.*")
+
+    db_uri, _ = resolve_backend(args.db_uri, args.backend)
+    db = get_database(db_uri)
+    schema_digest = get_schema_digest(db, db_uri)
+    # Offline runs replay transcripts: keep their SQL out of the query log and the question index
+    query_log = None if args.scripted else get_query_log()
+
+    if args.scripted:
+        # Imported lazily: only needed for offline runs
+        from scripted_llm import ScriptedChatModel, load_transcripts
+        llm = ScriptedChatModel(transcripts=load_transcripts(args.scripted))
+        tools = InsightSQLToolkit(db=db, llm=llm, query_cache=get_query_cache(), query_log=query_log).get_tools()
+        if args.agent_mode == "tools":
+            agent = create_tool_calling_agent(llm=llm, tools=tools, prompt=load_tool_calling_prompt())
+        else:
+            agent = create_react_agent(llm=llm, tools=tools, prompt=load_react_prompt())
+        limiter = None
+    else:
+        if not args.api_key:
+            parser.error("a Google API key is required (--api-key or $GOOGLE_API_KEY), or use --scripted")
+        # Same construction as the app: shared model, toolkit, cached agent graph
+        llm = get_llm(args.api_key, args.rpm)
+        tools = InsightSQLToolkit(db=db, llm=llm, query_cache=get_query_cache(), query_log=query_log).get_tools()
+        if args.agent_mode == "tools":
+            agent = get_tool_calling_agent(args.api_key, tools, args.rpm)
+        else:
+            agent = get_agent_brain(args.api_key, tools, args.rpm)
+        limiter = get_rate_limiter(args.api_key, args.rpm)
+
+    questions = load_questions(args.questions)
+    executor = build_executor(agent, tools, args.time_budget)
+    index = None if args.no_index or args.scripted else get_question_index(str(db._engine.url), schema_fingerprint(db))
+    query_tool = next(tool for tool in tools if tool.name == "sql_db_query")
+
+    started = time.perf_counter()
+    counts = asyncio.run(run_batch(
+        questions, executor, schema_digest, args.output,
+        concurrency=args.concurrency, language=args.language, time_budget=args.time_budget,
+        index=index, query_tool=query_tool
+    ))
+    elapsed = time.perf_counter() - started
+    # The log is written by a daemon thread: let it finish before the process exits
+    if query_log is not None:
+        query_log.flush()
+
+    print(f"\nAnswered {len(questions)} question(s) in {elapsed:.1f}s "
+          f"({len(questions) / elapsed * 60:.1f}/min) • " + ", ".join(f"{k}: {v}" for k, v in sorted(counts.items())), file=sys.stderr)
+    if index is not None:
+        stats = index.stats()
+        print(f"Question index: {stats['examples']} example(s) • Few-shot prompts: {stats['few_shot']} • Reused SQL: {stats['direct_hits']}", file=sys.stderr)
+    if limiter is not None:
+        stats = limiter.stats()
+        print(f"Gemini requests: {stats['acquired']} • 429 backoffs: {stats['backoffs']} • Waited for quota: {stats['wait_time_s']}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import resource
+import time
+import warnings
+from langchain.agents import AgentExecutor, create_react_agent
+from agent import load_react_prompt
+from database import get_database
+from profiler import get_schema_digest
+from sql_tools import InsightSQLToolkit
+from query_cache import QueryCache
+from conversation_memory import BackgroundSummaryMemory
+from cancellation import RunControl, CancellationCallbackHandler, activate, MAX_ITERATIONS, MAX_EXECUTION_TIME
+from tracing import TraceCallbackHandler, SQL_TOOLS
+from answer_stream import FinalAnswerStreamHandler
+from scripted_llm import ScriptedChatModel, load_transcripts, TRANSCRIPTS_PATH
+from synthetic_data import SEED_DB_PATH, ensure_synthetic_db
+from duckdb_mirror import resolve_backend
+
+# Percentiles reported for every metric
+PERCENTILES = (50, 90, 99)
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a list of numbers (0.0 for an empty list).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))  # ceil(n * p / 100)
+    return ordered[int(rank) - 1]
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB (Linux reports KB, macOS bytes).
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+def build_pipeline(db, llm, use_cache=True):
+    """
+    Builds the same agent as app.py (toolkit, ReAct prompt, output parser),
+    with the scripted model in place of Gemini.
+    """
+    tools = InsightSQLToolkit(db=db, llm=llm, query_cache=QueryCache() if use_cache else None).get_tools()
+    agent = create_react_agent(llm=llm, tools=tools, prompt=load_react_prompt())
+    return agent, tools
+
+def new_executor(agent, tools, llm):
+    """
+    A fresh AgentExecutor + memory, configured like one chat session in the app.
+    """
+    memory = BackgroundSummaryMemory(memory_key="chat_history", input_key="input", llm=llm, return_messages=False)
+    executor = AgentExecutor(
+        agent=agent,
+        tools=tools,
+        memory=memory,
+        handle_parsing_errors=True,
+        max_iterations=MAX_ITERATIONS,
+        max_execution_time=MAX_EXECUTION_TIME,
+        early_stopping_method="force",
+    )
+    return executor, memory
+
+def run_question(executor, question, schema_digest, language="English"):
+    """
+    Answers one question like the app does (same inputs and callbacks) and
+    returns its timings in ms: wall latency, LLM, SQL, and the remaining engine overhead.
+    """
+    control = RunControl()
+    trace = TraceCallbackHandler(question=question, trace_path=None)
+    callbacks = [trace, FinalAnswerStreamHandler(), CancellationCallbackHandler(control)]
+
+    started = time.perf_counter()
+    with activate(control):
+        response = executor.invoke(
+            {"input": question, "chosen_language": language, "schema_digest": schema_digest},
+            {"callbacks": callbacks}
+        )
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    summary = trace.summary()
+    llm_ms = summary["by_kind"].get("llm", {}).get("ms", 0.0)
+    sql_ms = sum(span["duration_ms"] or 0.0 for span in trace.spans if span["kind"] == "tool" and span["attributes"].get("tool") in SQL_TOOLS)
+    return {
+        "latency_ms": latency_ms,
+        "llm_ms": llm_ms,
+        "sql_ms": sql_ms,
+        # Everything that is neither the model nor the database: prompt, parsing, callbacks, memory
+        "overhead_ms": max(latency_ms - llm_ms - sql_ms, 0.0),
+        "steps": summary["by_kind"].get("llm", {}).get("calls", 0),
+        "cache_hits": summary["by_kind"].get("tool", {}).get("cache_hits", 0),
+        "answered": bool(response.get("output")),
+    }
+
+def run_benchmark(rows=0, repeat=5, warmup=1, llm_latency=0.0, use_cache=True, transcripts_path=TRANSCRIPTS_PATH,
+                  backend="sqlite"):
+    """
+    Replays every recorded transcript 'warmup + repeat' times (one fresh session per round)
+    and returns a report with per-question and overall latency percentiles.
+    With backend="duckdb" the same SQLite data is queried through its DuckDB mirror
+    (setup then includes building the mirror).
+    """
+    setup_started = time.perf_counter()
+    db_path = ensure_synthetic_db(rows) if rows else SEED_DB_PATH
+    uri, _ = resolve_backend(f"sqlite:///{db_path}", backend)
+    db = get_database(uri)
+    schema_digest = get_schema_digest(db, uri)
+    setup_ms = (time.perf_counter() - setup_started) * 1000
+
+    transcripts = load_transcripts(transcripts_path)
+    llm = ScriptedChatModel(transcripts=transcripts, latency=llm_latency)
+    agent, tools = build_pipeline(db, llm, use_cache=use_cache)
+
+    samples = {entry["question"]: [] for entry in transcripts}
+    for round_index in range(warmup + repeat):
+        executor, memory = new_executor(agent, tools, llm)
+        for question in samples:
+            result = run_question(executor, question, schema_digest)
+            if round_index >= warmup:
+                samples[question].append(result)
+        memory.wait()
+
+    def describe(results):
+        metrics = {}
+        for metric in ("latency_ms", "overhead_ms", "sql_ms", "llm_ms"):
+            values = [r[metric] for r in results]
+            metrics[metric] = {f"p{p}": round(percentile(values, p), 2) for p in PERCENTILES}
+        metrics["steps"] = max((r["steps"] for r in results), default=0)
+        metrics["cache_hits"] = sum(r["cache_hits"] for r in results)
+        metrics["failures"] = sum(not r["answered"] for r in results)
+        return metrics
+
+    with db._engine.connect() as conn:
+        row_count = conn.exec_driver_sql("SELECT COUNT(*) FROM dresses").scalar()
+
+    all_results = [r for results in samples.values() for r in results]
+    return {
+        "database": db_path,
+        "backend": backend,
+        "rows": row_count,
+        "repeat": repeat,
+        "llm_latency_ms": llm_latency * 1000,
+        "query_cache": use_cache,
+        "setup_ms": round(setup_ms, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "overall": describe(all_results),
+        "questions": {question: describe(results) for question, results in samples.items()},
+    }
+
+def print_report(report):
+    """
+    Prints the report as a fixed-width table.
+    """
+    print(f"Database: {report['database']} ({report['rows']:,} rows, {report['backend']})")
+    print(f"Rounds: {report['repeat']} • Simulated LLM latency: {report['llm_latency_ms']:.0f} ms/call • "
+          f"Query cache: {'on' if report['query_cache'] else 'off'} • Setup: {report['setup_ms']:.0f} ms")
+    print()
+    header = f"{'question':<55} {'steps':>5} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'ovh p50':>9} {'sql p50':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["questions"].items()) + [("OVERALL", report["overall"])]
+    for question, m in rows:
+        print(
+            f"{question[:55]:<55} {m['steps']:>5} {m['latency_ms']['p50']:>9.2f} {m['latency_ms']['p90']:>9.2f} "
+            f"{m['latency_ms']['p99']:>9.2f} {m['overhead_ms']['p50']:>9.2f} {m['sql_ms']['p50']:>9.2f}"
+        )
+    print()
+    print(f"Peak RSS: {report['peak_rss_mb']} MB • Failures: {report['overall']['failures']} • Cache hits: {report['overall']['cache_hits']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline, deterministic benchmark of the InsightSQL agent pipeline.")
+    parser.add_argument("--rows", type=int, default=0, help="Benchmark a synthetic database with this many rows (0 = the bundled dresses.db)")
+    parser.add_argument("--repeat", type=int, default=5, help="Measured rounds over all recorded questions")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured rounds run first")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated model latency per call, in ms")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the query result cache (measure every SQL execution)")
+    parser.add_argument("--backend", choices=("sqlite", "duckdb"), default="sqlite",
+                        help="Query the data directly (sqlite) or through its DuckDB mirror (needs duckdb + duckdb-engine)")
+    parser.add_argument("--transcripts", default=TRANSCRIPTS_PATH, help="JSON file of recorded ReAct transcripts")
+    parser.add_argument("--json", default=None, help="Also write the full report to this JSON file")
+    args = parser.parse_args()
+
+    # LangChain's memory deprecation notices are not relevant to a benchmark run
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    warnings.filterwarnings("ignore", message=".*deprecated.*")
+
+    report = run_benchmark(
+        rows=args.rows,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        llm_latency=args.llm_latency / 1000,
+        use_cache=not args.no_cache,
+        transcripts_path=args.transcripts,
+        backend=args.backend,
+    )
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,158 @@
+from sqlalchemy.exc import DBAPIError
+from langchain_community.utilities.sql_database import truncate_word
+# Import the SQLite progress-handler timeout (per-query budget + Stop button)
+from cancellation import sql_timeout
+
+# Budget for the rows that are shown to the LLM verbatim
+MAX_PREVIEW_ROWS = 50
+MAX_PREVIEW_BYTES = 8 * 1024
+
+# Rows pulled from the cursor per round trip (memory stays O(FETCH_BATCH), not O(result))
+FETCH_BATCH = 500
+
+# Past the preview, rows are only aggregated; stop after this many to bound latency
+MAX_SUMMARY_ROWS = 200_000
+
+# Per-column cap on tracked distinct values, so a high-cardinality column cannot grow memory
+MAX_TRACKED_DISTINCT = 1000
+
+class QueryInterrupted(Exception):
+    """
+    Raised when a statement was stopped by its timeout or by a cancelled run.
+    """
+
+class ColumnSummary:
+    """
+    Running, constant-memory aggregates of one result column.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.nulls = 0
+        self.numeric_count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.counts = {}
+        self.distinct_overflow = False
+
+    def add(self, value):
+        """
+        Folds one value into the running aggregates.
+        """
+        if value is None:
+            self.nulls += 1
+            return
+
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self.numeric_count += 1
+            self.total += value
+
+        try:
+            self.min = value if self.min is None or value < self.min else self.min
+            self.max = value if self.max is None or value > self.max else self.max
+        except TypeError:
+            pass  # Mixed types in one column (possible in SQLite): skip min/max for this value
+
+        if not self.distinct_overflow:
+            key = value if isinstance(value, (int, float, str)) else repr(value)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if len(self.counts) > MAX_TRACKED_DISTINCT:
+                self.counts = {}
+                self.distinct_overflow = True
+
+    def describe(self):
+        """
+        Renders the aggregates as one compact line.
+        """
+        parts = []
+        if self.numeric_count:
+            parts.append(f"min {self.min}, max {self.max}, avg {self.total / self.numeric_count:.4g}")
+        elif self.min is not None:
+            parts.append(f"min {truncate_word(self.min, length=40)!r}, max {truncate_word(self.max, length=40)!r}")
+
+        if self.distinct_overflow:
+            parts.append(f"more than {MAX_TRACKED_DISTINCT} distinct values")
+        else:
+            parts.append(f"{len(self.counts)} distinct")
+            if not self.numeric_count and self.counts:
+                top = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:5]
+                parts.append("top: " + ", ".join(f"{truncate_word(v, length=40)!r} ({n})" for v, n in top))
+
+        if self.nulls:
+            parts.append(f"{self.nulls} null")
+        return f"- {self.name}: " + "; ".join(parts)
+
+def run_bounded(db, query):
+    """
+    Executes a query with a streaming cursor under a row AND byte budget.
+    Small results are returned exactly like 'SQLDatabase.run' (a stringified list of tuples).
+    Larger results return a truncated preview plus a summary computed over ALL rows
+    (row count and per-column aggregates), so memory and prompt size stay flat no
+    matter how big the table is.
+    Returns a dict: {"text": ..., "row_count": ..., "truncated": bool}.
+    """
+    preview, preview_bytes = [], 2  # 2 = the surrounding '[' and ']'
+    row_count = 0
+    truncated = False
+    complete = True
+
+    with db._engine.connect() as conn, sql_timeout(conn.connection.dbapi_connection) as timeout_state:
+        try:
+            # 'stream_results' asks for a server-side cursor where the driver supports it
+            result = conn.execution_options(stream_results=True).exec_driver_sql(query)
+            if not result.returns_rows:
+                return {"text": "", "row_count": 0, "truncated": False}
+
+            columns = list(result.keys())
+            summaries = [ColumnSummary(name) for name in columns]
+
+            while True:
+                batch = result.fetchmany(FETCH_BATCH)
+                if not batch:
+                    break
+
+                for row in batch:
+                    row_count += 1
+                    for summary, value in zip(summaries, row):
+                        summary.add(value)
+
+                    # Keep rendering rows verbatim until either budget is exhausted
+                    if not truncated:
+                        rendered = repr(tuple(truncate_word(v, length=db._max_string_length) for v in row))
+                        if len(preview) < MAX_PREVIEW_ROWS and preview_bytes + len(rendered) + 2 <= MAX_PREVIEW_BYTES:
+                            preview.append(rendered)
+                            preview_bytes += len(rendered) + 2
+                        else:
+                            truncated = True
+
+                if row_count >= MAX_SUMMARY_ROWS:
+                    complete = False
+                    break
+
+            result.close()
+        except DBAPIError as e:
+            # The progress handler / watchdog stopped the statement: report WHY instead of "interrupted"
+            if timeout_state["reason"]:
+                raise QueryInterrupted(timeout_state["reason"]) from e
+            raise
+
+    if not row_count:
+        return {"text": "", "row_count": 0, "truncated": False}
+
+    text = "[" + ", ".join(preview) + "]"
+    if not truncated:
+        return {"text": text, "row_count": row_count, "truncated": False}
+
+    # Past the budget: tell the agent explicitly, and give it the aggregates of every row
+    total = f"{row_count:,}" if complete else f"at least {MAX_SUMMARY_ROWS:,}"
+    scope = "all" if complete else f"the first {row_count:,}"
+    lines = [
+        text,
+        "",
+        f"RESULT TRUNCATED: the query returned {total} rows; only the first {len(preview)} are shown above.",
+        f"Summary of {scope} rows (columns: {', '.join(columns)}):",
+    ]
+    lines += [summary.describe() for summary in summaries]
+    lines.append("Do NOT fetch raw rows again. Use aggregation (COUNT, AVG, GROUP BY) or a LIMIT to get exactly what you need.")
+    return {"text": "\n".join(lines), "row_count": row_count, "truncated": True}
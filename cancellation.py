@@ -0,0 +1,181 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger("insightsql")
+
+# Per-statement SQL budget (seconds). Enforced inside SQLite via its progress handler.
+QUERY_TIMEOUT = 20
+
+# Per-question agent budget: ReAct steps and wall-clock seconds
+MAX_ITERATIONS = 8
+MAX_EXECUTION_TIME = 120
+
+# Upper bound for a single Gemini HTTP request (seconds)
+LLM_REQUEST_TIMEOUT = 60
+
+# Number of SQLite virtual-machine instructions between two cancellation checks
+PROGRESS_HANDLER_OPS = 10_000
+
+# Seconds between two cancellation checks on databases without a progress handler (DuckDB)
+WATCHDOG_INTERVAL = 0.1
+
+class RunCancelled(Exception):
+    """
+    Raised inside the agent loop when the current question has been aborted
+    (user pressed Stop, or the time budget ran out).
+    """
+
+class RunControl:
+    """
+    Cancellation token + wall-clock budget for ONE question.
+    Shared between the UI thread (which can cancel it) and the worker thread,
+    the SQL progress handler, and the agent callbacks (which check it).
+    """
+
+    def __init__(self, time_budget=MAX_EXECUTION_TIME):
+        self.started = time.monotonic()
+        self.deadline = self.started + time_budget
+        self.reason = None
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def restart_clock(self):
+        """
+        Restarts the time budget, e.g., when a queued question finally gets a worker.
+        """
+        budget = self.deadline - self.started
+        self.started = time.monotonic()
+        self.deadline = self.started + budget
+
+    def cancel(self, reason):
+        """
+        Aborts the run. Only the first reason is kept (and logged).
+        """
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            logger.warning("Run aborted after %.1fs: %s", self.elapsed(), reason)
+
+    def check(self):
+        """
+        Raises RunCancelled if the run was cancelled or its time budget is spent.
+        """
+        if not self._event.is_set() and time.monotonic() > self.deadline:
+            self.cancel(f"time budget of {self.deadline - self.started:.0f}s exceeded")
+        if self._event.is_set():
+            raise RunCancelled(self.reason)
+
+# The RunControl of the question being processed in the current thread / task
+_current_control = contextvars.ContextVar("insightsql_run_control", default=None)
+
+def current_run_control():
+    """
+    Returns the RunControl active in this context, or None outside of a question.
+    """
+    return _current_control.get()
+
+@contextmanager
+def activate(control):
+    """
+    Makes 'control' the active RunControl for the code inside the 'with' block.
+    """
+    token = _current_control.set(control)
+    try:
+        yield control
+    finally:
+        _current_control.reset(token)
+
+@contextmanager
+def sql_timeout(dbapi_connection, timeout=QUERY_TIMEOUT):
+    """
+    Bounds a statement on a raw SQLite (or DuckDB) connection.
+    SQLite calls the progress handler every PROGRESS_HANDLER_OPS instructions;
+    returning non-zero interrupts the statement ("interrupted" OperationalError).
+    DuckDB has no progress handler, so a watchdog thread calls 'interrupt()' instead.
+    The statement is stopped when the per-query timeout passes OR when the
+    active RunControl is cancelled (Stop button / question budget).
+    Yields a dict whose 'reason' is set if the query was interrupted.
+    """
+    state = {"reason": None}
+    has_progress_handler = hasattr(dbapi_connection, "set_progress_handler")
+    if not has_progress_handler and not hasattr(dbapi_connection, "interrupt"):
+        # Neither SQLite nor DuckDB: nothing to install
+        yield state
+        return
+
+    deadline = time.monotonic() + timeout
+    control = current_run_control()
+
+    def _should_stop():
+        if time.monotonic() > deadline:
+            state["reason"] = f"query exceeded the {timeout}s timeout"
+            return True
+        if control is not None and (control.cancelled or time.monotonic() > control.deadline):
+            state["reason"] = control.reason or "question time budget exceeded"
+            return True
+        return False
+
+    if has_progress_handler:
+        dbapi_connection.set_progress_handler(lambda: 1 if _should_stop() else 0, PROGRESS_HANDLER_OPS)
+    else:
+        finished = threading.Event()
+        # Held while interrupting, so a connection already handed back to the pool is never interrupted
+        guard = threading.Lock()
+
+        def _watchdog():
+            while not finished.wait(WATCHDOG_INTERVAL):
+                if _should_stop():
+                    with guard:
+                        if not finished.is_set():
+                            dbapi_connection.interrupt()
+                    return
+
+        threading.Thread(target=_watchdog, name="insightsql-sql-watchdog", daemon=True).start()
+    try:
+        yield state
+    finally:
+        if has_progress_handler:
+            # Never leave a handler behind on a pooled connection
+            dbapi_connection.set_progress_handler(None, PROGRESS_HANDLER_OPS)
+        else:
+            with guard:
+                finished.set()
+        if state["reason"]:
+            logger.warning("SQL statement interrupted: %s", state["reason"])
+
+class CancellationCallbackHandler(BaseCallbackHandler):
+    """
+    Checks the RunControl at every agent step (LLM call, streamed token,
+    tool call) and aborts the AgentExecutor as soon as it is cancelled.
+    """
+
+    # Let RunCancelled propagate out of the callback instead of being logged and ignored
+    raise_error = True
+
+    def __init__(self, control):
+        self.control = control
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.control.check()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.control.check()
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.control.check()
+
+    def on_agent_action(self, action, **kwargs):
+        self.control.check()
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.control.check()
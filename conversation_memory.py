@@ -0,0 +1,211 @@
+import logging
+import threading
+from typing import Any
+from pydantic import PrivateAttr
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.summary import SummarizerMixin
+from langchain_core.messages import get_buffer_string, messages_from_dict, messages_to_dict
+# Import the Gemini request bound, so a summarization cannot hold a question forever
+from cancellation import LLM_REQUEST_TIMEOUT
+
+logger = logging.getLogger("insightsql")
+
+# Budget (approx. tokens) of the recent turns kept verbatim in the prompt
+RECENT_TOKEN_LIMIT = 1500
+
+# Unsummarized turns may overshoot the budget by this factor before a question waits for the summary
+BACKLOG_FACTOR = 2
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (~4 characters per token).
+    Asking Gemini to count tokens would cost a network round trip per turn,
+    which is exactly what this memory is meant to avoid.
+    """
+    return (len(text) + 3) // 4
+
+class BackgroundSummaryMemory(BaseChatMemory, SummarizerMixin):
+    """
+    Conversation memory that keeps the recent turns verbatim within a token budget
+    and folds older turns into a running summary in a background thread.
+    - 'save_context' only appends the turn (no LLM call on the critical path).
+    - When the recent window exceeds 'max_token_limit', its oldest turns move to a
+      backlog that a worker thread summarizes with the same progressive prompt
+      as 'ConversationSummaryMemory'.
+    - 'load_memory_variables' returns summary + backlog + recent turns, and only
+      waits for the worker if the backlog has grown past 'BACKLOG_FACTOR' budgets.
+    - 'snapshot' / 'restore' persist the summary and turns as they are (see session_store.py);
+      'on_summary' is called after each background summary, e.g., to save a new snapshot.
+    """
+
+    memory_key: str = "chat_history"
+    max_token_limit: int = RECENT_TOKEN_LIMIT
+    moving_summary_buffer: str = ""
+    on_summary: Any = None
+
+    _pending: list = PrivateAttr(default_factory=list)  # Turns evicted from the window, not yet summarized
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _worker: Any = PrivateAttr(default=None)
+    _summaries: int = PrivateAttr(default=0)
+    _failures: int = PrivateAttr(default=0)
+    _generation: int = PrivateAttr(default=0)  # Bumped by 'clear()' so a late summary is discarded
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+
+    def _tokens(self, messages):
+        return sum(estimate_tokens(str(m.content)) for m in messages)
+
+    # --- Read path (runs before every question) ---
+
+    def load_memory_variables(self, inputs):
+        with self._lock:
+            worker = self._worker
+            backlog = self._tokens(self._pending)
+
+        # Only block when the unsummarized backlog is too large to send verbatim
+        if worker is not None and backlog > self.max_token_limit * BACKLOG_FACTOR:
+            logger.info("Waiting for conversation summary (backlog of ~%d tokens)", backlog)
+            worker.join(LLM_REQUEST_TIMEOUT)
+
+        with self._lock:
+            messages = list(self._pending) + list(self.chat_memory.messages)
+            summary = self.moving_summary_buffer
+
+        if summary:
+            messages = [self.summary_message_cls(content=summary)] + messages
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)}
+
+    # --- Write path (runs after every answer) ---
+
+    def save_context(self, inputs, outputs):
+        """
+        Appends the turn and, if the recent window is over budget, hands its
+        oldest turns to the background summarizer. Never calls the LLM itself.
+        """
+        super().save_context(inputs, outputs)
+
+        with self._lock:
+            messages = list(self.chat_memory.messages)
+            evicted = []
+            # Evict whole turns (Human + AI) but always keep the latest one verbatim
+            while len(messages) > 2 and self._tokens(messages) > self.max_token_limit:
+                evicted += messages[:2]
+                messages = messages[2:]
+            if not evicted:
+                return
+            self.chat_memory.clear()
+            self.chat_memory.add_messages(messages)
+            self._pending += evicted
+            self._start_worker()
+
+    def _start_worker(self):
+        """
+        Starts the summarizer thread unless one is already running (caller holds the lock).
+        """
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._worker = threading.Thread(target=self._summarize_backlog, name="insightsql-memory", daemon=True)
+        self._worker.start()
+
+    def _summarize_backlog(self):
+        """
+        Folds the backlog into the running summary until it is empty.
+        On failure (e.g., a 429) the backlog is kept verbatim and retried on the next eviction.
+        """
+        failed = False
+        while True:
+            with self._lock:
+                batch = list(self._pending)
+                summary = self.moving_summary_buffer
+                generation = self._generation
+            if not batch:
+                break
+
+            try:
+                new_summary = self.predict_new_summary(batch, summary)
+            except Exception as e:
+                failed = True
+                with self._lock:
+                    self._failures += 1
+                logger.warning("Conversation summary failed, keeping %d messages verbatim: %s", len(batch), e)
+                break
+
+            with self._lock:
+                if generation != self._generation:
+                    break  # The memory was cleared meanwhile
+                # Turns evicted while the LLM was working stay in the backlog for the next pass
+                self._pending = self._pending[len(batch):]
+                self.moving_summary_buffer = new_summary
+                self._summaries += 1
+
+        with self._lock:
+            self._worker = None
+            # A batch evicted between the last check and now still needs a worker
+            if self._pending and not failed:
+                self._start_worker()
+
+        if self.on_summary is not None:
+            try:
+                self.on_summary()
+            except Exception:
+                logger.exception("Conversation summary listener failed")
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the background summarizer is idle (useful for scripts and shutdown).
+        """
+        with self._lock:
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def snapshot(self):
+        """
+        Returns the summary, the backlog, and the recent turns as JSON-serializable data.
+        """
+        with self._lock:
+            return {
+                "summary": self.moving_summary_buffer,
+                "pending": messages_to_dict(self._pending),
+                "recent": messages_to_dict(self.chat_memory.messages),
+            }
+
+    def restore(self, snapshot):
+        """
+        Loads a 'snapshot' in place of the current memory. The summary is reused as is;
+        only a backlog that was not summarized yet is handed to the summarizer.
+        """
+        with self._lock:
+            self.moving_summary_buffer = snapshot.get("summary", "")
+            self._pending = messages_from_dict(snapshot.get("pending", []))
+            self.chat_memory.clear()
+            self.chat_memory.add_messages(messages_from_dict(snapshot.get("recent", [])))
+            self._generation += 1
+            if self._pending:
+                self._start_worker()
+
+    def stats(self):
+        """
+        Returns a snapshot of the window, backlog, and summarizer counters.
+        """
+        with self._lock:
+            return {
+                "recent_messages": len(self.chat_memory.messages),
+                "recent_tokens": self._tokens(self.chat_memory.messages),
+                "pending_messages": len(self._pending),
+                "summary_tokens": estimate_tokens(self.moving_summary_buffer),
+                "summaries": self._summaries,
+                "failures": self._failures,
+                "summarizing": self._worker is not None,
+            }
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._pending = []
+            self.moving_summary_buffer = ""
+            self._generation += 1
@@ -0,0 +1,257 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import streamlit as st
+from paths import CACHE_DIR
+from database import database_file_path
+
+logger = logging.getLogger("insightsql")
+
+# Where DuckDB mirrors (and their metadata sidecars) are written
+MIRROR_DIR = os.path.join(CACHE_DIR, "duckdb")
+
+# Seconds between two staleness checks of the mirror's source files
+MIRROR_CHECK_INTERVAL = 5.0
+
+# Rows copied per chunk when the mirror is built from SQLite without DuckDB's sqlite extension
+COPY_CHUNK_ROWS = 200_000
+
+_INSTALL_HINT = "The DuckDB backend needs the optional packages: pip install duckdb duckdb-engine"
+
+def _import_duckdb():
+    """
+    Imports the optional 'duckdb' package, with an actionable error if it is missing.
+    """
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError(_INSTALL_HINT) from e
+    return duckdb
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _table_name(path):
+    """
+    Table name for a Parquet file: its file name without extension, as a plain identifier.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r"\W+", "_", stem).strip("_") or "data"
+
+def is_parquet_source(source):
+    """
+    True if 'source' is a Parquet file, a glob of Parquet files, or a directory holding some.
+    """
+    return source.endswith(".parquet") or (os.path.isdir(source) and bool(glob.glob(os.path.join(source, "*.parquet"))))
+
+class DuckDBMirror:
+    """
+    A read-only DuckDB copy of a SQLite database or of Parquet files, for fast
+    columnar aggregation. The mirror is rebuilt into a temporary file and swapped
+    in atomically whenever the source files change, so readers never see a
+    half-built database. 'version' increases with every rebuild.
+    """
+
+    def __init__(self, source, mirror_dir=MIRROR_DIR):
+        self.source = source
+        self.sqlite_path = None if is_parquet_source(source) else database_file_path(source)
+        if not self.sqlite_path and not is_parquet_source(source):
+            raise ValueError(f"A DuckDB mirror needs a local SQLite URI or Parquet files, got {source!r}")
+
+        name = os.path.splitext(os.path.basename(self.sqlite_path or source.rstrip("/*")))[0] or "mirror"
+        # Sources sharing a file name (a/data.db, b/data.db) get their own mirror
+        source_key = hashlib.sha1(os.path.abspath(self.sqlite_path or source).encode("utf-8")).hexdigest()[:10]
+        self.path = os.path.join(mirror_dir, f"{_table_name(name)}-{source_key}.duckdb")
+        self.uri = f"duckdb:///{os.path.abspath(self.path)}"
+        self.version = 0
+        self.build_ms = None
+        self._last_check = 0.0
+        self._building = None
+        self._lock = threading.Lock()
+
+    # --- Source tracking ---
+
+    def source_files(self):
+        """
+        The files whose changes make the mirror stale.
+        """
+        if self.sqlite_path:
+            return [self.sqlite_path, self.sqlite_path + "-wal"]
+        if os.path.isdir(self.source):
+            return sorted(glob.glob(os.path.join(self.source, "*.parquet")))
+        return sorted(glob.glob(self.source))
+
+    def source_fingerprint(self):
+        """
+        (path, mtime, size) of every source file; changes whenever the source does.
+        """
+        fingerprint = []
+        for path in self.source_files():
+            try:
+                stat = os.stat(path)
+                fingerprint.append([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+            except OSError:
+                continue  # No WAL file, or a Parquet file deleted meanwhile
+        return fingerprint
+
+    def _meta_path(self):
+        return self.path + ".json"
+
+    def is_stale(self):
+        """
+        True if the mirror is missing or was built from a different version of the source.
+        """
+        try:
+            with open(self._meta_path(), encoding="utf-8") as f:
+                built_from = json.load(f)["fingerprint"]
+        except (OSError, ValueError, KeyError):
+            return True
+        return not os.path.exists(self.path) or built_from != self.source_fingerprint()
+
+    # --- Building ---
+
+    def _copy_sqlite(self, con, duckdb):
+        """
+        Copies every SQLite table. Uses DuckDB's sqlite extension when it can be loaded,
+        otherwise streams the rows through pandas in COPY_CHUNK_ROWS chunks.
+        """
+        try:
+            # Only loads an already installed extension: building a mirror never downloads anything
+            con.execute("LOAD sqlite")
+            con.execute(f"ATTACH '{self.sqlite_path.replace(chr(39), chr(39) * 2)}' AS source (TYPE SQLITE, READ_ONLY)")
+        except duckdb.Error:
+            logger.info("DuckDB sqlite extension unavailable: copying the mirror through pandas")
+        else:
+            tables = [row[0] for row in con.execute(
+                "SELECT table_name FROM duckdb_tables() WHERE database_name = 'source'"
+            ).fetchall()]
+            for table in tables:
+                con.execute(f"CREATE TABLE {_quote(table)} AS SELECT * FROM source.{_quote(table)}")
+            con.execute("DETACH source")
+            return tables
+
+        import pandas as pd
+        source = sqlite3.connect(f"file:{self.sqlite_path}?mode=ro", uri=True)
+        try:
+            tables = [row[0] for row in source.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            ).fetchall()]
+            for table in tables:
+                created = False
+                for chunk in pd.read_sql_query(f"SELECT * FROM {_quote(table)}", source, chunksize=COPY_CHUNK_ROWS):
+                    con.register("chunk", chunk)
+                    con.execute(f"INSERT INTO {_quote(table)} SELECT * FROM chunk" if created
+                                else f"CREATE TABLE {_quote(table)} AS SELECT * FROM chunk")
+                    con.unregister("chunk")
+                    created = True
+        finally:
+            source.close()
+        return tables
+
+    def _copy_parquet(self, con):
+        tables = []
+        for path in self.source_files():
+            table = _table_name(path)
+            con.execute(f"CREATE TABLE {_quote(table)} AS SELECT * FROM read_parquet('{path.replace(chr(39), chr(39) * 2)}')")
+            tables.append(table)
+        return tables
+
+    def build(self):
+        """
+        Builds the mirror from the current source and swaps it in. Returns the table names.
+        """
+        duckdb = _import_duckdb()
+        started = time.perf_counter()
+        fingerprint = self.source_fingerprint()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        con = duckdb.connect(tmp_path)
+        try:
+            tables = self._copy_sqlite(con, duckdb) if self.sqlite_path else self._copy_parquet(con)
+            con.execute("CHECKPOINT")
+        finally:
+            con.close()
+
+        # Readers opening the mirror from now on get the new file; open connections keep the old one
+        os.replace(tmp_path, self.path)
+        with open(self._meta_path() + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"source": self.source, "fingerprint": fingerprint, "tables": tables}, f)
+        os.replace(self._meta_path() + ".tmp", self._meta_path())
+
+        self.build_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.version += 1
+        logger.info("DuckDB mirror of %s built in %.0f ms (%d tables)", self.source, self.build_ms, len(tables))
+        return tables
+
+    def ensure(self):
+        """
+        Builds the mirror if it is missing or stale, and returns its URI (blocking).
+        """
+        with self._lock:
+            if self.is_stale():
+                self.build()
+            self._last_check = time.monotonic()
+        return self.uri
+
+    def refresh_in_background(self):
+        """
+        At most every MIRROR_CHECK_INTERVAL seconds, checks the source files and starts
+        a background rebuild if they changed. Queries keep using the current mirror
+        meanwhile; compare 'version' to find out when the new one is in place.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_check < MIRROR_CHECK_INTERVAL or (self._building and self._building.is_alive()):
+                return
+            self._last_check = now
+            if not self.is_stale():
+                return
+            self._building = threading.Thread(target=self._rebuild, name="insightsql-duckdb-mirror", daemon=True)
+            self._building.start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Rebuilding the DuckDB mirror of %s failed; still serving the previous one", self.source)
+
+    def stats(self):
+        return {
+            "source": self.source,
+            "path": self.path,
+            "version": self.version,
+            "build_ms": self.build_ms,
+            "rebuilding": bool(self._building and self._building.is_alive()),
+        }
+
+@st.cache_resource(show_spinner=False)
+def get_duckdb_mirror(source):
+    """
+    Returns the process-wide mirror of 'source' (a SQLite URI or Parquet path/glob),
+    built or refreshed on first use.
+    """
+    mirror = DuckDBMirror(source)
+    mirror.ensure()
+    return mirror
+
+def resolve_backend(uri, backend):
+    """
+    Returns (uri_to_query, mirror) for a configured database and backend: with the
+    "duckdb" backend a SQLite URI or Parquet path is served from its mirror, otherwise
+    'uri' is queried as is (mirror None).
+    """
+    if backend == "duckdb" and not uri.startswith("duckdb:"):
+        mirror = get_duckdb_mirror(uri)
+        return mirror.uri, mirror
+    if backend not in ("sqlite", "duckdb"):
+        raise ValueError(f"Unknown backend {backend!r} (expected 'sqlite' or 'duckdb')")
+    return uri, None
@@ -0,0 +1,515 @@
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import streamlit as st
+from langchain.agents import AgentExecutor, create_react_agent, create_tool_calling_agent
+from langchain_core.callbacks import BaseCallbackHandler
+from agent import (
+    AGENT_MODES, DEFAULT_AGENT_MODE, get_llm, get_agent_brain, get_tool_calling_agent,
+    load_react_prompt, load_tool_calling_prompt
+)
+from database import DB_URI, DB_BACKEND, get_database, get_pool_stats, loaded_file_identity, reload_if_replaced
+from profiler import get_schema_digest
+from sql_tools import InsightSQLToolkit
+from query_cache import get_query_cache
+from query_log import get_query_log
+from session_store import OFFLINE_STORE_PATH, SessionStore, get_session_store
+from question_index import ExampleRecorder, Retrieval, get_question_index, schema_fingerprint
+from duckdb_mirror import resolve_backend
+from conversation_memory import BackgroundSummaryMemory
+from cancellation import (
+    MAX_ITERATIONS, MAX_EXECUTION_TIME, RunControl, RunCancelled,
+    CancellationCallbackHandler, activate
+)
+from tracing import TraceCallbackHandler
+from answer_stream import FINAL_ANSWER_MARKER, FinalAnswerStreamHandler
+from tool_calling import ParallelToolExecutor, action_thought, lend_thread_context, tool_input_text
+from rate_limiter import GEMINI_RPM, is_rate_limit_error
+
+# Questions executed at the same time by one engine (one thread each)
+DEFAULT_WORKERS = 8
+
+# Questions allowed to wait for a worker; past this, new questions are rejected (HTTP 503)
+MAX_QUEUED = 32
+
+# Idle sessions are dropped after this many seconds, and at most this many are kept
+SESSION_TTL = 60 * 60
+MAX_SESSIONS = 1000
+
+# Tool outputs are clipped to this many characters in streamed events
+MAX_EVENT_CHARS = 2000
+
+class SessionNotFound(Exception):
+    """
+    Raised when a session id is unknown (never created, closed, or expired).
+    """
+
+class SessionBusy(Exception):
+    """
+    Raised when a session is asked a question while its previous one is still running.
+    """
+
+class EngineBusy(Exception):
+    """
+    Raised when every worker is busy and the wait queue is full.
+    """
+
+class RunEventHandler(BaseCallbackHandler):
+    """
+    Turns agent callbacks into the run's event stream:
+    'step' (tool call), 'observation' (tool output), 'token' (new Final Answer text),
+    and 'answer_reset' (a step that looked like an answer became a tool call).
+    Must be registered AFTER the run's FinalAnswerStreamHandler.
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self._sent = ""
+
+    def on_agent_action(self, action, **kwargs):
+        if self._sent:
+            self._sent = ""
+            self.run.emit("answer_reset")
+        self.run.emit("step", tool=action.tool, tool_input=tool_input_text(action.tool_input), thought=action_thought(action))
+
+    def on_tool_end(self, output, **kwargs):
+        self.run.emit("observation", output=str(output)[:MAX_EVENT_CHARS])
+
+    def on_llm_new_token(self, token, **kwargs):
+        text = self.run.answer_stream.text
+        if text.startswith(self._sent) and len(text) > len(self._sent):
+            self.run.emit("token", text=text[len(self._sent):])
+            self._sent = text
+
+class QuestionRun:
+    """
+    One question being answered: its cancellation token, trace, streamed answer,
+    and an event log that any number of listeners (UI poller, SSE stream) can follow.
+    Status goes 'queued' -> 'running' -> 'ok' | 'cancelled' | 'error'.
+    """
+
+    def __init__(self, session, question, language):
+        self.id = uuid.uuid4().hex
+        self.session = session
+        self.question = question
+        self.language = language
+        self.control = RunControl()
+        self.trace = TraceCallbackHandler(question=question)
+        # A function-calling answer is the model's plain text: there is no "Final Answer:" marker to wait for
+        self.answer_stream = FinalAnswerStreamHandler(marker=None if session.agent_mode == "tools" else FINAL_ANSWER_MARKER)
+        self.status = "queued"
+        self.output = None
+        self.error = None
+        self.future = None
+        self._events = []
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def sql(self):
+        """
+        The statements the agent ran through 'sql_db_query' so far, in order.
+        """
+        with self._lock:
+            return [e["tool_input"] for e in self._events if e["event"] == "step" and e["tool"] == "sql_db_query"]
+
+    @property
+    def answer_text(self):
+        """
+        The final answer, or the part of it generated so far.
+        """
+        return self.output if self.output is not None else self.answer_stream.text
+
+    def emit(self, event, **data):
+        """
+        Records an event and hands it to every listener (called from the worker thread).
+        """
+        payload = {"event": event, "run_id": self.id, **data}
+        with self._lock:
+            self._events.append(payload)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(payload)
+
+    def subscribe(self, listener):
+        """
+        Calls 'listener(event)' for every past and future event of this run.
+        """
+        with self._lock:
+            history = list(self._events)
+            self._listeners.append(listener)
+        for payload in history:
+            listener(payload)
+
+    async def events(self):
+        """
+        Async iterator over the run's events, ending with the 'done' event.
+        Safe to use from any event loop: events cross threads via 'call_soon_threadsafe'.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        self.subscribe(lambda payload: loop.call_soon_threadsafe(queue.put_nowait, payload))
+        while True:
+            payload = await queue.get()
+            yield payload
+            if payload["event"] == "done":
+                return
+
+    def cancel(self, reason="cancelled by client"):
+        self.control.cancel(reason)
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def wait(self, timeout=None):
+        """
+        Waits up to 'timeout' seconds; returns True once the run has finished.
+        """
+        try:
+            self.future.exception(timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def result(self):
+        """
+        Returns the AgentExecutor response, re-raising the run's exception if it failed.
+        """
+        return self.future.result()
+
+class EngineSession:
+    """
+    One conversation: its own memory and executor on top of the engine's shared
+    model, tools, and database. Answers one question at a time, with the ReAct
+    agent ("react") or the function-calling agent ("tools").
+    Its settings, messages, and memory are kept in the engine's session store.
+    """
+
+    def __init__(self, engine, language="English", agent_mode=DEFAULT_AGENT_MODE, session_id=None):
+        self.id = session_id or uuid.uuid4().hex
+        self.engine = engine
+        self.language = language
+        self.memory = BackgroundSummaryMemory(
+            memory_key="chat_history",
+            # Only the user's question belongs in the conversation history
+            input_key="input",
+            llm=engine.llm,
+            return_messages=False,
+            # Summaries finish after the answer: store the memory again once they do
+            on_summary=self.save_memory
+        )
+        self.set_agent_mode(agent_mode)
+        self.created = self.last_used = time.time()
+        self.current_run = None
+        self.last_trace = None
+        self.lock = threading.Lock()
+
+    @property
+    def busy(self):
+        run = self.current_run
+        return run is not None and not run.done()
+
+    def set_agent_mode(self, agent_mode):
+        """
+        Switches the agent answering this conversation's next questions; the memory is kept.
+        """
+        if agent_mode not in AGENT_MODES:
+            raise ValueError(f"Unknown agent mode {agent_mode!r} (expected one of {', '.join(AGENT_MODES)})")
+        executor_class = ParallelToolExecutor if agent_mode == "tools" else AgentExecutor
+        self.executor = executor_class(
+            agent=self.engine.get_agent(agent_mode),
+            tools=self.engine.tools,
+            memory=self.memory,
+            handle_parsing_errors=True,
+            max_iterations=MAX_ITERATIONS,
+            max_execution_time=MAX_EXECUTION_TIME,
+            early_stopping_method="force",
+        )
+        self.agent_mode = agent_mode
+        self.engine.session_store.save_session(self.id, self.engine.source_uri, self.language, agent_mode)
+
+    def save_memory(self):
+        """
+        Stores a snapshot of the memory, so the conversation can resume after a restart.
+        """
+        self.engine.session_store.save_memory(self.id, self.memory.snapshot())
+
+class InsightEngine:
+    """
+    The InsightSQL agent as an importable service, independent of Streamlit's rerun model.
+    Shared by every session: the LLM client (rate limited per key), the pooled read-only
+    database, the schema digest, the question index, the tools, and the agent graph. Per session: memory
+    and executor. Questions run on a bounded thread pool with a bounded wait queue.
+    Pass 'llm' to use another chat model (e.g., the scripted model for offline runs).
+    With backend="duckdb", 'db_uri' (SQLite or Parquet) is queried through a DuckDB
+    mirror that is rebuilt in the background when the source changes.
+    Sessions are persisted in 'session_store' (the shared SQLite store by default): one that
+    is no longer in memory (expired, or the process restarted) is resumed from it.
+    persist=False keeps offline runs (e.g., a scripted model replaying transcripts) out of
+    the shared on-disk state: no question index or query log, and a separate session store.
+    """
+
+    def __init__(self, google_api_key=None, db_uri=DB_URI, llm=None, max_workers=DEFAULT_WORKERS,
+                 max_queued=MAX_QUEUED, requests_per_minute=GEMINI_RPM, backend=DB_BACKEND, session_store=None, persist=True):
+        self.source_uri = db_uri
+        self.persist = persist
+        if session_store is None:
+            session_store = get_session_store() if persist else SessionStore(OFFLINE_STORE_PATH)
+        self.session_store = session_store
+        self.db_uri, self.mirror = resolve_backend(db_uri, backend)
+        self.db = get_database(self.db_uri)
+        self._db_identity = loaded_file_identity(self.db)
+        self._sync_lock = threading.Lock()
+        self.schema_digest = get_schema_digest(self.db, self.db_uri)
+        self.query_cache = get_query_cache()
+        self.query_log = get_query_log() if persist else None
+        self.question_index = self._load_question_index()
+
+        # Same construction as before the split: cached client and agent graphs per key
+        self.google_api_key = google_api_key
+        self.requests_per_minute = requests_per_minute
+        self.llm = get_llm(google_api_key, requests_per_minute) if llm is None else llm
+        self._custom_llm = llm is not None
+        self.tools = InsightSQLToolkit(db=self.db, llm=self.llm, query_cache=self.query_cache, query_log=self.query_log).get_tools()
+        self._agents = {}
+        self._agents_lock = threading.Lock()
+        # Build the default agent now, so a bad configuration fails on connect rather than on the first question
+        self.get_agent(DEFAULT_AGENT_MODE)
+        # Repeat questions run their stored SQL through the same guarded, cached query tool
+        self.query_tool = next(tool for tool in self.tools if tool.name == "sql_db_query")
+
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="insightsql-engine")
+        self._sessions = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def get_agent(self, agent_mode):
+        """
+        Returns the shared agent graph of a mode ("react" or "tools"), built on first use.
+        """
+        with self._agents_lock:
+            if agent_mode not in self._agents:
+                if agent_mode == "tools":
+                    self._agents[agent_mode] = (
+                        create_tool_calling_agent(llm=self.llm, tools=self.tools, prompt=load_tool_calling_prompt())
+                        if self._custom_llm else get_tool_calling_agent(self.google_api_key, self.tools, self.requests_per_minute)
+                    )
+                else:
+                    self._agents[agent_mode] = (
+                        create_react_agent(llm=self.llm, tools=self.tools, prompt=load_react_prompt())
+                        if self._custom_llm else get_agent_brain(self.google_api_key, self.tools, self.requests_per_minute)
+                    )
+            return self._agents[agent_mode]
+
+    # --- Sessions ---
+
+    def create_session(self, language="English", agent_mode=DEFAULT_AGENT_MODE):
+        """
+        Opens a new conversation and returns it.
+        """
+        session = EngineSession(self, language, agent_mode)
+        with self._lock:
+            self._prune_sessions()
+            self._sessions[session.id] = session
+        return session
+
+    def get_session(self, session_id):
+        """
+        Returns a conversation, resuming it from the session store if needed.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            session = self._resume_session(session_id)
+        return session
+
+    def _resume_session(self, session_id):
+        """
+        Rebuilds a stored conversation of this engine's database: its settings and memory
+        come back as they were saved, so no summary is recomputed.
+        """
+        stored = self.session_store.get_session(session_id)
+        if stored is None or stored["db_uri"] != self.source_uri:
+            raise SessionNotFound(session_id)
+        agent_mode = stored["agent_mode"] if stored["agent_mode"] in AGENT_MODES else DEFAULT_AGENT_MODE
+        session = EngineSession(self, stored["language"], agent_mode, session_id=session_id)
+        snapshot = self.session_store.load_memory(session_id)
+        if snapshot is not None:
+            session.memory.restore(snapshot)
+        with self._lock:
+            self._prune_sessions()
+            # Another thread may have resumed it meanwhile
+            return self._sessions.setdefault(session_id, session)
+
+    def close_session(self, session_id):
+        """
+        Drops a conversation and deletes it from the session store (its running question, if any, is cancelled).
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None and session.busy:
+            session.current_run.cancel("session closed")
+        self.session_store.delete_session(session_id)
+
+    def _prune_sessions(self):
+        """
+        Drops expired idle sessions, then the oldest idle ones past MAX_SESSIONS (caller holds the lock).
+        They stay in the session store and are resumed on their next question.
+        """
+        now = time.time()
+        for session_id, session in list(self._sessions.items()):
+            if not session.busy and now - session.last_used > SESSION_TTL:
+                del self._sessions[session_id]
+        idle = sorted((s for s in self._sessions.values() if not s.busy), key=lambda s: s.last_used)
+        for session in idle[:max(0, len(self._sessions) - MAX_SESSIONS + 1)]:
+            del self._sessions[session.id]
+
+    # --- Backend ---
+
+    def _sync_database(self):
+        """
+        Starts a background rebuild of the DuckDB mirror when its source changed, and switches
+        the shared database, digest, and question index over once the file behind the database
+        was replaced: a new mirror swapped in, or a database re-imported under the same name.
+        """
+        if self.mirror is not None:
+            self.mirror.refresh_in_background()
+        # The database may be shared with other engines: whichever notices first reloads it
+        reload_if_replaced(self.db)
+        with self._sync_lock:
+            identity = loaded_file_identity(self.db)
+            if identity == self._db_identity:
+                return
+            self._db_identity = identity
+            self.schema_digest = get_schema_digest(self.db, self.db_uri)
+            self.question_index = self._load_question_index()
+
+    def _load_question_index(self):
+        if not self.persist:
+            return None
+        return get_question_index(str(self.db._engine.url), schema_fingerprint(self.db))
+
+    # --- Questions ---
+
+    def submit(self, session_id, question, language=None, callbacks=(), thread_context=None):
+        """
+        Queues a question for a session and returns its QuestionRun immediately.
+        'callbacks' are extra LangChain handlers for this run (e.g., a UI renderer);
+        'thread_context' is an optional context-manager factory entered in the worker
+        thread around the run (e.g., to attach a UI framework's thread context).
+        Raises SessionNotFound, SessionBusy, or EngineBusy.
+        """
+        session = self.get_session(session_id)
+        with session.lock:
+            if session.busy:
+                raise SessionBusy(session_id)
+            with self._lock:
+                if self._in_flight >= self.max_workers + self.max_queued:
+                    raise EngineBusy(f"{self._in_flight} questions in flight")
+                self._in_flight += 1
+
+            run = QuestionRun(session, question, language or session.language)
+            session.current_run = run
+            session.last_used = time.time()
+            run.future = self._pool.submit(self._execute, run, list(callbacks), thread_context)
+        return run
+
+    def _execute(self, run, callbacks, thread_context):
+        """
+        Runs one question in a worker thread and publishes its events.
+        """
+        session = run.session
+        run.status = "running"
+        run.emit("start", question=run.question, language=run.language)
+        try:
+            self.session_store.append_message(session.id, "human", run.question)
+            with activate(run.control), (thread_context() if thread_context else nullcontext()):
+                # The question may have been cancelled while it waited for a worker;
+                # otherwise its time budget starts now, not when it was queued.
+                run.control.check()
+                run.control.restart_clock()
+                self._sync_database()
+                # Past answers to similar questions become few-shot examples; a repeat question's SQL runs right away
+                retrieval = self.question_index.retrieve(run.question, self.query_tool.run) if self.question_index is not None else Retrieval()
+                run.emit("retrieval", **retrieval.summary())
+                recorder = ExampleRecorder()
+                # Parallel tool calls run in their own threads: lend them the caller's thread context too
+                with lend_thread_context(thread_context):
+                    response = session.executor.invoke(
+                        {
+                            "input": run.question,
+                            "chosen_language": run.language,
+                            "schema_digest": self.schema_digest,
+                            "retrieved_examples": retrieval.prompt_text,
+                        },
+                        {"callbacks": [run.trace, run.answer_stream, RunEventHandler(run), CancellationCallbackHandler(run.control), recorder, *callbacks]}
+                    )
+            run.output = response.get("output", "")
+            run.status = "ok"
+            if self.question_index is not None:
+                recorder.record(self.question_index, run.question, run.output, retrieval)
+            # A reused query usually runs again as a step: keep each statement once
+            sql = ([retrieval.direct_hit["sql"]] if retrieval.direct_hit is not None else []) + run.sql
+            self.session_store.append_message(session.id, "ai", run.output, sql=list(dict.fromkeys(sql)))
+            session.save_memory()
+            run.emit("answer", text=run.output)
+            return response
+        except RunCancelled as e:
+            run.status, run.error = "cancelled", str(e)
+            run.emit("cancelled", reason=str(e))
+            raise
+        except BaseException as e:
+            run.status, run.error = "error", str(e)
+            run.emit("error", message=str(e)[:MAX_EVENT_CHARS], rate_limited=is_rate_limit_error(e))
+            raise
+        finally:
+            session.last_trace = run.trace.summary()
+            session.last_used = time.time()
+            with self._lock:
+                self._in_flight -= 1
+            run.emit("done", status=run.status, trace=session.last_trace)
+
+    # --- Health ---
+
+    def stats(self):
+        """
+        Returns a snapshot of sessions, workers, the backend, the connection pool, the query cache and log, and the question index.
+        """
+        with self._lock:
+            sessions = len(self._sessions)
+            in_flight = self._in_flight
+        return {
+            "sessions": sessions,
+            "stored_sessions": self.session_store.stats(),
+            "workers": self.max_workers,
+            "backend": {"dialect": self.db.dialect, "mirror": self.mirror.stats() if self.mirror else None},
+            "running": min(in_flight, self.max_workers),
+            "queued": max(0, in_flight - self.max_workers),
+            "pool": get_pool_stats(self.db),
+            "query_cache": self.query_cache.stats(),
+            "query_log": self.query_log.stats() if self.query_log is not None else None,
+            "question_index": self.question_index.stats() if self.question_index is not None else None,
+        }
+
+    def shutdown(self):
+        """
+        Cancels every running question and stops the worker pool.
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            if session.busy:
+                session.current_run.cancel("engine shutting down")
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+@st.cache_resource(show_spinner=False)
+def get_engine(google_api_key, db_uri=DB_URI, backend=DB_BACKEND):
+    """
+    Returns the engine shared by every Streamlit session using the same API key.
+    """
+    return InsightEngine(google_api_key=google_api_key, db_uri=db_uri, backend=backend)
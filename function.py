@@ -1,41 +1,93 @@
+import threading
+from contextlib import contextmanager
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+# Import the agent modes selectable in the sidebar
+from agent_modes import AGENT_MODES, DEFAULT_AGENT_MODE
+# Import the persistent conversation store (messages, memory) and its history page size
+from session_store import PAGE_SIZE, get_session_store
+# Import the default database and the catalog of imported ones
+from database import DB_URI, list_databases
 
 def init_state():
     """
     Initializes the Session State variables if they do not exist.
     This ensures the app has a stable memory structure across re-runs.
     """
-    # Initialize the chat history list
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-    
+    # Initialize how many chat messages are rendered (the history itself lives in the session store)
+    if "history_limit" not in st.session_state:
+        st.session_state.history_limit = PAGE_SIZE
+
     # Initialize the LLM object placeholder
     if "llm" not in st.session_state:
         st.session_state.llm = None
     
-    # Initialize the Database Toolkit placeholder
-    if "toolkit" not in st.session_state:
-        st.session_state.toolkit = None
+    # Initialize the shared Engine placeholder (set on connect)
+    if "engine" not in st.session_state:
+        st.session_state.engine = None
+
+    # Initialize this browser session's conversation id inside the engine
+    # (the conversation memory lives there, and is persisted in the session store).
+    # A conversation named in the URL ('?session=...') is resumed after a reload or a restart.
+    if "engine_session" not in st.session_state:
+        st.session_state.engine_session = None
+        stored = get_session_store().get_session(st.query_params.get("session", ""))
+        if stored is not None:
+            st.session_state.engine_session = stored["id"]
+            if stored["agent_mode"] in AGENT_MODES:
+                st.session_state.agent_mode = stored["agent_mode"]
+            st.session_state.db_uri = stored["db_uri"]
+
+    # Initialize the timing breakdown of the last answered question
+    if "last_trace" not in st.session_state:
+        st.session_state.last_trace = None
+
+    # Initialize the question being answered (kept across reruns a widget triggers mid-answer)
+    if "active_run" not in st.session_state:
+        st.session_state.active_run = None
+
+    # Initialize the agent mode (ReAct text steps, or native function calling with parallel tools)
+    if "agent_mode" not in st.session_state:
+        st.session_state.agent_mode = DEFAULT_AGENT_MODE
 
-    if "agent_memory" not in st.session_state:
-        st.session_state.agent_memory = None
+    # Initialize the selected database (the default one, or any imported database)
+    if "db_uri" not in st.session_state or st.session_state.db_uri not in list_databases():
+        st.session_state.db_uri = DB_URI
+
+def _close_engine_session():
+    """
+    Closes this browser session's conversation (wiping its memory) and deletes it from
+    the session store, even if it was only resumed from the URL and not connected yet.
+    """
+    session_id = st.session_state.get("engine_session")
+    if session_id:
+        if st.session_state.get("engine") is not None:
+            st.session_state.engine.close_session(session_id)
+        else:
+            get_session_store().delete_session(session_id)
+    st.session_state.engine = None
+    st.session_state.engine_session = None
+    st.session_state.history_limit = PAGE_SIZE
+    # Closing the conversation cancelled its running question: nothing to pick up after the rerun
+    st.session_state.active_run = None
+    st.query_params.pop("session", None)
 
 def change_on_api_key():
     """
     Triggered when the user modifies the API Key.
     Performs a 'Hard Reset' to ensure the new key is used for future connections.
     """
-    # 1. Clear chat history to avoid context mismatch
-    st.session_state.messages = []
-    
-    # 2. Reset the LLM and Toolkit to force re-initialization
+    # 1. Reset the LLM to force re-initialization
     st.session_state.llm = None
-    st.session_state.toolkit = None
-    st.session_state.agent_memory = None
-    
-    # 3. Completely remove the Agent Executor from memory
-    # Using .pop() ensures the key is deleted, forcing the app to rebuild the agent
-    st.session_state.pop("agent_executor", None)
+
+    # 2. Close the connected conversation (the engine for the new key is fetched on the next connect).
+    # A conversation resumed from the URL but not connected yet is kept: entering the key
+    # is the first step of resuming it.
+    if st.session_state.engine is not None:
+        _close_engine_session()
+
+    # 3. Clear the timing breakdown of the previous key's last question
+    st.session_state.last_trace = None
     
     # Notify the user that the system has been reset
     st.toast("API Key updated! System reset.", icon="🔄")
@@ -47,16 +99,11 @@ def reset_state():
     and kills the Database Connection. 
     Use this to start completely fresh (Tabula Rasa).
     """
-    # 1. Clear chat history (UI)
-    st.session_state.messages = []
-    
-    # 2. Reset the LLM, Toolkit, and Brain to force re-initialization
+    # 1. Reset the LLM and close the conversation to force re-initialization.
+    # This deletes its history (UI) and memory from the session store.
     st.session_state.llm = None
-    st.session_state.toolkit = None
-    st.session_state.agent_memory = None 
-    
-    # 3. Kill the Executor
-    st.session_state.pop("agent_executor", None)
+    _close_engine_session()
+    st.session_state.last_trace = None
     
     # Notify the user
     st.toast("System fully reset. Memory wiped!", icon="🔄")
@@ -68,26 +115,156 @@ def reset_chat_display():
     CRITICAL: The Agent's memory is PRESERVED, so the AI still remembers 
     what you discussed previously.
     """
-    # 1. Clear the message history list (Visual/UI only)
-    st.session_state.messages = []
-    
-    # NOTE: We intentionally DO NOT touch 'agent_memory' here.
+    # 1. Hide the messages so far (Visual/UI only). The store keeps them, append-only.
+    if st.session_state.engine_session:
+        get_session_store().clear_display(st.session_state.engine_session)
+    st.session_state.history_limit = PAGE_SIZE
+
+    # NOTE: We intentionally DO NOT close the engine session here (it holds the memory).
     # This keeps the context alive.
     
     # Notify the user
     st.toast("Screen cleared! Memory retained.", icon="🧹")
 
+def change_on_database():
+    """
+    Triggered when the user selects another database in the sidebar.
+    The conversation is about the previous data, so it is closed; the next
+    'Connect' opens the shared engine of the selected database.
+    """
+    _close_engine_session()
+    st.session_state.last_trace = None
+
+    st.toast("Database changed! Click 'Connect to Database' to load it.", icon="🗄️")
+
+def ingest_uploads():
+    """
+    Triggered by the 'Import' button: loads the uploaded CSV / Parquet files into a
+    new typed, indexed SQLite database, registers it, and selects it.
+    """
+    # Imported lazily: pandas / pyarrow are only needed when importing data
+    from ingest import ingest
+
+    uploads = st.session_state.get("uploads") or []
+    if not uploads:
+        st.toast("Choose at least one CSV or Parquet file first.", icon="📥")
+        return
+
+    try:
+        report = ingest(uploads, name=st.session_state.get("upload_name") or None)
+    except Exception as e:
+        st.session_state.ingest_error = f"{type(e).__name__}: {e}"
+        return
+    st.session_state.ingest_error = None
+
+    st.session_state.db_uri = report["uri"]
+    change_on_database()
+    rows = sum(info["rows"] for info in report["tables"].values())
+    st.toast(f"Imported {rows:,} rows into {len(report['tables'])} table(s) in {report['seconds']}s.", icon="✅")
+
 def change_on_lan():
     """
     Triggered when the user modifies the 'Language' selection in the sidebar.
-    This performs a specific reset to ensure the new language preference is 
-    injected into the Agent's system prompt.
+    The language is passed to the Agent as a prompt variable ('chosen_language')
+    on every invoke, so NOTHING needs to be rebuilt here.
     """
-    # 1. Destroy the current Agent Executor
-    # We must remove it from the session state so that the app detects it's missing
-    # and rebuilds it with the new 'chosen_language' variable in the prompt.
-    st.session_state.pop("agent_executor", None)
-    
-    # 2. Notify the user of the update
-    # Provides visual feedback that the system is re-configuring its 'brain' for the new language.
-    st.toast("Language preference updated! Reconfiguring AI Agent...", icon="🌐")
\ No newline at end of file
+    # NOTE: We intentionally DO NOT touch the engine session here.
+    # The shared agent graph stays cached; the next question simply carries the new language.
+
+    # Notify the user of the update
+    st.toast("Language preference updated! Applied to your next question.", icon="🌐")
+
+def change_on_agent_mode():
+    """
+    Triggered when the user selects another agent mode in the sidebar.
+    The conversation switches executor in place: its memory is kept, and the
+    next question is answered in the new mode.
+    """
+    if st.session_state.get("engine") is not None and st.session_state.get("engine_session"):
+        # Imported here: the engine (LangChain, Gemini) is loaded once connected, not at first paint
+        from engine import SessionNotFound
+        try:
+            session = st.session_state.engine.get_session(st.session_state.engine_session)
+        except SessionNotFound:
+            session = None  # Expired: the next question opens a session in the new mode
+        if session is not None:
+            session.set_agent_mode(st.session_state.agent_mode)
+
+    st.toast(f"Agent mode: {AGENT_MODES[st.session_state.agent_mode]}. Applied to your next question.", icon="🔀")
+
+def load_earlier_messages():
+    """
+    Triggered by the 'Load earlier messages' button above the chat: renders one more page of history.
+    """
+    st.session_state.history_limit += PAGE_SIZE
+
+def stop_run():
+    """
+    Triggered by the 'Stop' button shown while the agent is working.
+    Cancels the in-flight question: the SQLite statement is interrupted and the
+    agent aborts at its next step, freeing the worker immediately.
+    """
+    # The click itself interrupts the running script; cancelling here also covers
+    # the case where the worker is still finishing its current step.
+    run_control = st.session_state.get("run_control")
+    if run_control is not None:
+        run_control.cancel("stopped by user")
+
+    # Notify the user
+    st.toast("Stopping the current question...", icon="⏹️")
+
+def follow_run(run, ui_handler=None):
+    """
+    Shows a question's progress while the engine answers it: the Final Answer as it
+    streams, a Stop button, and the elapsed time. Returns the slot for the final answer.
+    Every 'st' call is a point where Streamlit can interrupt the script: a click on "Stop"
+    cancels the run (see 'stop_run'); any other widget only reruns the script, and the run
+    keeps going in the engine ('active_run' is picked up again by the next script run).
+    """
+    st.session_state.run_control = run.control
+    st.session_state.active_run = run
+    answer_slot = st.empty()
+    stop_slot = st.empty()
+    stop_slot.button("⏹️ Stop", on_click=stop_run, key=f"stop_run_{run.id}")
+    ticker = st.empty()
+    shown_answer, shown_seconds = "", -1
+    try:
+        while not run.wait(timeout=0.05):
+            partial_answer = run.answer_text
+            if partial_answer != shown_answer:
+                answer_slot.markdown(partial_answer + " ▌")
+                shown_answer = partial_answer
+
+            seconds = int(run.control.elapsed())
+            if seconds != shown_seconds:
+                ticker.caption(f"⏳ Working... {seconds}s" if run.status == "running" else "⏳ Waiting for a free worker...")
+                shown_seconds = seconds
+    except BaseException:
+        # Interrupted by a rerun: this script run's containers are stale, so the worker stops drawing into them
+        if ui_handler is not None:
+            ui_handler.detach()
+        raise
+    st.session_state.active_run = None
+    stop_slot.empty()
+    ticker.empty()
+    answer_slot.empty()
+    return answer_slot
+
+def streamlit_thread_context(ctx):
+    """
+    Returns a context-manager factory that lends this script's Streamlit context
+    to the engine worker thread answering the question (so 'StreamlitCallbackHandler'
+    can draw from it), and takes it back afterwards since pool threads are reused.
+    """
+    @contextmanager
+    def _context():
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
+        try:
+            yield
+        finally:
+            # No public "remove" API: drop the attribute 'add_script_run_ctx' set
+            for name, value in list(vars(thread).items()):
+                if value is ctx:
+                    delattr(thread, name)
+    return _context
@@ -0,0 +1,547 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from database import DB_URI, database_file_path, get_database
+from paths import CACHE_DIR
+from query_log import QueryLog
+from sql_tools import tokenize_sql, referenced_tables, table_clause_starts
+
+# Where reports and DDL files are written
+ADVISOR_DIR = os.path.join(CACHE_DIR, "index_advisor")
+
+# Only the most expensive distinct statements (by total logged time) are replayed
+MAX_REPLAY_QUERIES = 20
+
+# Candidate indexes evaluated per run, and the widest index proposed
+MAX_CANDIDATES = 15
+MAX_INDEX_COLUMNS = 5
+
+# Each replay takes the best of REPLAY_RUNS executions; a statement is stopped after REPLAY_TIMEOUT seconds
+REPLAY_RUNS = 3
+REPLAY_TIMEOUT = 30
+
+# A statement counts as improved when an index makes it at least this much faster (relative and absolute)
+MIN_IMPROVEMENT = 0.1
+MIN_SAVING_MS = 0.5
+
+# Default analysis window over the query log
+LOG_WINDOW_DAYS = 7
+
+# Plan lines of full passes and of sorts that SQLite had to build on the fly
+_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\S+)")
+_TEMP_BTREE_RE = re.compile(r"USE TEMP B-TREE FOR (.+)$")
+
+# Comparisons an index can serve (equality first, then one range)
+_EQUALITY_OPS = {"=", "IN", "IS"}
+_RANGE_OPS = {"<", ">", "BETWEEN"}
+
+# Words that start a clause (and so are never an alias)
+_CLAUSE_WORDS = {
+    "WHERE", "GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "EXCEPT", "INTERSECT", "WINDOW", "ON", "USING",
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER", "SELECT", "FROM", "AS", "AND", "OR",
+    "OFFSET", "NOT", "IN", "IS",
+}
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _name(token):
+    kind, value = token
+    if kind == "word":
+        return value
+    if kind == "quoted":
+        return value[1:-1].replace('""', '"')
+    return None
+
+def _dedup(names):
+    return list(dict.fromkeys(names))
+
+def index_name(table, columns):
+    """
+    A readable, deterministic name for a proposed index.
+    """
+    name = "idx_" + "_".join([table] + list(columns))
+    return re.sub(r"\W+", "_", name).lower()[:60]
+
+def plan_issues(plan):
+    """
+    Returns (scanned, temp_btrees): the tables or aliases read with a full SCAN, and the
+    clauses ("GROUP BY", "ORDER BY", "DISTINCT", ...) sorted with a temporary B-tree.
+    """
+    scanned, temp_btrees = [], []
+    for line in plan or ():
+        match = _SCAN_RE.match(line)
+        if match and "CONSTANT ROW" not in line:
+            scanned.append(match.group(1).strip('"'))
+        match = _TEMP_BTREE_RE.search(line)
+        if match:
+            temp_btrees.append(match.group(1))
+    return scanned, temp_btrees
+
+def _alias_map(tokens, tables):
+    """
+    Maps every table name and alias of a statement to its table (lowercase keys).
+    SQLite's plan names a table by its alias ("SCAN d"), so scans are resolved through this.
+    """
+    known = {t.lower(): t for t in tables}
+    aliases = {}
+    for i, token in enumerate(tokens):
+        name = _name(token)
+        if name is None or name.lower() not in known:
+            continue
+        table = known[name.lower()]
+        aliases[name.lower()] = table
+        j = i + 1
+        if j < len(tokens) and tokens[j][0] == "word" and tokens[j][1].upper() == "AS":
+            j += 1
+        alias = _name(tokens[j]) if j < len(tokens) else None
+        if alias and (tokens[j][0] != "word" or alias.upper() not in _CLAUSE_WORDS):
+            aliases.setdefault(alias.lower(), table)
+    return aliases
+
+def column_usage(tokens, columns):
+    """
+    Classifies how a statement uses the given columns of one table:
+    "equality" (=, IN, IS), "range" (<, >, BETWEEN) in WHERE / ON / HAVING,
+    "group" (GROUP BY), "order" (ORDER BY), and "select" (anything else).
+    A token-level heuristic: columns in subqueries are attributed to the enclosing clause.
+    """
+    lookup = {c.lower(): c for c in columns}
+    usage = {"equality": [], "range": [], "group": [], "order": [], "select": []}
+    clause = "select"
+    table_list = table_clause_starts(tokens)
+
+    for i, token in enumerate(tokens):
+        kind, value = token
+        upper = value.upper() if kind == "word" else None
+        next_upper = tokens[i + 1][1].upper() if i + 1 < len(tokens) else None
+
+        if upper in ("WHERE", "ON", "HAVING"):
+            clause = "filter"
+            continue
+        if upper in ("GROUP", "ORDER") and next_upper == "BY":
+            clause = upper.lower()
+            continue
+        if upper == "SELECT":
+            clause = "select"
+            continue
+        if upper == "LIMIT" or table_list[i]:
+            clause = None
+            continue
+
+        name = _name(token)
+        if name is None or name.lower() not in lookup or clause is None:
+            continue
+        if next_upper == "(" or (i > 0 and tokens[i - 1][0] == "word" and tokens[i - 1][1].upper() == "AS"):
+            continue  # A function of the same name, or an alias definition
+        column = lookup[name.lower()]
+
+        if clause != "filter":
+            usage[clause].append(column)
+            continue
+
+        following = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+        after = tokens[i + 2][1] if i + 2 < len(tokens) else ""
+        preceding = tokens[i - 1][1] if i > 0 else ""
+        if (following.upper() in _EQUALITY_OPS and not (following.upper() == "IS" and after.upper() in ("NOT", "DISTINCT"))) \
+                or (preceding == "=" and i > 1 and tokens[i - 2][0] in ("string", "number")):
+            usage["equality"].append(column)
+        elif following.upper() in _RANGE_OPS and not (following == "<" and after == ">"):
+            usage["range"].append(column)
+        else:
+            usage["select"].append(column)
+
+    return {key: _dedup(names) for key, names in usage.items()}
+
+def candidate_indexes(usage, temp_btrees):
+    """
+    Proposes indexes for one table of one statement, as (kind, columns) pairs:
+    - "filter": equality columns, then one range column (serves the WHERE clause)
+    - "group" / "order": equality columns, then the GROUP BY / ORDER BY columns (avoids the temp B-tree)
+    - "covering": one of the above plus every other column the statement reads (no table lookups)
+    """
+    equality = usage["equality"]
+    ranges = [c for c in usage["range"] if c not in equality]
+    candidates = []
+
+    if equality or ranges:
+        candidates.append(("filter", equality + ranges[:1]))
+    if usage["group"] and any("GROUP BY" in t for t in temp_btrees):
+        candidates.append(("group", _dedup(equality + usage["group"])))
+    elif usage["order"] and any("ORDER BY" in t for t in temp_btrees) and not ranges:
+        candidates.append(("order", _dedup(equality + usage["order"])))
+
+    if candidates:
+        base = candidates[-1][1]
+        read = _dedup(base + ranges + usage["group"] + usage["order"] + usage["select"])
+        if len(read) > len(base) and len(read) <= MAX_INDEX_COLUMNS:
+            candidates.append(("covering", read))
+
+    return [(kind, columns[:MAX_INDEX_COLUMNS]) for kind, columns in candidates if columns]
+
+def load_workload(entries):
+    """
+    Groups logged statements by their normalized SQL. Each workload item holds the
+    latest SQL text and plan, the execution count, and the total / max logged duration.
+    """
+    workload = {}
+    for entry in entries:
+        item = workload.setdefault(entry["normalized_sql"], {
+            "sql": entry["sql"], "count": 0, "timeouts": 0, "total_ms": 0.0, "max_ms": 0.0, "plan": None,
+        })
+        item["sql"] = entry["sql"]
+        item["count"] += 1
+        item["timeouts"] += entry["status"] == "timeout"
+        item["total_ms"] += entry["duration_ms"]
+        item["max_ms"] = max(item["max_ms"], entry["duration_ms"])
+        item["plan"] = entry["plan"] or item["plan"]
+    return sorted(workload.values(), key=lambda item: item["total_ms"], reverse=True)
+
+class Scratch:
+    """
+    A private copy of the live database (SQLite backup API) on which indexes are
+    created, timed, and dropped. The live database is only ever read.
+    """
+
+    def __init__(self, source_path, work_dir):
+        self.path = os.path.join(work_dir, "scratch.db")
+        source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            source.backup(self.conn)
+        finally:
+            source.close()
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+
+    def close(self):
+        self.conn.close()
+
+    def tables(self):
+        return {
+            row[0]: [c[1] for c in self.conn.execute(f"PRAGMA table_info({_quote(row[0])})")]
+            for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+        }
+
+    def existing_indexes(self, table):
+        """
+        Column lists of the table's current indexes (their leading columns are already served).
+        """
+        indexes = []
+        for row in self.conn.execute(f"PRAGMA index_list({_quote(table)})").fetchall():
+            indexes.append([c[2] for c in self.conn.execute(f"PRAGMA index_info({_quote(row[1])})")])
+        return indexes
+
+    def has_statistics(self):
+        return self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None
+
+    def used_bytes(self):
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist) * self.conn.execute("PRAGMA page_size").fetchone()[0]
+
+    def plan(self, sql):
+        return [row[-1] for row in self.conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+
+    def time(self, sql, runs=REPLAY_RUNS, timeout=REPLAY_TIMEOUT):
+        """
+        Best-of-'runs' duration of a statement in milliseconds (rows are fetched and
+        discarded). Returns (ms, timed_out); a stopped statement counts as 'timeout' seconds.
+        """
+        best = None
+        for _ in range(runs):
+            deadline = time.monotonic() + timeout
+            self.conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10_000)
+            started = time.perf_counter()
+            try:
+                cursor = self.conn.execute(sql)
+                while cursor.fetchmany(1000):
+                    pass
+            except sqlite3.OperationalError:
+                if time.monotonic() > deadline:
+                    return timeout * 1000.0, True
+                raise
+            finally:
+                self.conn.set_progress_handler(None, 10_000)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, False
+
+    def create(self, ddl):
+        for statement in ddl:
+            self.conn.execute(statement)
+
+    def drop(self, name):
+        self.conn.execute(f"DROP INDEX IF EXISTS {_quote(name)}")
+
+def index_ddl(name, table, columns, analyze=True):
+    """
+    The statements an operator runs to create a proposed index (and refresh its statistics).
+    """
+    ddl = [f"CREATE INDEX IF NOT EXISTS {_quote(name)} ON {_quote(table)} ({', '.join(_quote(c) for c in columns)})"]
+    if analyze:
+        ddl.append(f"ANALYZE {_quote(name)}")
+    return ddl
+
+def _is_prefix(short, long):
+    return [c.lower() for c in long[:len(short)]] == [c.lower() for c in short]
+
+def advise(db_uri=DB_URI, log=None, since=None, max_queries=MAX_REPLAY_QUERIES, max_candidates=MAX_CANDIDATES,
+           runs=REPLAY_RUNS, work_dir=ADVISOR_DIR):
+    """
+    Analyzes the query log of a SQLite database and proposes indexes:
+    1. Groups the logged statements and finds full SCANs and temp B-tree sorts in their plans.
+    2. Derives composite / covering index candidates from the columns those statements filter, group, and sort on.
+    3. Copies the database to a scratch file and replays the most expensive statements with and
+       without each candidate; candidates the planner ignores or that save nothing are rejected.
+    4. Selects indexes greedily, re-measuring each one with the better ones already in place.
+    Returns a report dict (with the DDL); the live database is never modified.
+    """
+    source_path = database_file_path(db_uri)
+    if source_path is None:
+        raise ValueError(f"The index advisor needs a local SQLite database, got {db_uri!r}")
+
+    db_key = str(get_database(db_uri)._engine.url)
+    log = log or QueryLog()
+    entries = log.entries(db_key, since=since)
+    workload = load_workload(entries)
+
+    report = {
+        "db_uri": db_uri,
+        "generated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "logged_statements": len(entries),
+        "distinct_statements": len(workload),
+        "scans": Counter(),
+        "temp_btrees": Counter(),
+        "replayed": [],
+        "recommendations": [],
+        "rejected": [],
+        "skipped": [],
+        "ddl": [],
+    }
+
+    os.makedirs(work_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        scratch = Scratch(source_path, tmp_dir)
+        try:
+            tables = scratch.tables()
+            analyze = scratch.has_statistics()
+
+            # 1. Statements whose logged plan shows a full scan or a temp B-tree
+            problems = []
+            for item in workload:
+                tokens = tokenize_sql(item["sql"])
+                named, _, _ = referenced_tables(tokens)
+                aliases = _alias_map(tokens, [t for t in tables if t.lower() in {n.lower() for n in named}])
+                scanned, temp_btrees = plan_issues(item["plan"])
+                scanned_tables = _dedup(aliases[s.lower()] for s in scanned if s.lower() in aliases)
+                for table in scanned_tables:
+                    report["scans"][table] += item["count"]
+                for clause in temp_btrees:
+                    report["temp_btrees"][clause] += item["count"]
+                if scanned_tables or temp_btrees:
+                    item.update(tokens=tokens, tables=_dedup(aliases.values()), scanned=scanned_tables, temp_btrees=temp_btrees)
+                    problems.append(item)
+            problems = problems[:max_queries]
+
+            # 2. Candidates, ranked by the logged time of the statements proposing them
+            candidates = {}
+            for item in problems:
+                for table in item["tables"]:
+                    if table not in item["scanned"] and not item["temp_btrees"]:
+                        continue
+                    usage = column_usage(item["tokens"], tables[table])
+                    for kind, columns in candidate_indexes(usage, item["temp_btrees"]):
+                        key = (table, tuple(c.lower() for c in columns))
+                        candidate = candidates.setdefault(key, {"table": table, "columns": columns, "kind": kind, "weight": 0.0})
+                        candidate["weight"] += item["total_ms"]
+
+            for candidate in list(candidates.values()):
+                if any(_is_prefix(candidate["columns"], existing) for existing in scratch.existing_indexes(candidate["table"])):
+                    report["rejected"].append({**_describe(candidate), "reason": "an existing index already covers these columns"})
+                    del candidates[(candidate["table"], tuple(c.lower() for c in candidate["columns"]))]
+            ranked = sorted(candidates.values(), key=lambda c: c["weight"], reverse=True)
+            for candidate in ranked[max_candidates:]:
+                report["rejected"].append({**_describe(candidate), "reason": f"outside the top {max_candidates} candidates"})
+            ranked = ranked[:max_candidates]
+
+            # 3. Baseline timings on the scratch copy
+            for item in list(problems):
+                try:
+                    item["baseline_ms"], _ = scratch.time(item["sql"], runs)
+                    item["plan_before"] = scratch.plan(item["sql"])
+                except sqlite3.Error as e:
+                    # E.g., logged before a schema change: it cannot be replayed any more
+                    report["skipped"].append({"sql": item["sql"], "error": str(e)})
+                    problems.remove(item)
+
+            # 4. Each candidate alone: which statements get faster, and does the planner use it at all?
+            evaluated = []
+            for candidate in ranked:
+                name = index_name(candidate["table"], candidate["columns"])
+                result = {**_describe(candidate), "name": name, "ddl": index_ddl(name, candidate["table"], candidate["columns"], analyze)}
+                measured = _try_index(scratch, result, problems, {id(item): item["baseline_ms"] for item in problems}, runs)
+                scratch.drop(name)
+                if not measured["used"]:
+                    report["rejected"].append({**result, **measured, "reason": "the query planner does not use it"})
+                elif not measured["improved"] or measured["benefit_ms"] <= 0:
+                    report["rejected"].append({**result, **measured, "reason": "no statement got measurably faster"})
+                else:
+                    evaluated.append({**result, **measured})
+
+            # 5. Greedy selection, best first: each index is re-measured with the ones already
+            # selected in place and kept only if it still saves time (no overlapping indexes)
+            selected = []
+            current = {id(item): item["baseline_ms"] for item in problems}
+            for result in sorted(evaluated, key=lambda r: r["benefit_ms"], reverse=True):
+                overlap = next((s for s in selected if s["table"] == result["table"] and
+                                (_is_prefix(result["columns"], s["columns"]) or _is_prefix(s["columns"], result["columns"]))), None)
+                if overlap is not None:
+                    report["rejected"].append({**result, "reason": f"overlaps {overlap['name']}, which saves more"})
+                    continue
+                measured = _try_index(scratch, result, problems, current, runs)
+                if measured["improved"] and measured["benefit_ms"] > 0:
+                    selected.append({**result, **measured})
+                    current.update(measured.pop("times"))
+                else:
+                    scratch.drop(result["name"])
+                    report["rejected"].append({**result, **measured, "reason": "adds nothing once the better indexes above exist"})
+
+            # The selected indexes are all in place: their combined effect on every replayed statement
+            for item in problems:
+                report["replayed"].append({
+                    "sql": item["sql"],
+                    "count": item["count"],
+                    "timeouts": item["timeouts"],
+                    "logged_avg_ms": round(item["total_ms"] / item["count"], 3),
+                    "scanned": item["scanned"],
+                    "temp_btrees": item["temp_btrees"],
+                    "before_ms": round(item["baseline_ms"], 3),
+                    "after_ms": round(scratch.time(item["sql"], runs)[0] if selected else item["baseline_ms"], 3),
+                    "plan_before": item["plan_before"],
+                    "plan_after": scratch.plan(item["sql"]),
+                })
+        finally:
+            scratch.close()
+
+    for result in selected + report["rejected"]:
+        result.pop("times", None)
+    report["recommendations"] = selected
+    report["ddl"] = [statement for result in selected for statement in result["ddl"]]
+    report["scans"] = dict(report["scans"].most_common())
+    report["temp_btrees"] = dict(report["temp_btrees"].most_common())
+    report["workload_before_ms"] = round(sum(q["before_ms"] * q["count"] for q in report["replayed"]), 3)
+    report["workload_after_ms"] = round(sum(q["after_ms"] * q["count"] for q in report["replayed"]), 3)
+    return report
+
+def _try_index(scratch, result, problems, current, runs):
+    """
+    Creates a candidate index on the scratch copy (left in place) and replays the
+    statements whose plan now uses it. 'current' maps each statement to its duration
+    without the index. Returns the saving over the logged workload (each statement
+    weighted by its count), the improved statements, the new durations, and the index size.
+    """
+    size_before = scratch.used_bytes()
+    scratch.create(result["ddl"])
+    measured = {"used": False, "benefit_ms": 0.0, "improved": [], "times": {},
+                "size_bytes": scratch.used_bytes() - size_before}
+    for item in problems:
+        if result["table"] not in item["tables"]:
+            continue
+        plan = scratch.plan(item["sql"])
+        if not any(result["name"] in line for line in plan):
+            continue
+        measured["used"] = True
+        ms, _ = scratch.time(item["sql"], runs)
+        before = current[id(item)]
+        measured["times"][id(item)] = ms
+        measured["benefit_ms"] += (before - ms) * item["count"]
+        if ms <= before * (1 - MIN_IMPROVEMENT) and before - ms >= MIN_SAVING_MS:
+            measured["improved"].append({"sql": item["sql"], "before_ms": round(before, 3), "after_ms": round(ms, 3), "plan_after": plan})
+    measured["benefit_ms"] = round(measured["benefit_ms"], 3)
+    return measured
+
+def _describe(candidate):
+    return {"table": candidate["table"], "columns": list(candidate["columns"]), "kind": candidate["kind"]}
+
+def render_report(report):
+    """
+    Formats a report for the terminal.
+    """
+    lines = [
+        f"Index advisor • {report['db_uri']} • {report['generated']}",
+        f"Logged statements: {report['logged_statements']} ({report['distinct_statements']} distinct) • "
+        f"Replayed: {len(report['replayed'])}",
+        "Full scans: " + (", ".join(f"{t} ({n})" for t, n in report["scans"].items()) or "none"),
+        "Temp B-trees: " + (", ".join(f"{c} ({n})" for c, n in report["temp_btrees"].items()) or "none"),
+        "",
+    ]
+    if not report["recommendations"]:
+        lines.append("No index recommended: no logged statement got measurably faster on the scratch copy.")
+    for i, result in enumerate(report["recommendations"], 1):
+        lines.append(f"{i}. {result['name']} ({result['kind']}) on {result['table']}({', '.join(result['columns'])})")
+        lines.append(f"   Saves ~{result['benefit_ms']:.1f} ms over the logged workload • "
+                     f"{len(result['improved'])} statement(s) faster • ~{result['size_bytes'] / 1024:.0f} KB")
+        for improved in result["improved"][:3]:
+            lines.append(f"   {improved['before_ms']:.2f} -> {improved['after_ms']:.2f} ms  {improved['sql'][:100]}")
+    if report["replayed"]:
+        lines += ["", f"Workload on the scratch copy: {report['workload_before_ms']:.1f} ms -> "
+                      f"{report['workload_after_ms']:.1f} ms with all recommended indexes"]
+    if report["ddl"]:
+        lines += ["", "DDL (review, then apply to the live database yourself):"] + [s + ";" for s in report["ddl"]]
+    return "\n".join(lines)
+
+def write_report(report, output_dir=ADVISOR_DIR):
+    """
+    Writes '<database>_report.json' and '<database>_indexes.sql' to 'output_dir'. Returns their paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(database_file_path(report["db_uri"])))[0]
+    report_path = os.path.join(output_dir, f"{stem}_report.json")
+    ddl_path = os.path.join(output_dir, f"{stem}_indexes.sql")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    with open(ddl_path, "w", encoding="utf-8") as f:
+        f.write(f"-- Indexes proposed by index_advisor.py for {report['db_uri']} ({report['generated']})\n")
+        f.write(f"-- Workload replay: {report.get('workload_before_ms', 0):.1f} ms -> {report.get('workload_after_ms', 0):.1f} ms\n")
+        for result in report["recommendations"]:
+            f.write(f"\n-- {result['kind']} index, saves ~{result['benefit_ms']:.1f} ms over the logged workload\n")
+            f.write("".join(statement + ";\n" for statement in result["ddl"]))
+    return report_path, ddl_path
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Propose indexes for the SQL the agent runs, from the query log and replays on a scratch copy. "
+                    "Never modifies the live database."
+    )
+    parser.add_argument("--db-uri", default=DB_URI, help="SQLite URI of the database the log was recorded against")
+    parser.add_argument("--days", type=float, default=LOG_WINDOW_DAYS, help="Only analyze statements logged in the last N days")
+    parser.add_argument("--max-queries", type=int, default=MAX_REPLAY_QUERIES, help="Distinct statements replayed")
+    parser.add_argument("--max-candidates", type=int, default=MAX_CANDIDATES, help="Candidate indexes evaluated")
+    parser.add_argument("--runs", type=int, default=REPLAY_RUNS, help="Executions per replay (best is kept)")
+    parser.add_argument("--output-dir", default=ADVISOR_DIR, help="Where the JSON report and the DDL file are written")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="Re-run every N minutes (0 = once); each run rewrites the report and DDL files")
+    args = parser.parse_args()
+
+    log = QueryLog()
+    while True:
+        report = advise(
+            args.db_uri, log, since=time.time() - args.days * 86400,
+            max_queries=args.max_queries, max_candidates=args.max_candidates, runs=args.runs
+        )
+        report_path, ddl_path = write_report(report, args.output_dir)
+        print(render_report(report))
+        print(f"\nReport: {report_path}\nDDL: {ddl_path}", file=sys.stderr)
+        if not args.interval:
+            break
+        time.sleep(args.interval * 60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import Counter
+import pandas as pd
+from database import DATA_DIR, register_database
+from profiler import LOW_CARDINALITY
+
+# Rows read, converted, and inserted per batch (memory stays O(CHUNK_ROWS), not O(file))
+CHUNK_ROWS = 50_000
+
+# Distinct values tracked per column while loading; past this a column is "high cardinality"
+MAX_TRACKED_VALUES = 64
+
+# Known ordered scales. A text column whose labels mostly fall on one of them gets an
+# INTEGER '<column>_rank' companion, so "at least high" / ORDER BY work numerically.
+ORDINAL_SCALES = (
+    ("very-low", "low", "average", "high", "very-high"),
+    ("very-low", "low", "medium", "high", "very-high"),
+    ("xxs", "xs", "s", "m", "l", "xl", "xxl", "xxxl"),
+    ("small", "medium", "large", "extra-large"),
+    ("poor", "fair", "good", "very-good", "excellent"),
+    ("never", "rarely", "sometimes", "often", "always"),
+    ("strongly-disagree", "disagree", "neutral", "agree", "strongly-agree"),
+)
+
+# Share of non-null rows that must carry a scale label for a column to be treated as ordinal
+ORDINAL_MIN_COVERAGE = 0.5
+
+def _identifier(name, fallback):
+    """
+    A clean column / table name: surrounding whitespace dropped, never empty.
+    """
+    name = str(name).strip()
+    return name or fallback
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _label_key(value):
+    """
+    Normalized form of a category label: 'Very High', 'very_high', ' very-high ' -> 'very-high'.
+    """
+    return re.sub(r"[\s_]+", "-", str(value).strip().lower())
+
+def _source_name(source):
+    return os.path.basename(source if isinstance(source, str) else getattr(source, "name", "upload"))
+
+def read_source(source, chunk_rows=CHUNK_ROWS):
+    """
+    Yields (table_name, DataFrame iterator) for one source: a CSV / TSV or Parquet
+    file (one table named after the file), or a SQLite database (every table).
+    'source' is a path or a named file object (e.g., a Streamlit upload).
+    """
+    filename = _source_name(source)
+    stem, extension = os.path.splitext(filename)
+    table = re.sub(r"\W+", "_", stem).strip("_") or "data"
+    extension = extension.lower()
+
+    if extension in (".csv", ".tsv", ".txt"):
+        yield table, pd.read_csv(source, sep="\t" if extension == ".tsv" else ",", chunksize=chunk_rows, skipinitialspace=True)
+    elif extension == ".parquet":
+        import pyarrow.parquet as pq
+        yield table, (batch.to_pandas() for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows))
+    elif extension in (".db", ".sqlite", ".sqlite3") and isinstance(source, str):
+        conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+        try:
+            names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+            for name in names:
+                yield name, pd.read_sql_query(f"SELECT * FROM {_quote(name)}", conn, chunksize=chunk_rows)
+        finally:
+            conn.close()
+    else:
+        raise ValueError(f"Unsupported file type '{extension}' ({filename}): expected .csv, .tsv, .parquet, or a SQLite .db")
+
+def infer_sql_type(series):
+    """
+    SQLite type of a column, from its first chunk: INTEGER, REAL, or TEXT.
+    Text that is entirely numeric becomes a number; integral floats (ints with NULLs) become INTEGER.
+    """
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "TEXT"
+    values = series.dropna()
+    if not pd.api.types.is_float_dtype(series):
+        if values.empty:
+            return "TEXT"
+        values = pd.to_numeric(values.astype(str).str.strip(), errors="coerce")
+        if values.isna().any():
+            return "TEXT"
+    if values.empty:
+        return "REAL"
+    return "INTEGER" if (values == values.round()).all() and values.abs().max() < 2 ** 63 else "REAL"
+
+def convert_column(series, sql_type):
+    """
+    Converts one chunk of a column to Python values for 'executemany' (NaN -> None).
+    Values that do not fit a numeric column are kept as text rather than dropped.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        series = series.dt.strftime("%Y-%m-%d %H:%M:%S")
+    if sql_type == "TEXT":
+        text = series.astype(str).str.strip().astype(object)
+        text[series.isna()] = None
+        return text.tolist()
+
+    numeric = pd.to_numeric(series, errors="coerce")
+    missing = numeric.isna()
+    if sql_type == "INTEGER" and (numeric[~missing] % 1 == 0).all():
+        values = numeric.astype("Int64").astype(object)
+    else:
+        values = numeric.astype(object)
+    values[missing] = None
+    unparsed = missing & series.notna()
+    if unparsed.any():
+        values[unparsed] = series[unparsed].astype(str).str.strip()
+    return values.tolist()
+
+class ColumnStats:
+    """
+    Running statistics of one column while it is loaded: non-null count and the
+    frequency of each value, up to MAX_TRACKED_VALUES distinct values.
+    """
+
+    def __init__(self, name, sql_type):
+        self.name = name
+        self.sql_type = sql_type
+        self.non_null = 0
+        self.counts = Counter()
+        self.high_cardinality = False
+
+    def add(self, values):
+        present = [v for v in values if v is not None]
+        self.non_null += len(present)
+        if self.high_cardinality:
+            return
+        self.counts.update(present)
+        if len(self.counts) > MAX_TRACKED_VALUES:
+            self.high_cardinality = True
+            self.counts.clear()
+
+    @property
+    def distinct(self):
+        return None if self.high_cardinality else len(self.counts)
+
+def _canonical_variants(stats):
+    """
+    Groups the spellings of each category ('Summer', 'summer ', 'SUMMER') and maps every
+    variant to the most frequent one. Returns {variant: canonical} for the variants to rewrite.
+    """
+    groups = {}
+    for value, count in stats.counts.items():
+        groups.setdefault(_label_key(value), []).append((count, value))
+    rewrites = {}
+    for variants in groups.values():
+        canonical = max(variants)[1]
+        rewrites.update({value: canonical for _, value in variants if value != canonical})
+    return rewrites
+
+def detect_ordinal_scale(stats):
+    """
+    Returns {label: rank} if a text column's labels mostly fall on one of ORDINAL_SCALES, else None.
+    Labels outside the scale (e.g., 'free' in a size column) get no rank.
+    """
+    if stats.sql_type != "TEXT" or stats.high_cardinality or not stats.non_null:
+        return None
+    labels = {}
+    for value, count in stats.counts.items():
+        key = _label_key(value)
+        labels[key] = labels.get(key, 0) + count
+
+    best, best_coverage = None, 0.0
+    for scale in ORDINAL_SCALES:
+        present = [label for label in scale if label in labels]
+        coverage = sum(labels[label] for label in present) / stats.non_null
+        if len(present) >= 2 and coverage >= ORDINAL_MIN_COVERAGE and coverage > best_coverage:
+            best, best_coverage = scale, coverage
+    if best is None:
+        return None
+    return {value: best.index(_label_key(value)) + 1 for value in stats.counts if _label_key(value) in best}
+
+def load_table(conn, table, chunks):
+    """
+    Streams DataFrame chunks into a new typed table with batched 'executemany',
+    then canonicalizes category spellings, adds rank columns for ordinal labels, and
+    indexes low-cardinality columns. Runs inside the caller's transaction.
+    Returns the table's ingestion report.
+    """
+    columns, stats, insert, rows = None, None, None, 0
+    for chunk in chunks:
+        if columns is None:
+            columns = []
+            for position, name in enumerate(chunk.columns, start=1):
+                name = _identifier(name, f"column_{position}")
+                while name.lower() in (c.lower() for c in columns):
+                    name += "_2"
+                columns.append(name)
+            types = [infer_sql_type(chunk[c]) for c in chunk.columns]
+            stats = [ColumnStats(name, sql_type) for name, sql_type in zip(columns, types)]
+            conn.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+            conn.execute(f"CREATE TABLE {_quote(table)} ({', '.join(f'{_quote(n)} {t}' for n, t in zip(columns, types))})")
+            insert = f"INSERT INTO {_quote(table)} VALUES ({', '.join('?' * len(columns))})"
+
+        converted = [convert_column(chunk[c], s.sql_type) for c, s in zip(chunk.columns, stats)]
+        for column_stats, values in zip(stats, converted):
+            column_stats.add(values)
+        conn.executemany(insert, zip(*converted))
+        rows += len(chunk)
+
+    if columns is None:
+        raise ValueError(f"'{table}' has no columns")
+
+    report = {"rows": rows, "columns": {s.name: s.sql_type for s in stats}, "ordinal": [], "indexes": []}
+    for column_stats in stats:
+        column = _quote(column_stats.name)
+
+        # 1. One spelling per category, so filters and GROUP BY never split a value
+        if column_stats.sql_type == "TEXT" and not column_stats.high_cardinality:
+            rewrites = _canonical_variants(column_stats)
+            for variant, canonical in rewrites.items():
+                conn.execute(f"UPDATE {_quote(table)} SET {column} = ? WHERE {column} = ?", (canonical, variant))
+                column_stats.counts[canonical] += column_stats.counts.pop(variant)
+
+        # 2. Ordinal labels get a numeric rank column
+        ranks = detect_ordinal_scale(column_stats)
+        indexed = [column_stats.name] if column_stats.distinct is not None and 1 < column_stats.distinct <= LOW_CARDINALITY else []
+        if ranks:
+            rank_column = column_stats.name + "_rank"
+            cases = " ".join(f"WHEN ? THEN {rank}" for rank in ranks.values())
+            conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(rank_column)} INTEGER")
+            conn.execute(f"UPDATE {_quote(table)} SET {_quote(rank_column)} = CASE {column} {cases} END", list(ranks))
+            report["columns"][rank_column] = "INTEGER"
+            report["ordinal"].append({"column": column_stats.name, "rank_column": rank_column,
+                                      "order": sorted(ranks, key=ranks.get)})
+            indexed.append(rank_column)
+
+        # 3. Index the low-cardinality filter columns
+        for name in indexed:
+            index_name = re.sub(r"\W+", "_", f"idx_{table}_{name}")
+            conn.execute(f"CREATE INDEX {_quote(index_name)} ON {_quote(table)} ({_quote(name)})")
+            report["indexes"].append(name)
+    return report
+
+def ingest(sources, name=None, out_dir=DATA_DIR, chunk_rows=CHUNK_ROWS, register=True):
+    """
+    Loads CSV / Parquet / SQLite sources into ONE new SQLite database '<out_dir>/<name>.db'
+    (one table per file) in a single transaction, runs ANALYZE, and registers it
+    in the database catalog. The file is built under a temporary name and swapped in,
+    so an app reading the previous version never sees a half-loaded database.
+    Returns a report with the URI, timing, and per-table details.
+    """
+    started = time.perf_counter()
+    name = re.sub(r"\W+", "_", name or os.path.splitext(_source_name(sources[0]))[0]).strip("_") or "data"
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{name}.db")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    tables = {}
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        # A fresh file that is only swapped in when complete: no journal or fsync needed while loading
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("BEGIN")
+        for source in sources:
+            for table, chunks in read_source(source, chunk_rows):
+                while table in tables:
+                    table += "_2"
+                tables[table] = load_table(conn, table, chunks)
+        conn.execute("COMMIT")
+        # Planner statistics, so the new indexes are actually chosen
+        conn.execute("ANALYZE")
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, path)
+
+    uri = f"sqlite:///{os.path.abspath(path)}"
+    report = {
+        "uri": uri,
+        "path": path,
+        "seconds": round(time.perf_counter() - started, 2),
+        "tables": tables,
+    }
+    if register:
+        register_database(
+            uri, f"{name}.db",
+            tables={table: info["rows"] for table, info in tables.items()},
+            sources=[_source_name(source) for source in sources],
+            ingested_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Load CSV / Parquet files into a typed, indexed SQLite database the app can select.")
+    parser.add_argument("sources", nargs="+", help="CSV, TSV, Parquet, or SQLite files (one table per file)")
+    parser.add_argument("--name", default=None, help="Database name (default: the first file's name) -> data/<name>.db")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows read and inserted per batch")
+    parser.add_argument("--no-register", action="store_true", help="Do not add the database to the app's catalog")
+    args = parser.parse_args()
+
+    report = ingest(args.sources, name=args.name, chunk_rows=args.chunk_rows, register=not args.no_register)
+    for table, info in report["tables"].items():
+        print(f"{table}: {info['rows']:,} rows • {len(info['columns'])} columns • indexed: {', '.join(info['indexes']) or '-'}")
+        for ordinal in info["ordinal"]:
+            print(f"  {ordinal['column']} -> {ordinal['rank_column']} ({' < '.join(ordinal['order'])})")
+    print(f"Wrote {report['uri']} in {report['seconds']}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+
+# Directory for on-disk caches and stores (schema profiles, traces, query log, question
+# index, sessions, DuckDB mirrors), created next to app.py
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".insightsql_cache")
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import streamlit as st
+from sqlalchemy import inspect, text
+from database import local_database_path
+from paths import CACHE_DIR
+
+# Columns with at most this many distinct values have their full value set recorded,
+# so the agent never needs a 'SELECT DISTINCT' probe to learn them.
+LOW_CARDINALITY = 25
+
+# Bump this when the profile format changes to invalidate old cache files
+PROFILE_VERSION = 2
+
+# SQL dialect notes added to the digest, so generated SQL matches the backend being queried
+DIALECT_HINTS = {
+    "sqlite": (
+        "SQLite. '/' between two integers truncates (use CAST(x AS REAL) for ratios); "
+        "dates are text (use strftime); LIKE is case-insensitive for ASCII."
+    ),
+    "duckdb": (
+        "DuckDB. Use ILIKE for case-insensitive matching; '/' always returns a decimal ('//' is integer division); "
+        "use date_trunc / strftime / EXTRACT for dates; FILTER (WHERE ...) and QUALIFY are available; "
+        "string literals use single quotes only."
+    ),
+}
+
+def database_fingerprint(uri):
+    """
+    Returns a string that changes whenever the database file changes
+    (path + modification time + size), or None for non-file databases.
+    """
+    path = local_database_path(uri)
+    if path is None or not os.path.exists(path):
+        return None
+
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+def _is_numeric(type_name):
+    """
+    Checks whether a reflected column type holds numbers.
+    """
+    type_name = type_name.upper()
+    return any(key in type_name for key in ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC"))
+
+def profile_database(db):
+    """
+    Profiles every usable table of a SQLDatabase in a handful of aggregate queries.
+    Records each table's row count and, for every column, its type, null rate,
+    min/max, distinct count, and (for low-cardinality columns) the value set
+    ordered by frequency.
+    """
+    engine = db._engine
+    quote = engine.dialect.identifier_preparer.quote
+    inspector = inspect(engine)
+    profile = {"version": PROFILE_VERSION, "dialect": engine.dialect.name, "tables": {}}
+
+    with engine.connect() as conn:
+        for table in sorted(db.get_usable_table_names()):
+            columns = inspector.get_columns(table)
+            qtable = quote(table)
+
+            # 1. ONE pass over the table for all per-column aggregates
+            aggregates = ["COUNT(*)"]
+            for col in columns:
+                qcol = quote(col["name"])
+                aggregates += [f"COUNT({qcol})", f"MIN({qcol})", f"MAX({qcol})", f"COUNT(DISTINCT {qcol})"]
+            row = conn.execute(text(f"SELECT {', '.join(aggregates)} FROM {qtable}")).fetchone()
+
+            row_count = row[0]
+            table_profile = {"row_count": row_count, "columns": []}
+
+            for i, col in enumerate(columns):
+                non_null, min_value, max_value, distinct = row[1 + i * 4: 5 + i * 4]
+                col_profile = {
+                    "name": col["name"],
+                    "type": str(col["type"]),
+                    "null_rate": round(1 - non_null / row_count, 4) if row_count else 0.0,
+                    "min": min_value,
+                    "max": max_value,
+                    "distinct": distinct,
+                }
+
+                # 2. Record the value set of low-cardinality columns (most frequent first)
+                if 0 < distinct <= LOW_CARDINALITY:
+                    qcol = quote(col["name"])
+                    values = conn.execute(text(
+                        f"SELECT {qcol} FROM {qtable} WHERE {qcol} IS NOT NULL "
+                        f"GROUP BY {qcol} ORDER BY COUNT(*) DESC"
+                    )).fetchall()
+                    col_profile["values"] = [v[0] for v in values]
+
+                table_profile["columns"].append(col_profile)
+
+            profile["tables"][table] = table_profile
+
+    return profile
+
+def format_profile_digest(profile):
+    """
+    Renders a profile as a compact, prompt-friendly text digest.
+    """
+    lines = []
+    hint = DIALECT_HINTS.get(profile.get("dialect"))
+    if hint:
+        lines.append(f"SQL dialect: {hint}")
+    for table, info in profile["tables"].items():
+        lines.append(f'Table "{table}" ({info["row_count"]} rows):')
+        for col in info["columns"]:
+            details = [col["type"]]
+
+            if "values" in col and not _is_numeric(col["type"]):
+                details.append("values: " + ", ".join(repr(v) for v in col["values"]))
+            elif col["min"] is not None:
+                details.append(f"range {col['min']}..{col['max']}")
+                details.append(f"{col['distinct']} distinct")
+                if "values" in col:
+                    details.append("values: " + ", ".join(str(v) for v in sorted(col["values"])))
+
+            if col["null_rate"] > 0:
+                details.append(f"{col['null_rate']:.1%} null")
+
+            lines.append(f'- "{col["name"]}": ' + "; ".join(details))
+    return "\n".join(lines)
+
+def _cache_path(fingerprint):
+    """
+    Maps a database fingerprint to its profile cache file.
+    """
+    digest = hashlib.sha1(f"{PROFILE_VERSION}:{fingerprint}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"schema_profile_{digest}.json")
+
+def load_or_build_profile(db, uri):
+    """
+    Returns the database profile, reading it from the on-disk cache when the
+    database file is unchanged and rebuilding (and re-caching) it otherwise.
+    """
+    fingerprint = database_fingerprint(uri)
+    path = _cache_path(fingerprint) if fingerprint else None
+
+    # 1. Reuse the cached profile if the database file has not changed
+    if path and os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass  # Corrupted cache file: fall through and rebuild it
+
+    # 2. Profile the database and persist the result
+    profile = profile_database(db)
+    if path:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(profile, f, default=str)
+        os.replace(tmp_path, path)
+    return profile
+
+@st.cache_resource(show_spinner=False)
+def _cached_digest(uri, fingerprint, _db):
+    """
+    Process-level cache of the digest, keyed by URI and file fingerprint.
+    """
+    return format_profile_digest(load_or_build_profile(_db, uri))
+
+def get_schema_digest(db, uri):
+    """
+    Returns the compact schema/column-profile digest injected into the agent's prompt.
+    Computed once per database version; a changed file produces a fresh profile.
+    """
+    return _cached_digest(uri, database_fingerprint(uri), db)
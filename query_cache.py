@@ -0,0 +1,192 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+import streamlit as st
+from database import database_file_path, local_database_path
+from sql_tools import tokenize_sql
+
+# LRU bounds of the process-wide result cache
+MAX_ENTRIES = 512
+MAX_BYTES = 32 * 1024 * 1024  # 32 MB of cached result text
+
+def normalize_sql(query):
+    """
+    Normalizes SQL text into a cache key.
+    Whitespace and comments are dropped and keywords/identifiers are upper-cased
+    (SQLite identifiers are case-insensitive); string literals are kept verbatim.
+    """
+    return " ".join(value.upper() if kind == "word" else value for kind, value in tokenize_sql(query))
+
+class DataVersionWatcher:
+    """
+    Detects changes to a SQLite database file.
+    - Every lookup: a cheap os.stat() of the database file and its WAL (no SQLite call).
+    - On cache misses: 'PRAGMA data_version' on a dedicated connection, which
+      changes whenever ANY other connection commits to the file.
+    With 'pragma=False' (DuckDB files, which are replaced rather than written in place)
+    only the os.stat() check is used.
+    """
+
+    def __init__(self, path, pragma=True):
+        self.path = path
+        self.pragma = pragma
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def file_version(self):
+        """
+        Returns (mtime, size) of the database file and its '-wal' companion.
+        """
+        version = []
+        for path in (self.path, self.path + "-wal"):
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                version.append(None)
+        return tuple(version)
+
+    def data_version(self):
+        """
+        Returns SQLite's 'PRAGMA data_version' as seen by the watcher's own connection
+        (None when the pragma check is off).
+        """
+        if not self.pragma:
+            return None
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+class QueryCache:
+    """
+    Thread-safe LRU cache of 'sql_db_query' results, shared by every session.
+    Bounded by entry count AND total bytes, and invalidated automatically when
+    the underlying database changes.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (db_key, normalized_sql) -> (result, size)
+        self._versions = {}  # db_key -> (file_version, data_version)
+        self._watchers = {}  # db_key -> DataVersionWatcher
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _watcher(self, db):
+        """
+        Returns the change watcher of a database, or None if it is not a local SQLite / DuckDB file.
+        """
+        db_key = str(db._engine.url)
+        with self._lock:
+            if db_key not in self._watchers:
+                path = local_database_path(db_key)
+                self._watchers[db_key] = DataVersionWatcher(path, pragma=database_file_path(db_key) is not None) if path else None
+            return self._watchers[db_key]
+
+    def _invalidate(self, db_key):
+        """
+        Drops every cached result of one database (caller holds the lock).
+        """
+        stale = [key for key in self._entries if key[0] == db_key]
+        for key in stale:
+            _, size = self._entries.pop(key)
+            self._bytes -= size
+        if stale:
+            self.invalidations += 1
+
+    def _check_version(self, db_key, file_version, data_version=None):
+        """
+        Invalidates a database's entries if its version moved (caller holds the lock).
+        """
+        known = self._versions.get(db_key)
+        if known is not None:
+            file_changed = known[0] != file_version
+            data_changed = data_version is not None and known[1] is not None and known[1] != data_version
+            if file_changed or data_changed:
+                self._invalidate(db_key)
+        previous_data_version = known[1] if known else None
+        self._versions[db_key] = (file_version, data_version if data_version is not None else previous_data_version)
+
+    def get(self, db, query):
+        """
+        Returns the cached result of a query, or None on a miss.
+        A hit costs one dictionary lookup plus an os.stat(); SQLite is never touched.
+        """
+        watcher = self._watcher(db)
+        if watcher is None:
+            # Non-file databases cannot be watched for changes, so they are never cached
+            return None
+
+        db_key = str(db._engine.url)
+        key = (db_key, normalize_sql(query))
+        file_version = watcher.file_version()
+
+        with self._lock:
+            self._check_version(db_key, file_version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Miss: we are about to hit SQLite anyway, so also confirm 'PRAGMA data_version'
+        data_version = watcher.data_version()
+        with self._lock:
+            self._check_version(db_key, file_version, data_version)
+        return None
+
+    def put(self, db, query, result):
+        """
+        Stores a successful query result, evicting least-recently-used entries
+        until both the entry and byte budgets are respected.
+        """
+        if self._watcher(db) is None:
+            return
+
+        size = len(repr(result).encode("utf-8"))
+        if size > self.max_bytes:
+            return  # Never let a single huge result flush the whole cache
+
+        key = (str(db._engine.url), normalize_sql(query))
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Returns a snapshot of the cache's size and hit/miss/eviction counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+@st.cache_resource(show_spinner=False)
+def get_query_cache():
+    """
+    Returns the process-wide query result cache shared by every session.
+    """
+    return QueryCache()
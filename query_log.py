@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import streamlit as st
+from paths import CACHE_DIR
+from query_cache import normalize_sql
+from sql_tools import explain_query_plan
+
+logger = logging.getLogger("insightsql")
+
+# Where executed 'sql_db_query' statements are logged, shared by every database
+LOG_PATH = os.path.join(CACHE_DIR, "query_log.db")
+
+# Statements kept per database; the oldest ones are pruned first
+MAX_LOG_ROWS = 50_000
+
+# Statements waiting for the background writer; past this, new ones are dropped (and counted)
+MAX_PENDING = 1000
+
+class QueryLog:
+    """
+    Persistent log of the statements run by 'sql_db_query': SQL, duration, row count,
+    status, and the EXPLAIN QUERY PLAN lines (read by index_advisor.py).
+    - 'record' only enqueues the statement, so the agent never waits for the log.
+    - A background thread computes the plan on the shared engine and writes to SQLite (LOG_PATH).
+    Thread-safe.
+    """
+
+    def __init__(self, path=LOG_PATH, max_rows=MAX_LOG_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._queue = queue.Queue(maxsize=MAX_PENDING)
+        self._lock = threading.Lock()
+
+        self.logged = 0
+        self.dropped = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS queries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    db_key TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    normalized_sql TEXT NOT NULL,
+                    duration_ms REAL NOT NULL,
+                    row_count INTEGER,
+                    status TEXT NOT NULL,
+                    plan TEXT,
+                    created REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS queries_db_created ON queries (db_key, created)")
+
+        self._writer = threading.Thread(target=self._write_loop, name="insightsql-query-log", daemon=True)
+        self._writer.start()
+
+    def record(self, db, query, duration_ms, row_count=None, status="ok"):
+        """
+        Queues one executed statement ("ok" or "timeout") for logging. Never blocks.
+        """
+        try:
+            self._queue.put_nowait((db, query, duration_ms, row_count, status, time.time()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            db, query, duration_ms, row_count, status, created = self._queue.get()
+            try:
+                self._write(db, query, duration_ms, row_count, status, created)
+            except Exception:
+                logger.exception("Could not log a query")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, db, query, duration_ms, row_count, status, created):
+        try:
+            plan = explain_query_plan(db, query)
+        except Exception:
+            plan = None  # E.g., the schema changed since the statement ran
+        db_key = str(db._engine.url)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO queries (db_key, sql, normalized_sql, duration_ms, row_count, status, plan, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (db_key, query, normalize_sql(query), duration_ms, row_count, status,
+                     json.dumps(plan) if plan is not None else None, created)
+                )
+                self.logged += 1
+                if self.logged % 1000 == 0:
+                    self._prune(db_key)
+
+    def _prune(self, db_key):
+        """
+        Keeps the newest 'max_rows' statements of a database (caller holds the lock).
+        """
+        self._conn.execute(
+            "DELETE FROM queries WHERE db_key = ? AND id <= ("
+            "SELECT id FROM queries WHERE db_key = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (db_key, db_key, self.max_rows)
+        )
+
+    def flush(self):
+        """
+        Waits until every queued statement is written.
+        """
+        self._queue.join()
+
+    def entries(self, db_key, since=None):
+        """
+        Returns the logged statements of a database (oldest first), optionally only
+        those logged after the 'since' timestamp. 'plan' is a list of lines, or None.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sql, normalized_sql, duration_ms, row_count, status, plan, created FROM queries "
+                "WHERE db_key = ? AND created >= ? ORDER BY id",
+                (db_key, since or 0.0)
+            ).fetchall()
+        keys = ("sql", "normalized_sql", "duration_ms", "row_count", "status", "plan", "created")
+        entries = [dict(zip(keys, row)) for row in rows]
+        for entry in entries:
+            entry["plan"] = json.loads(entry["plan"]) if entry["plan"] else None
+        return entries
+
+    def clear(self, db_key):
+        """
+        Forgets every logged statement of a database.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM queries WHERE db_key = ?", (db_key,))
+
+    def stats(self):
+        """
+        Returns the number of statements logged (and dropped) by this process.
+        """
+        with self._lock:
+            return {"logged": self.logged, "pending": self._queue.qsize(), "dropped": self.dropped}
+
+@st.cache_resource(show_spinner=False)
+def get_query_log():
+    """
+    Returns the process-wide query log shared by every session.
+    """
+    return QueryLog()
@@ -0,0 +1,412 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import numpy as np
+import streamlit as st
+from sqlalchemy import inspect
+from langchain_core.callbacks import BaseCallbackHandler
+from paths import CACHE_DIR
+from sql_tools import clean_sql
+from tool_calling import tool_input_text
+
+# Where answered questions (question -> final SQL) are persisted, shared by every database
+INDEX_PATH = os.path.join(CACHE_DIR, "question_index.db")
+
+# Dimensions of the hashed feature space (collisions are rare at a few thousand questions)
+VECTOR_DIM = 2048
+
+# Examples kept per database; the least recently used ones are evicted first
+MAX_EXAMPLES = 1000
+
+# Past questions injected into the prompt as few-shot examples, and the minimum cosine similarity to qualify
+FEW_SHOT_K = 3
+FEW_SHOT_MIN_SIMILARITY = 0.35
+
+# Above this similarity (and with the same content words) a past question counts as a repeat:
+# its SQL is executed directly and the result handed to the agent
+DIRECT_HIT_SIMILARITY = 0.9
+
+# Function words (English + Indonesian) ignored when deciding whether two questions are the same
+STOPWORDS = frozenset("""
+a an the of in on at to for by with and or is are was were be what which who how many much
+do does did there me show list give tell please can you i my all per
+apa yang berapa ada di ke dari dan atau untuk dengan itu ini saya tolong tampilkan semua per
+""".split())
+
+# Answers that mean the agent gave up, never worth remembering
+_GAVE_UP = ("Agent stopped",)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def _words(question):
+    return _WORD_RE.findall(question.lower())
+
+def question_key(question):
+    """
+    Normalized question text used to deduplicate examples (case, punctuation, and spacing ignored).
+    """
+    return " ".join(_words(question))
+
+def content_words(question):
+    """
+    The set of words of a question that carry meaning (function words dropped).
+    """
+    return frozenset(word for word in _words(question) if word not in STOPWORDS)
+
+def _features(question):
+    """
+    Yields the features of a question: words, word bigrams, and character
+    trigrams of each word (so "dress" still matches "dresses").
+    """
+    words = _words(question)
+    for word in words:
+        yield "w:" + word
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            yield "c:" + padded[i:i + 3]
+    for first, second in zip(words, words[1:]):
+        yield f"b:{first} {second}"
+
+def hash_vector(question, dim=VECTOR_DIM):
+    """
+    Hashing-trick term frequencies of a question (sublinear: 1 + log(count)).
+    crc32 is stable across processes, unlike Python's salted hash().
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in _features(question):
+        vector[zlib.crc32(feature.encode("utf-8")) % dim] += 1.0
+    nonzero = vector > 0
+    vector[nonzero] = 1.0 + np.log(vector[nonzero])
+    return vector
+
+def schema_fingerprint(db):
+    """
+    Hash of every usable table's column names and types. Changes when the schema
+    changes (a stored SQL may no longer run), but not when rows are added.
+    """
+    inspector = inspect(db._engine)
+    schema = {
+        table: [(col["name"], str(col["type"])) for col in inspector.get_columns(table)]
+        for table in sorted(db.get_usable_table_names())
+    }
+    return hashlib.sha1(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+
+def result_fingerprint(result_text):
+    """
+    Short hash of a query result, recorded with the example to see when its data changed.
+    """
+    return hashlib.sha1(result_text.encode("utf-8")).hexdigest()[:16]
+
+class Retrieval:
+    """
+    What the index found for a new question: few-shot 'examples' (dicts with question,
+    sql, similarity), and for a repeat question the 'direct_hit' example with its
+    freshly executed 'result'. 'prompt_text' is what goes into the agent's prompt.
+    """
+
+    def __init__(self, examples=(), direct_hit=None, result=None):
+        self.examples = list(examples)
+        self.direct_hit = direct_hit
+        self.result = result
+
+    @property
+    def prompt_text(self):
+        if self.direct_hit is not None:
+            return (
+                "PRE-EXECUTED QUERY (this question was answered before with the SQL below; it was just run again):\n"
+                f"SQL: {self.direct_hit['sql']}\n"
+                f"Result:\n{self.result}\n"
+                "If this result answers the question, give the Final Answer right away without calling any tool."
+            )
+        if not self.examples:
+            return ""
+        lines = ["VERIFIED EXAMPLES (past questions on this database and the SQL that answered them; adapt them when they fit):"]
+        for example in self.examples:
+            lines.append(f"- Question: {example['question']}\n  SQL: {example['sql']}")
+        return "\n".join(lines)
+
+    def summary(self):
+        """
+        Compact description for events and logs.
+        """
+        return {
+            "examples": len(self.examples),
+            "direct_hit": self.direct_hit is not None,
+            "similarity": self.examples[0]["similarity"] if self.examples else None,
+        }
+
+class QuestionIndex:
+    """
+    Persistent, CPU-only similarity index of the questions answered on ONE database.
+    - Each example is a question, the last successful SQL of its run, and a fingerprint of its result.
+    - Questions are embedded as TF-IDF weighted hashing vectors (NumPy), and a lookup
+      is one matrix-vector product over all examples.
+    - Examples are stored in SQLite (INDEX_PATH), bounded by MAX_EXAMPLES (LRU), and
+      dropped when the database's schema fingerprint changes.
+    Thread-safe.
+    """
+
+    def __init__(self, db_key, schema_version, path=INDEX_PATH, max_examples=MAX_EXAMPLES):
+        self.db_key = db_key
+        self.schema_version = schema_version
+        self.path = path
+        self.max_examples = max_examples
+        self._examples = []  # dicts, row-aligned with self._tf
+        self._tf = np.zeros((0, VECTOR_DIM), dtype=np.float32)
+        self._matrix = None  # TF-IDF rows, L2-normalized (rebuilt lazily after changes)
+        self._idf = None
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.few_shot = 0
+        self.direct_hits = 0
+        self.invalidated = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS examples (
+                    db_key TEXT NOT NULL,
+                    question_key TEXT NOT NULL,
+                    schema_version TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    result_fingerprint TEXT,
+                    successes INTEGER NOT NULL DEFAULT 1,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (db_key, question_key)
+                )
+            """)
+            # Schema changed since these were recorded: their SQL may reference columns that are gone
+            self.invalidated = self._conn.execute(
+                "DELETE FROM examples WHERE db_key = ? AND schema_version != ?", (db_key, schema_version)
+            ).rowcount
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT question_key, question, sql, result_fingerprint, successes, hits, last_used "
+            "FROM examples WHERE db_key = ? ORDER BY last_used DESC LIMIT ?",
+            (self.db_key, self.max_examples)
+        ).fetchall()
+        keys = ("question_key", "question", "sql", "result_fingerprint", "successes", "hits", "last_used")
+        self._examples = [dict(zip(keys, row)) for row in rows]
+        if self._examples:
+            self._tf = np.vstack([hash_vector(e["question"]) for e in self._examples])
+        self._matrix = None
+
+    def _build(self):
+        """
+        Recomputes IDF weights and the normalized example matrix (caller holds the lock).
+        """
+        n = len(self._examples)
+        document_frequency = np.count_nonzero(self._tf, axis=0)
+        self._idf = (np.log((1 + n) / (1 + document_frequency)) + 1.0).astype(np.float32)
+        matrix = self._tf * self._idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._matrix = matrix / np.maximum(norms, 1e-12)
+
+    def search(self, question, k=FEW_SHOT_K, min_similarity=FEW_SHOT_MIN_SIMILARITY):
+        """
+        Returns up to 'k' past examples most similar to 'question', best first,
+        each with its cosine 'similarity'.
+        """
+        with self._lock:
+            if not self._examples:
+                return []
+            if self._matrix is None:
+                self._build()
+            query = hash_vector(question) * self._idf
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                return []
+            similarities = self._matrix @ (query / norm)
+            k = min(k, len(similarities))
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top])]
+            return [
+                {**self._examples[i], "similarity": round(float(similarities[i]), 4)}
+                for i in top if similarities[i] >= min_similarity
+            ]
+
+    def retrieve(self, question, run_query=None):
+        """
+        Looks up a new question. If the best match is a repeat (similarity above
+        DIRECT_HIT_SIMILARITY and the same content words) and 'run_query' is given,
+        its SQL is executed right away with 'run_query(sql) -> str'; a failing SQL
+        is forgotten and the remaining examples are used as few-shot examples instead.
+        """
+        examples = self.search(question)
+        with self._lock:
+            self.lookups += 1
+        if not examples:
+            return Retrieval()
+
+        best = examples[0]
+        if run_query is not None and best["similarity"] >= DIRECT_HIT_SIMILARITY and content_words(best["question"]) == content_words(question):
+            result = run_query(best["sql"])
+            if result.startswith("Error"):
+                self.forget(best["question"])
+                examples = examples[1:]
+            else:
+                self._touch(best, hit=True)
+                with self._lock:
+                    self.direct_hits += 1
+                return Retrieval(examples, direct_hit=best, result=result)
+
+        if examples:
+            with self._lock:
+                self.few_shot += 1
+        return Retrieval(examples)
+
+    def _touch(self, example, hit=False):
+        now = time.time()
+        with self._lock:
+            for entry in self._examples:
+                if entry["question_key"] == example["question_key"]:
+                    entry["last_used"] = now
+                    entry["hits"] += 1 if hit else 0
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE examples SET last_used = ?, hits = hits + ? WHERE db_key = ? AND question_key = ?",
+                    (now, 1 if hit else 0, self.db_key, example["question_key"])
+                )
+
+    def add(self, question, sql, result_text):
+        """
+        Records a successful run. Asking the same question again replaces its SQL
+        with the latest one; past MAX_EXAMPLES the least recently used example is evicted.
+        """
+        key = question_key(question)
+        if not key:
+            return
+        sql = clean_sql(sql)
+        fingerprint = result_fingerprint(result_text)
+        now = time.time()
+
+        with self._lock:
+            index = next((i for i, e in enumerate(self._examples) if e["question_key"] == key), None)
+            if index is not None:
+                entry = self._examples[index]
+                entry.update(question=question, sql=sql, result_fingerprint=fingerprint, last_used=now)
+                entry["successes"] += 1
+                self._tf[index] = hash_vector(question)
+            else:
+                entry = {"question_key": key, "question": question, "sql": sql, "result_fingerprint": fingerprint,
+                         "successes": 1, "hits": 0, "last_used": now}
+                self._examples.append(entry)
+                self._tf = np.vstack([self._tf, hash_vector(question)[np.newaxis, :]])
+
+            evicted = []
+            while len(self._examples) > self.max_examples:
+                oldest = min(range(len(self._examples)), key=lambda i: self._examples[i]["last_used"])
+                evicted.append(self._examples.pop(oldest)["question_key"])
+                self._tf = np.delete(self._tf, oldest, axis=0)
+            self._matrix = None
+
+            with self._conn:
+                self._conn.execute(
+                    """
+                    INSERT INTO examples (db_key, question_key, schema_version, question, sql, result_fingerprint, created, last_used)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (db_key, question_key) DO UPDATE SET
+                        schema_version = excluded.schema_version, question = excluded.question, sql = excluded.sql,
+                        result_fingerprint = excluded.result_fingerprint, successes = successes + 1, last_used = excluded.last_used
+                    """,
+                    (self.db_key, key, self.schema_version, question, sql, fingerprint, now, now)
+                )
+                self._conn.executemany(
+                    "DELETE FROM examples WHERE db_key = ? AND question_key = ?",
+                    [(self.db_key, evicted_key) for evicted_key in evicted]
+                )
+
+    def forget(self, question):
+        """
+        Drops the example of a question (e.g., its SQL stopped working).
+        """
+        key = question_key(question)
+        with self._lock:
+            index = next((i for i, e in enumerate(self._examples) if e["question_key"] == key), None)
+            if index is not None:
+                self._examples.pop(index)
+                self._tf = np.delete(self._tf, index, axis=0)
+                self._matrix = None
+            with self._conn:
+                self._conn.execute("DELETE FROM examples WHERE db_key = ? AND question_key = ?", (self.db_key, key))
+
+    def clear(self):
+        """
+        Forgets every example of this database.
+        """
+        with self._lock:
+            self._examples = []
+            self._tf = np.zeros((0, VECTOR_DIM), dtype=np.float32)
+            self._matrix = None
+            with self._conn:
+                self._conn.execute("DELETE FROM examples WHERE db_key = ?", (self.db_key,))
+
+    def stats(self):
+        """
+        Returns a snapshot of the index's size and lookup counters.
+        """
+        with self._lock:
+            return {
+                "examples": len(self._examples),
+                "lookups": self.lookups,
+                "few_shot": self.few_shot,
+                "direct_hits": self.direct_hits,
+                "invalidated": self.invalidated,
+            }
+
+class ExampleRecorder(BaseCallbackHandler):
+    """
+    Remembers the last 'sql_db_query' call of a run that returned rows instead of
+    an error, so a successful run can be added to the index afterwards.
+    """
+
+    def __init__(self):
+        self.sql = None
+        self.result = None
+        self._inputs = {}  # run_id -> SQL of an open query tool call
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        if name == "sql_db_query":
+            self._inputs[run_id] = tool_input_text(kwargs.get("inputs") or input_str)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        sql = self._inputs.pop(run_id, None)
+        output = str(output)
+        if sql is not None and not output.startswith("Error"):
+            self.sql, self.result = sql, output
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._inputs.pop(run_id, None)
+
+    def record(self, index, question, answer, retrieval=None):
+        """
+        Adds the run to 'index' if it answered with SQL. A direct hit that was answered
+        without a new query counts as another success of the reused SQL.
+        """
+        if not answer or answer.startswith(_GAVE_UP):
+            return
+        if self.sql is not None:
+            index.add(question, self.sql, self.result)
+        elif retrieval is not None and retrieval.direct_hit is not None:
+            index.add(question, retrieval.direct_hit["sql"], retrieval.result)
+
+@st.cache_resource(show_spinner=False)
+def get_question_index(db_key, schema_version):
+    """
+    Returns the process-wide question index of one database (per schema version,
+    so a schema change starts from a clean index).
+    """
+    return QuestionIndex(db_key, schema_version)
@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+import streamlit as st
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.rate_limiters import BaseRateLimiter
+# Import the active run's cancellation token, so waiting for quota never outlives a Stop
+from cancellation import current_run_control
+
+logger = logging.getLogger("insightsql")
+
+# Gemini free tier for 'gemini-2.5-flash': requests per minute, per API key
+GEMINI_RPM = 10
+
+# Requests that may go out back to back after an idle period
+GEMINI_BURST = 3
+
+# Retries of ONE model call after a 429 / "resource exhausted" / 503 answer
+MAX_RATE_LIMIT_RETRIES = 5
+
+# Exponential backoff bounds (seconds) when the API gives no retry hint
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+
+# Granularity of the waits, so a cancelled run stops waiting quickly
+_WAIT_STEP = 0.25
+
+# "Please retry in 13.5s" / "retry_delay { seconds: 13 }" hints in Gemini errors
+_RETRY_HINT = re.compile(r"retry(?:[ _]in|_delay\s*\{\s*seconds:)\s*([\d.]+)", re.I)
+
+def _error_chain(error):
+    """
+    Yields an exception and every exception it was raised from / during.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+def is_rate_limit_error(error):
+    """
+    True if an exception (or anything it wraps) is a quota / rate-limit rejection:
+    an HTTP 429 status or Google's ResourceExhausted / TooManyRequests type. The message
+    is never matched, so an unrelated error that mentions "quota" is not retried.
+    """
+    for e in _error_chain(error):
+        if 429 in (getattr(e, "code", None), getattr(e, "status_code", None)):
+            return True
+        if type(e).__name__ in ("ResourceExhausted", "TooManyRequests"):
+            return True
+    return False
+
+def is_unavailable_error(error):
+    """
+    True if the model was temporarily unavailable (HTTP 503, "model is overloaded").
+    """
+    for e in _error_chain(error):
+        if getattr(e, "code", None) == 503 or type(e).__name__ == "ServiceUnavailable":
+            return True
+    return False
+
+def retry_delay(error, attempt):
+    """
+    Seconds to wait before retry number 'attempt' (1-based): the API's own hint
+    if it sent one, otherwise exponential backoff with jitter.
+    """
+    for e in _error_chain(error):
+        hint = getattr(e, "retry_after", None)
+        if hint:
+            return min(float(hint), BACKOFF_MAX)
+        match = _RETRY_HINT.search(str(e))
+        if match:
+            return min(float(match.group(1)), BACKOFF_MAX)
+    delay = min(BACKOFF_BASE ** attempt, BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+class TokenBucketRateLimiter(BaseRateLimiter):
+    """
+    Process-wide token bucket shared by every caller of one API key.
+    - 'acquire' / 'aacquire' take one token (one model request), waiting if needed.
+    - 'backoff' is called when the API still answered 429: the bucket is emptied and
+      ALL callers pause, instead of each retrying on its own and hitting the quota again.
+    Thread-safe, and usable from sync and async code at the same time.
+    """
+
+    def __init__(self, requests_per_minute=GEMINI_RPM, burst=GEMINI_BURST):
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.backoffs = 0
+        self.wait_time = 0.0
+
+    def _try_take(self):
+        """
+        Takes a token if one is available. Returns 0.0 on success, otherwise the
+        seconds until the next attempt may succeed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.acquired += 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def set_rate(self, requests_per_minute, burst=GEMINI_BURST):
+        """
+        Changes the quota of the bucket in place; tokens earned so far are kept.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._paused_until:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            changed = (self.rate, self.burst) != (requests_per_minute / 60.0, max(1, burst))
+            self.rate = requests_per_minute / 60.0
+            self.burst = max(1, burst)
+            self._tokens = min(self._tokens, float(self.burst))
+        if changed:
+            logger.info("Gemini rate limit set to %s requests/min (burst %d)", requests_per_minute, self.burst)
+
+    def _check_cancelled(self):
+        control = current_run_control()
+        if control is not None:
+            control.check()
+
+    def acquire(self, *, blocking=True):
+        started = time.monotonic()
+        while True:
+            wait = self._try_take()
+            if wait == 0.0:
+                break
+            if not blocking:
+                return False
+            self._check_cancelled()
+            time.sleep(min(wait, _WAIT_STEP))
+        with self._lock:
+            self.wait_time += time.monotonic() - started
+        return True
+
+    async def aacquire(self, *, blocking=True):
+        started = time.monotonic()
+        while True:
+            wait = self._try_take()
+            if wait == 0.0:
+                break
+            if not blocking:
+                return False
+            self._check_cancelled()
+            await asyncio.sleep(min(wait, _WAIT_STEP))
+        with self._lock:
+            self.wait_time += time.monotonic() - started
+        return True
+
+    def backoff(self, delay):
+        """
+        Pauses every caller for 'delay' seconds and drains the bucket.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+            self.backoffs += 1
+        logger.warning("Gemini rate limit hit: pausing all requests for %.1fs", delay)
+
+    def stats(self):
+        """
+        Returns a snapshot of the limiter's counters.
+        """
+        with self._lock:
+            return {
+                "requests_per_minute": round(self.rate * 60, 2),
+                "acquired": self.acquired,
+                "backoffs": self.backoffs,
+                "wait_time_s": round(self.wait_time, 2),
+                "paused": time.monotonic() < self._paused_until,
+            }
+
+def should_retry(error, attempt):
+    """
+    True if a failed model request (retry number 'attempt', 1-based) is worth retrying.
+    """
+    return attempt <= MAX_RATE_LIMIT_RETRIES and (is_rate_limit_error(error) or is_unavailable_error(error))
+
+class RateLimitedChatMixin:
+    """
+    Mixin for chat models: every request (sync, async, streamed) first takes a token
+    from 'self.quota_limiter', and rate-limit / overload errors are retried after a
+    shared pause. A stream is only retried if it failed before its first chunk.
+    The concrete class declares the 'quota_limiter' field (None = no limiting).
+    """
+
+    def _async_limiter(self, name):
+        """
+        The limiter to use in an async method, or None when the model has no native
+        async implementation (LangChain then runs the sync method, which is already limited).
+        """
+        for klass in type(self).__mro__[type(self).__mro__.index(RateLimitedChatMixin) + 1:]:
+            if name in klass.__dict__:
+                return None if klass is BaseChatModel else self.quota_limiter
+        return None
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        attempt = 0
+        while True:
+            if self.quota_limiter is not None:
+                self.quota_limiter.acquire()
+            try:
+                return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                attempt += 1
+                if self.quota_limiter is None or not should_retry(e, attempt):
+                    raise
+                self.quota_limiter.backoff(retry_delay(e, attempt))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter = self._async_limiter("_agenerate")
+        attempt = 0
+        while True:
+            if limiter is not None:
+                await limiter.aacquire()
+            try:
+                return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                attempt += 1
+                if limiter is None or not should_retry(e, attempt):
+                    raise
+                limiter.backoff(retry_delay(e, attempt))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        attempt = 0
+        while True:
+            if self.quota_limiter is not None:
+                self.quota_limiter.acquire()
+            started = False
+            try:
+                for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                attempt += 1
+                if started or self.quota_limiter is None or not should_retry(e, attempt):
+                    raise
+                self.quota_limiter.backoff(retry_delay(e, attempt))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter = self._async_limiter("_astream")
+        attempt = 0
+        while True:
+            if limiter is not None:
+                await limiter.aacquire()
+            started = False
+            try:
+                async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                attempt += 1
+                if started or limiter is None or not should_retry(e, attempt):
+                    raise
+                limiter.backoff(retry_delay(e, attempt))
+
+@st.cache_resource(show_spinner=False)
+def _key_limiter(google_api_key):
+    return TokenBucketRateLimiter()
+
+def get_rate_limiter(google_api_key, requests_per_minute=GEMINI_RPM, burst=GEMINI_BURST):
+    """
+    Returns the limiter shared by every session and batch worker using the same API key
+    (Gemini quotas are per key, not per session). There is one bucket per key whatever
+    rate callers ask for: the latest 'requests_per_minute' / 'burst' apply to all of them.
+    """
+    limiter = _key_limiter(google_api_key)
+    limiter.set_rate(requests_per_minute, burst)
+    return limiter
@@ -0,0 +1,124 @@
+import json
+import os
+import re
+import time
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Recorded ReAct transcripts replayed by the benchmark (one entry per question)
+TRANSCRIPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "transcripts.json")
+
+# The ReAct prompt ends with "New input: {input}" followed by the scratchpad
+_QUESTION_PATTERN = re.compile(r"New input: (.*?)\n", re.S)
+
+# A recorded ReAct step that calls a tool, and the marker of a recorded answer
+_ACTION_PATTERN = re.compile(r"Action:\s*(.*?)\s*\nAction Input:\s*(.*)", re.S)
+_FINAL_ANSWER = "Final Answer:"
+
+def load_transcripts(path=TRANSCRIPTS_PATH):
+    """
+    Loads the recorded transcripts: a list of {"question": ..., "steps": [...]} where
+    every step is the exact text the model produced for that ReAct iteration.
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatGoogleGenerativeAI that replays recorded ReAct transcripts.
+    The question is read from the rendered prompt ("New input: ...") and the step from
+    the number of observations already in the scratchpad, so the real agent, tools,
+    output parser, memory, and callbacks run exactly as in the app.
+    'latency' (seconds) is slept per call to simulate the network when wanted;
+    tokens are streamed word by word so streaming callbacks are exercised too.
+    With tools bound ('bind_tools', the function-calling agent) the same transcripts
+    are replayed as structured tool calls and plain-text answers.
+    """
+
+    transcripts: list
+    latency: float = 0.0
+    fallback_answer: str = "Thought: Do I need to use a tool? No\nFinal Answer: I could not find a recorded answer for this question."
+
+    @property
+    def _llm_type(self):
+        return "scripted-react"
+
+    def _steps_by_question(self):
+        return {entry["question"]: entry["steps"] for entry in self.transcripts}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _reply(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        match = None
+        for match in _QUESTION_PATTERN.finditer(prompt):
+            pass  # Keep the LAST "New input:" (the conversation history may quote older ones)
+        if match is None:
+            return self.fallback_answer
+
+        steps = self._steps_by_question().get(match.group(1).strip())
+        if not steps:
+            return self.fallback_answer
+        step = prompt[match.end():].count("\nObservation: ")
+        return steps[min(step, len(steps) - 1)]
+
+    def _tool_reply(self, messages, tools):
+        """
+        Replays a recorded step for the function-calling agent: returns (text, tool_calls).
+        The question is the last human message; the step is the number of tool-call turns so far.
+        """
+        question = next((str(m.content) for m in reversed(messages) if m.type == "human"), "")
+        steps = self._steps_by_question().get(question.strip()) or [self.fallback_answer]
+        step = steps[min(sum(1 for m in messages if isinstance(m, AIMessage) and m.tool_calls), len(steps) - 1)]
+
+        match = _ACTION_PATTERN.search(step)
+        if _FINAL_ANSWER in step or match is None:
+            return step.split(_FINAL_ANSWER, 1)[-1].strip(), []
+        name, tool_input = match.group(1).strip(), match.group(2).strip().strip('"')
+        # The recorded input becomes the tool's first argument ('query', 'table_names', ...)
+        schema = next((t["function"]["parameters"] for t in tools if t["function"]["name"] == name), {})
+        argument = next(iter(schema.get("properties") or {"tool_input": None}))
+        return "", [{"name": name, "args": {argument: tool_input}, "id": f"call_{len(messages)}_{name}"}]
+
+    def _usage(self, messages, text):
+        prompt_tokens = sum(_estimate_tokens(str(message.content)) for message in messages)
+        completion_tokens = _estimate_tokens(text)
+        return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        if self.latency:
+            time.sleep(self.latency)
+        if kwargs.get("tools"):
+            text, tool_calls = self._tool_reply(messages, kwargs["tools"])
+        else:
+            text, tool_calls = self._reply(messages), []
+        message = AIMessage(content=text, tool_calls=tool_calls, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        if self.latency:
+            time.sleep(self.latency)
+        if kwargs.get("tools"):
+            text, tool_calls = self._tool_reply(messages, kwargs["tools"])
+            if tool_calls:
+                # Gemini sends function calls as one complete chunk
+                chunks = [{"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i} for i, c in enumerate(tool_calls)]
+                yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=chunks, usage_metadata=self._usage(messages, "")))
+                return
+        else:
+            text = self._reply(messages)
+        words = re.findall(r"\S+\s*|\s+", text)
+        for index, word in enumerate(words):
+            # The usage is attached to the last chunk, as Gemini does
+            usage = self._usage(messages, text) if index == len(words) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import warnings
+from aiohttp import web
+from engine import InsightEngine, SessionNotFound, SessionBusy, EngineBusy, DEFAULT_WORKERS, MAX_QUEUED
+from database import DB_URI, DB_BACKEND
+from rate_limiter import GEMINI_RPM
+from agent import AGENT_MODES, DEFAULT_AGENT_MODE
+
+logger = logging.getLogger("insightsql")
+
+# Seconds a client should wait before retrying when the engine is saturated
+RETRY_AFTER = 5
+
+# The engine is stored on the aiohttp application under this key
+ENGINE_KEY = web.AppKey("engine", InsightEngine)
+
+def _json_error(status, message, **headers):
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+async def _read_json(request):
+    """
+    Returns the request body as a dict ('{}' for an empty body).
+    """
+    if not request.can_read_body:
+        return {}
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "body must be JSON"}), content_type="application/json")
+    return body if isinstance(body, dict) else {}
+
+async def create_session(request):
+    """
+    POST /sessions {"language": "English", "agent_mode": "react" | "tools"} -> {"session_id": ...}
+    """
+    body = await _read_json(request)
+    agent_mode = body.get("agent_mode", DEFAULT_AGENT_MODE)
+    if agent_mode not in AGENT_MODES:
+        return _json_error(400, f"'agent_mode' must be one of: {', '.join(AGENT_MODES)}")
+    # The engine persists sessions in SQLite: keep that I/O off the event loop
+    session = await asyncio.to_thread(
+        request.app[ENGINE_KEY].create_session, language=body.get("language", "English"), agent_mode=agent_mode
+    )
+    return web.json_response(
+        {"session_id": session.id, "language": session.language, "agent_mode": session.agent_mode}, status=201
+    )
+
+async def delete_session(request):
+    """
+    DELETE /sessions/{session_id}
+    """
+    await asyncio.to_thread(request.app[ENGINE_KEY].close_session, request.match_info["session_id"])
+    return web.Response(status=204)
+
+async def ask(request):
+    """
+    POST /sessions/{session_id}/questions {"question": ..., "language": ...}
+    Streams the run as Server-Sent Events: start, retrieval, step, observation, token,
+    answer_reset, answer | cancelled | error, and finally done (with the timing trace).
+    Disconnecting cancels the question.
+    """
+    engine = request.app[ENGINE_KEY]
+    body = await _read_json(request)
+    question = (body.get("question") or "").strip()
+    if not question:
+        return _json_error(400, "'question' is required")
+
+    try:
+        # A session that is not in memory is resumed from the session store first
+        run = await asyncio.to_thread(engine.submit, request.match_info["session_id"], question, language=body.get("language"))
+    except SessionNotFound:
+        return _json_error(404, "session not found")
+    except SessionBusy:
+        return _json_error(409, "this session is already answering a question")
+    except EngineBusy:
+        return _json_error(503, "the engine is at capacity, retry later", **{"Retry-After": str(RETRY_AFTER)})
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        # Tell reverse proxies (nginx) not to buffer the stream
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+    try:
+        async for event in run.events():
+            data = json.dumps(event, ensure_ascii=False, default=str)
+            await response.write(f"event: {event['event']}\ndata: {data}\n\n".encode("utf-8"))
+    except ConnectionResetError:
+        # The client went away mid-write: an ordinary disconnect, not a server error
+        run.cancel("client disconnected")
+        return response
+    except asyncio.CancelledError:
+        # The client went away (aiohttp cancels the handler): stop spending model quota on an answer nobody reads
+        run.cancel("client disconnected")
+        raise
+    return response
+
+async def cancel(request):
+    """
+    POST /sessions/{session_id}/cancel -> cancels the session's running question.
+    """
+    try:
+        session = await asyncio.to_thread(request.app[ENGINE_KEY].get_session, request.match_info["session_id"])
+    except SessionNotFound:
+        return _json_error(404, "session not found")
+    if not session.busy:
+        return web.json_response({"cancelled": False})
+    session.current_run.cancel("cancelled by client")
+    return web.json_response({"cancelled": True, "run_id": session.current_run.id})
+
+async def session_info(request):
+    """
+    GET /sessions/{session_id} -> language, agent mode, busy flag, memory stats, and the last question's timing.
+    """
+    try:
+        session = await asyncio.to_thread(request.app[ENGINE_KEY].get_session, request.match_info["session_id"])
+    except SessionNotFound:
+        return _json_error(404, "session not found")
+    return web.json_response({
+        "session_id": session.id,
+        "language": session.language,
+        "agent_mode": session.agent_mode,
+        "busy": session.busy,
+        "memory": session.memory.stats(),
+        "last_trace": session.last_trace,
+    }, dumps=lambda obj: json.dumps(obj, default=str))
+
+async def health(request):
+    """
+    GET /health -> sessions, worker pool, connection pool, and cache statistics.
+    """
+    stats = await asyncio.to_thread(request.app[ENGINE_KEY].stats)
+    return web.json_response(stats, dumps=lambda obj: json.dumps(obj, default=str))
+
+def create_app(engine):
+    """
+    Builds the aiohttp application around an engine.
+    """
+    app = web.Application()
+    app[ENGINE_KEY] = engine
+    app.router.add_post("/sessions", create_session)
+    app.router.add_get("/sessions/{session_id}", session_info)
+    app.router.add_delete("/sessions/{session_id}", delete_session)
+    app.router.add_post("/sessions/{session_id}/questions", ask)
+    app.router.add_post("/sessions/{session_id}/cancel", cancel)
+    app.router.add_get("/health", health)
+
+    async def _shutdown(app):
+        app[ENGINE_KEY].shutdown()
+
+    app.on_shutdown.append(_shutdown)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the InsightSQL agent over HTTP (JSON + Server-Sent Events).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Questions answered at the same time")
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED, help="Questions allowed to wait before new ones get HTTP 503")
+    parser.add_argument("--rpm", type=float, default=GEMINI_RPM, help="Gemini requests per minute allowed for this API key")
+    parser.add_argument("--db-uri", default=DB_URI, help="SQLAlchemy URI of the database (or Parquet files with --backend duckdb)")
+    parser.add_argument("--backend", choices=("sqlite", "duckdb"), default=DB_BACKEND,
+                        help="'duckdb' answers from a columnar DuckDB mirror of the database (needs duckdb + duckdb-engine)")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"), help="Google API key (default: $GOOGLE_API_KEY)")
+    parser.add_argument("--scripted", metavar="TRANSCRIPTS", default=None,
+                        help="Serve offline: replay recorded ReAct transcripts instead of calling Gemini")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    warnings.filterwarnings("ignore", message=".*deprecated.*")
+
+    llm = None
+    if args.scripted:
+        from scripted_llm import ScriptedChatModel, load_transcripts
+        llm = ScriptedChatModel(transcripts=load_transcripts(args.scripted))
+    elif not args.api_key:
+        parser.error("a Google API key is required (--api-key or $GOOGLE_API_KEY), or use --scripted")
+
+    engine = InsightEngine(
+        google_api_key=args.api_key, db_uri=args.db_uri, llm=llm,
+        max_workers=args.workers, max_queued=args.max_queued, requests_per_minute=args.rpm, backend=args.backend,
+        # Replayed transcripts must not seed the real question index, query log, or sessions
+        persist=not args.scripted
+    )
+    web.run_app(create_app(engine), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
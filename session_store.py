@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import streamlit as st
+from paths import CACHE_DIR
+
+# Where conversations are stored, shared by the app and the HTTP server
+STORE_PATH = os.path.join(CACHE_DIR, "sessions.db")
+
+# Sessions of offline runs (scripted model), kept apart from the real conversations
+OFFLINE_STORE_PATH = os.path.join(CACHE_DIR, "offline", "sessions.db")
+
+# Messages rendered per page of chat history (10 question / answer turns)
+PAGE_SIZE = 20
+
+# Conversations not used for this many seconds are deleted
+SESSION_RETENTION = 30 * 24 * 60 * 60
+
+class SessionStore:
+    """
+    Persistent conversations: their settings, messages (with the SQL each answer ran),
+    and a snapshot of the agent's memory (running summary + verbatim turns), so a
+    session resumes after a restart without re-summarizing its history.
+    - Messages are append-only; 'clear_display' only moves the point the chat is shown from.
+    - History is read a page at a time ('messages'), newest page first.
+    Thread-safe.
+    """
+
+    def __init__(self, path=STORE_PATH, retention=SESSION_RETENTION):
+        self.path = path
+        self.retention = retention
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    db_uri TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    agent_mode TEXT NOT NULL,
+                    display_from INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    sql TEXT,
+                    created REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS memory (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    snapshot TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS memory_session ON memory (session_id, id)")
+
+    # --- Sessions ---
+
+    def save_session(self, session_id, db_uri, language, agent_mode):
+        """
+        Registers a conversation, or updates its settings. Also drops expired conversations.
+        """
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO sessions (id, db_uri, language, agent_mode, created, updated) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET language = excluded.language, agent_mode = excluded.agent_mode, updated = excluded.updated",
+                    (session_id, db_uri, language, agent_mode, now, now)
+                )
+                self._prune(now)
+
+    def get_session(self, session_id):
+        """
+        Returns a conversation's settings (db_uri, language, agent_mode), or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT db_uri, language, agent_mode, created, updated FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("db_uri", "language", "agent_mode", "created", "updated"), row), id=session_id)
+
+    def delete_session(self, session_id):
+        """
+        Forgets a conversation: its messages and its memory.
+        """
+        with self._lock:
+            with self._conn:
+                self._delete(session_id)
+
+    def _delete(self, session_id):
+        for table, column in (("messages", "session_id"), ("memory", "session_id"), ("sessions", "id")):
+            self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (session_id,))
+
+    def _prune(self, now):
+        """
+        Deletes the conversations idle for longer than 'retention' (caller holds the lock).
+        """
+        expired = self._conn.execute("SELECT id FROM sessions WHERE updated < ?", (now - self.retention,)).fetchall()
+        for (session_id,) in expired:
+            self._delete(session_id)
+
+    # --- Messages ---
+
+    def append_message(self, session_id, role, content, sql=None):
+        """
+        Appends one chat message ("human" or "ai"); 'sql' lists the statements behind an answer.
+        Ignored once the conversation was deleted (e.g., a question finishing after a reset).
+        """
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO messages (session_id, role, content, sql, created) "
+                    "SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM sessions WHERE id = ?)",
+                    (session_id, role, content, json.dumps(sql) if sql else None, now, session_id)
+                )
+                self._conn.execute("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id))
+
+    def messages(self, session_id, limit=PAGE_SIZE):
+        """
+        Returns the newest 'limit' displayed messages (oldest first), and whether earlier ones exist.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT m.role, m.content, m.sql FROM messages m JOIN sessions s ON s.id = m.session_id "
+                "WHERE m.session_id = ? AND m.id > s.display_from ORDER BY m.id DESC LIMIT ?",
+                (session_id, limit + 1)
+            ).fetchall()
+        has_earlier = len(rows) > limit
+        messages = [
+            {"role": role, "content": content, "sql": json.loads(sql) if sql else []}
+            for role, content, sql in reversed(rows[:limit])
+        ]
+        return messages, has_earlier
+
+    def clear_display(self, session_id):
+        """
+        Hides the messages so far from the chat. They (and the memory) are kept.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE sessions SET display_from = (SELECT COALESCE(MAX(id), 0) FROM messages WHERE session_id = ?) WHERE id = ?",
+                    (session_id, session_id)
+                )
+
+    # --- Memory ---
+
+    def save_memory(self, session_id, snapshot):
+        """
+        Appends a snapshot of the agent's memory; older snapshots are superseded.
+        Ignored once the conversation was deleted (e.g., a summary finishing after a reset).
+        """
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "INSERT INTO memory (session_id, snapshot, created) "
+                    "SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM sessions WHERE id = ?)",
+                    (session_id, json.dumps(snapshot), time.time(), session_id)
+                )
+                if cursor.rowcount:
+                    self._conn.execute("DELETE FROM memory WHERE session_id = ? AND id < ?", (session_id, cursor.lastrowid))
+
+    def load_memory(self, session_id):
+        """
+        Returns the latest memory snapshot of a conversation, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT snapshot FROM memory WHERE session_id = ? ORDER BY id DESC LIMIT 1", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def stats(self):
+        """
+        Returns the number of stored conversations and messages.
+        """
+        with self._lock:
+            sessions = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            messages = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {"sessions": sessions, "messages": messages}
+
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    """
+    Returns the process-wide session store.
+    """
+    return SessionStore()
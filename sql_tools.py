@@ -0,0 +1,505 @@
+import difflib
+import json
+import re
+import time
+from typing import Any, Optional, Type
+from pydantic import BaseModel, Field
+from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.callbacks.manager import dispatch_custom_event
+from langchain_core.tools import BaseTool
+# Import the stock SQL tools (and their shared base) that our toolkit builds on
+from langchain_community.tools.sql_database.tool import (
+    BaseSQLDatabaseTool,
+    InfoSQLDatabaseTool,
+    ListSQLDatabaseTool,
+    QuerySQLDatabaseTool,
+)
+from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from sqlalchemy.exc import SQLAlchemyError
+# Import the streaming, budgeted query runner (bounded preview + summary of all rows)
+from bounded_results import QueryInterrupted, run_bounded
+from cancellation import RunCancelled, current_run_control
+from tracing import SQL_STATS_EVENT
+
+# Statements the agent is allowed to run (enforced in code, not only in the prompt)
+ALLOWED_STATEMENTS = {"SELECT", "WITH"}
+
+# Keywords that turn a statement into DML/DDL (e.g., "WITH x AS (...) DELETE FROM ...")
+FORBIDDEN_KEYWORDS = {
+    "INSERT", "UPDATE", "DELETE", "REPLACE", "UPSERT", "MERGE", "DROP", "ALTER", "CREATE",
+    "TRUNCATE", "ATTACH", "DETACH", "PRAGMA", "VACUUM", "REINDEX", "GRANT", "REVOKE",
+}
+
+# DuckDB table functions that read files or URLs (besides every read_* and *_scan function)
+DUCKDB_FILE_FUNCTIONS = {
+    "GLOB", "SNIFF_CSV", "PARQUET_METADATA", "PARQUET_SCHEMA", "PARQUET_FILE_METADATA", "PARQUET_KV_METADATA",
+}
+
+# Keywords that end a FROM clause's list of tables
+CLAUSE_KEYWORDS = {
+    "WHERE", "GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "EXCEPT", "INTERSECT", "WINDOW",
+    "ON", "USING", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER",
+}
+
+# Keywords a '(' can follow without being a function call: it opens a subquery or a
+# parenthesized expression, whose FROM starts a clause (e.g., IN (SELECT ... FROM t))
+SUBQUERY_KEYWORDS = {
+    "SELECT", "FROM", "JOIN", "IN", "EXISTS", "AS", "ON", "WHERE", "HAVING", "AND", "OR", "NOT",
+    "CASE", "WHEN", "THEN", "ELSE", "UNION", "ALL", "ANY", "SOME", "EXCEPT", "INTERSECT", "WITH",
+    "BY", "LATERAL", "IS", "LIKE", "BETWEEN", "VALUES", "RECURSIVE",
+}
+
+# Tokenizer that is aware of comments, string literals, and quoted identifiers,
+# so keywords inside "Pattern Type" or 'low' are never mistaken for SQL.
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<string>'(?:[^']|'')*')
+    | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<number>\d+(?:\.\d*)?)
+    | (?P<other>\S)
+    """,
+    re.S | re.X,
+)
+
+# Markdown code fences the LLM sometimes wraps around its Action Input
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+
+class _QuerySQLCheckerToolInput(BaseModel):
+    query: str = Field(..., description="A detailed and SQL query to be checked.")
+
+def clean_sql(query):
+    """
+    Removes the wrappers an LLM tends to put around SQL in its Action Input
+    (Markdown code fences, surrounding quotes, trailing semicolons).
+    """
+    query = _FENCE_RE.sub("", query.strip()).strip()
+    if len(query) >= 2 and query[0] == query[-1] and query[0] in "\"'" and query.count(query[0]) == 2:
+        query = query[1:-1].strip()
+    return query.rstrip(";").strip()
+
+def tokenize_sql(query):
+    """
+    Splits a SQL statement into (kind, value) tokens, dropping comments.
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(query):
+        kind = match.lastgroup
+        if kind != "comment":
+            tokens.append((kind, match.group()))
+    return tokens
+
+def _identifier(token):
+    """
+    Returns the plain name of a word or quoted-identifier token, or None.
+    """
+    kind, value = token
+    if kind == "word":
+        return value
+    if kind == "quoted":
+        return value[1:-1].replace('""', '"')
+    return None
+
+def _duckdb_file_access(tokens):
+    """
+    Returns the first DuckDB construct of a statement that reads host files or URLs
+    (read_csv(...), glob(...), parquet_scan(...), or a path after FROM / JOIN), or None.
+    """
+    clause = table_clause_starts(tokens)
+    for i, (kind, value) in enumerate(tokens):
+        is_call = i + 1 < len(tokens) and tokens[i + 1][1] == "("
+        name = value.upper()
+        if kind == "word" and is_call and (
+            name.startswith("READ_") or name.endswith("_SCAN") or name in DUCKDB_FILE_FUNCTIONS
+        ):
+            return f"{value}(...)"
+        # DuckDB treats a string after FROM / JOIN as a file to scan: FROM '/path/data.csv'
+        # (but not in 'x IS DISTINCT FROM 'a'' or TRIM(' ' FROM 'a'), where it is a plain value)
+        if kind == "string" and i > 0 and clause[i - 1]:
+            return value
+    return None
+
+def check_read_only(tokens, dialect=None):
+    """
+    Enforces the "no DML" rule on a tokenized statement.
+    On DuckDB ('dialect'), also refuses table functions that read files or URLs.
+    Returns an error dict, or None if the statement is a single SELECT/WITH query.
+    """
+    if not tokens:
+        return {"code": "empty_query", "message": "The query is empty."}
+
+    if any(value == ";" for _, value in tokens):
+        return {
+            "code": "multiple_statements",
+            "message": "Only ONE statement can be run at a time. Remove the ';' and split the query.",
+        }
+
+    first_kind, first_value = tokens[0]
+    if first_kind != "word" or first_value.upper() not in ALLOWED_STATEMENTS:
+        return {
+            "code": "forbidden_statement",
+            "message": f"Only SELECT (or WITH ... SELECT) queries are allowed, got '{first_value}'. The database is read-only.",
+        }
+
+    for i, (kind, value) in enumerate(tokens):
+        # A keyword followed by '(' is a function call (e.g., REPLACE(...)), not a statement
+        is_call = i + 1 < len(tokens) and tokens[i + 1][1] == "("
+        if kind == "word" and value.upper() in FORBIDDEN_KEYWORDS and not is_call:
+            return {
+                "code": "forbidden_statement",
+                "message": f"'{value.upper()}' is not allowed. The database is read-only; only SELECT queries can be run.",
+            }
+
+    if dialect == "duckdb":
+        access = _duckdb_file_access(tokens)
+        if access:
+            return {
+                "code": "forbidden_file_access",
+                "message": f"{access} reads files outside the database, which is not allowed. Query the database's tables only.",
+            }
+    return None
+
+def table_clause_starts(tokens):
+    """
+    For each token, True if it is a FROM / JOIN that starts a clause (a table list).
+    A FROM in 'IS [NOT] DISTINCT FROM x', or inside a function call such as
+    EXTRACT(year FROM d), SUBSTRING(x FROM 2), TRIM(' ' FROM x), does not.
+    """
+    starts, calls = [], []
+    for i, (kind, value) in enumerate(tokens):
+        word = value.upper() if kind == "word" else None
+        previous = tokens[i - 1] if i > 0 else None
+        if value == "(":
+            # 'name(' is a function call; '(' after a keyword opens a subquery or a group
+            calls.append(
+                previous is not None and previous[0] in ("word", "quoted")
+                and not (previous[0] == "word" and previous[1].upper() in SUBQUERY_KEYWORDS)
+            )
+        elif value == ")" and calls:
+            calls.pop()
+        starts.append(
+            word in ("FROM", "JOIN") and not (calls and calls[-1])
+            and not (word == "FROM" and previous is not None and previous[0] == "word" and previous[1].upper() == "DISTINCT")
+        )
+    return starts
+
+def referenced_tables(tokens):
+    """
+    Extracts the table names referenced after FROM / JOIN, the names of CTEs
+    defined in a WITH clause (which are valid table names too), and every
+    alias introduced with AS or after a table name (including the column
+    names listed in a CTE definition: name(col, ...) AS (...)).
+    Only a FROM that starts a clause counts (see table_clause_starts).
+    """
+    tables, ctes, aliases = [], set(), set()
+    words = [value.upper() if kind == "word" else None for kind, value in tokens]
+    clause = table_clause_starts(tokens)
+
+    for i, word in enumerate(words):
+        # Column / table alias: ... AS alias
+        if word == "AS" and i + 1 < len(tokens) and _identifier(tokens[i + 1]):
+            aliases.add(_identifier(tokens[i + 1]).lower())
+
+        # CTE definition: name AS (   /   name(col, ...) AS (
+        if word == "AS" and i + 1 < len(tokens) and tokens[i + 1][1] == "(" and i > 0:
+            j = i - 1
+            if tokens[j][1] == ")":
+                while j > 0 and tokens[j][1] != "(":
+                    j -= 1
+                    if _identifier(tokens[j]):
+                        aliases.add(_identifier(tokens[j]).lower())
+                j -= 1
+            name = _identifier(tokens[j]) if j >= 0 else None
+            if name:
+                ctes.add(name.lower())
+
+        if not clause[i]:
+            continue
+
+        # Walk the comma-separated table list: FROM a [AS] x, b [AS] y
+        j = i + 1
+        while j < len(tokens):
+            # Skip subqueries and table-valued functions: FROM (SELECT ...) / FROM json_each(...)
+            if tokens[j][1] == "(" or (j + 1 < len(tokens) and tokens[j + 1][1] == "("):
+                break
+            name = _identifier(tokens[j])
+            if name is None or (tokens[j][0] == "word" and name.upper() in CLAUSE_KEYWORDS):
+                break
+            # schema.table -> table
+            if j + 2 < len(tokens) and tokens[j + 1][1] == ".":
+                j += 2
+                name = _identifier(tokens[j]) or name
+            tables.append(name)
+            j += 1
+
+            # Optional alias ([AS] alias)
+            if j < len(tokens) and words[j] == "AS":
+                j += 1
+            if j < len(tokens) and _identifier(tokens[j]) and (tokens[j][0] != "word" or words[j] not in CLAUSE_KEYWORDS):
+                aliases.add(_identifier(tokens[j]).lower())
+                j += 1
+            if j < len(tokens) and tokens[j][1] == ",":
+                j += 1
+                continue
+            break
+
+    return tables, ctes, aliases
+
+def _suggest(name, candidates):
+    """
+    Returns the closest matches to a misspelled name (case-insensitive).
+    """
+    lowered = {c.lower(): c for c in candidates}
+    return [lowered[m] for m in difflib.get_close_matches(name.lower(), list(lowered), n=3, cutoff=0.5)]
+
+def _known_columns(db, tables):
+    """
+    Returns the reflected column names of the given tables (or of all tables).
+    """
+    columns = []
+    for table in tables:
+        try:
+            columns += [c["name"] for c in db._inspector.get_columns(table)]
+        except Exception:
+            continue
+    return columns
+
+def _explain_error(db, message, tables):
+    """
+    Turns a database error raised by EXPLAIN into a structured, actionable error.
+    """
+    lowered = message.lower()
+
+    match = re.search(r"no such column: ([\w.\"' ]+)", message, re.I)
+    if match:
+        column = match.group(1).strip().strip("\"'").split(".")[-1]
+        return {
+            "code": "unknown_column",
+            "message": f"Column '{column}' does not exist.",
+            "suggestions": _suggest(column, _known_columns(db, tables or db.get_usable_table_names())),
+            "hint": 'Column names with spaces must be double-quoted, e.g. "Pattern Type".',
+        }
+
+    match = re.search(r"no such table: ([\w.]+)", message, re.I)
+    if match:
+        table = match.group(1).split(".")[-1]
+        return {
+            "code": "unknown_table",
+            "message": f"Table '{table}' does not exist.",
+            "suggestions": _suggest(table, db.get_usable_table_names()),
+        }
+
+    if "ambiguous column" in lowered:
+        return {"code": "ambiguous_column", "message": message, "hint": "Prefix the column with its table name or alias."}
+
+    if "syntax error" in lowered or "incomplete input" in lowered:
+        return {"code": "syntax_error", "message": message}
+
+    return {"code": "invalid_query", "message": message}
+
+def explain_query_plan(db, query):
+    """
+    Runs EXPLAIN (QUERY PLAN) on the shared engine and returns the plan lines.
+    Nothing is executed: the database only compiles the statement.
+    """
+    prefix = "EXPLAIN QUERY PLAN " if db.dialect == "sqlite" else "EXPLAIN "
+    with db._engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + query).fetchall()
+    # SQLite rows are (id, parent, notused, detail); other dialects return one text column
+    return [str(row[-1]) for row in rows]
+
+def validate_sql(db, query):
+    """
+    Validates a query locally, without any LLM call:
+    1. Parses it and rejects anything other than a single SELECT / WITH statement.
+    2. Checks referenced tables and double-quoted column names against the reflected schema.
+    3. Compiles it with EXPLAIN QUERY PLAN to catch unknown columns and syntax errors.
+    Returns a dict: {"valid": bool, "query": ..., "errors": [...], "plan": [...]}.
+    """
+    query = clean_sql(query)
+    tokens = tokenize_sql(query)
+    result = {"valid": False, "query": query, "errors": [], "plan": []}
+
+    # 1. Statement type (the read-only guarantee)
+    error = check_read_only(tokens, db.dialect)
+    if error:
+        result["errors"].append(error)
+        return result
+
+    # 2. Table names against the reflected schema
+    tables, ctes, aliases = referenced_tables(tokens)
+    known_tables = {t.lower() for t in db.get_usable_table_names()}
+    for table in tables:
+        if table.lower() not in known_tables and table.lower() not in ctes:
+            result["errors"].append({
+                "code": "unknown_table",
+                "message": f"Table '{table}' does not exist.",
+                "suggestions": _suggest(table, db.get_usable_table_names()),
+            })
+    if result["errors"]:
+        return result
+
+    # 3. Double-quoted names against the reflected columns.
+    # SQLite silently turns an unknown "identifier" into a string literal, so a typo
+    # like "Pattern Typ" would compile (and return wrong data) without this check.
+    # Names a CTE defines (its column list, or aliases in its body) count as known.
+    columns = _known_columns(db, [t for t in tables if t.lower() in known_tables])
+    known_names = {c.lower() for c in columns} | known_tables | ctes | aliases
+    for kind, value in tokens:
+        if kind == "quoted" and value.startswith('"'):
+            name = _identifier((kind, value))
+            if name.lower() not in known_names:
+                result["errors"].append({
+                    "code": "unknown_column",
+                    "message": f'Column "{name}" does not exist.',
+                    "suggestions": _suggest(name, columns),
+                    "hint": "Use single quotes for text values (e.g., 'low'); double quotes are for column names.",
+                })
+    if result["errors"]:
+        return result
+
+    # 4. Compile the statement (columns, functions, syntax) without running it
+    try:
+        result["plan"] = explain_query_plan(db, query)
+    except Exception as e:
+        # Unwrap SQLAlchemy's wrapper to get the driver's own message
+        message = str(getattr(e, "orig", e))
+        result["errors"].append(_explain_error(db, message, [t for t in tables if t.lower() in known_tables]))
+        return result
+
+    result["valid"] = True
+    return result
+
+class LocalQueryCheckerTool(BaseSQLDatabaseTool, BaseTool):
+    """
+    Drop-in replacement for 'QuerySQLCheckerTool' that validates SQL locally
+    (parser + reflected schema + EXPLAIN QUERY PLAN) instead of asking the LLM.
+    """
+
+    name: str = "sql_db_query_checker"
+    description: str = """
+    Use this tool to double check if your query is correct before executing it.
+    Returns JSON: "valid" plus a list of "errors" (with a code, message, and suggestions) to fix.
+    """
+    args_schema: Type[BaseModel] = _QuerySQLCheckerToolInput
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+        """Validate the query and return a structured JSON verdict."""
+        return json.dumps(validate_sql(self.db, query), default=str)
+
+class ReadOnlyQueryTool(QuerySQLDatabaseTool):
+    """
+    'sql_db_query' that refuses anything other than a single SELECT / WITH
+    statement BEFORE it reaches the database, serves repeated queries from the
+    shared result cache, streams results under a row/byte budget instead of
+    stringifying the whole result set into the prompt, and logs what it executed.
+    """
+
+    # Optional process-wide 'QueryCache' (see query_cache.py)
+    cache: Any = Field(default=None, exclude=True)
+
+    # Optional process-wide 'QueryLog' (see query_log.py); cache hits are not logged
+    log: Any = Field(default=None, exclude=True)
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ):
+        """Execute the query, return the results or an error message."""
+        query = clean_sql(query)
+        error = check_read_only(tokenize_sql(query), self.db.dialect)
+        if error:
+            return f"Error: {error['message']}"
+
+        # 1. Serve repeated queries from the cache (no SQLite round trip)
+        if self.cache is not None:
+            cached = self.cache.get(self.db, query)
+            if cached is not None:
+                self._report(run_manager, cached, "hit")
+                return cached["text"]
+
+        # 2. Stream the query under the row/byte budget; only successful results are cached
+        started = time.perf_counter()
+        try:
+            result = run_bounded(self.db, query)
+        except QueryInterrupted as e:
+            # A cancelled question stops the whole agent; a plain timeout lets it retry cheaper SQL
+            control = current_run_control()
+            if control is not None and control.cancelled:
+                raise RunCancelled(control.reason) from e
+            # Timeouts are the slowest statements of all: keep them for the index advisor
+            if self.log is not None:
+                self.log.record(self.db, query, (time.perf_counter() - started) * 1000, status="timeout")
+            return f"Error: Query stopped because the {e}. Rewrite it to be cheaper (add filters or aggregation, avoid cross joins)."
+        except SQLAlchemyError as e:
+            # Format the error message like 'SQLDatabase.run_no_throw' so the agent can self-correct
+            return f"Error: {e}"
+
+        if self.log is not None:
+            self.log.record(self.db, query, (time.perf_counter() - started) * 1000, result["row_count"])
+        if self.cache is not None:
+            self.cache.put(self.db, query, result)
+        self._report(run_manager, result, "miss" if self.cache is not None else "off")
+        return result["text"]
+
+    @staticmethod
+    def _report(run_manager, result, cache_status):
+        """
+        Reports row count and cache status to tracing callbacks (see tracing.py)
+        as a custom event attached to this tool run.
+        """
+        if run_manager is None:
+            return
+        dispatch_custom_event(
+            SQL_STATS_EVENT,
+            {"rows": result["row_count"], "truncated": result["truncated"], "cache": cache_status},
+            config={"callbacks": run_manager.get_child()},
+        )
+
+class InsightSQLToolkit(SQLDatabaseToolkit):
+    """
+    SQLDatabaseToolkit with the LLM-backed query checker replaced by the local
+    validator, and a query tool that enforces the read-only rule in code.
+    """
+
+    # Optional process-wide result cache shared by every session's query tool
+    query_cache: Any = Field(default=None, exclude=True)
+
+    # Optional process-wide log of executed statements, read by the index advisor
+    query_log: Any = Field(default=None, exclude=True)
+
+    def get_tools(self):
+        """Get the tools in the toolkit."""
+        list_sql_database_tool = ListSQLDatabaseTool(db=self.db)
+        info_sql_database_tool = InfoSQLDatabaseTool(
+            db=self.db,
+            description=(
+                "Input to this tool is a comma-separated list of tables, output is the "
+                "schema and sample rows for those tables. "
+                "Example Input: table1, table2, table3"
+            ),
+        )
+        query_sql_checker_tool = LocalQueryCheckerTool(db=self.db)
+        query_sql_database_tool = ReadOnlyQueryTool(
+            db=self.db,
+            cache=self.query_cache,
+            log=self.query_log,
+            description=(
+                "Input to this tool is a detailed and correct SQL SELECT query, output is a "
+                "result from the database. If the query is not correct, an error message "
+                "will be returned. If an error is returned, rewrite the query, check the "
+                f"query with {query_sql_checker_tool.name}, and try again."
+            ),
+        )
+        return [
+            query_sql_database_tool,
+            info_sql_database_tool,
+            list_sql_database_tool,
+            query_sql_checker_tool,
+        ]
@@ -0,0 +1,229 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import warnings
+import streamlit as st
+
+logger = logging.getLogger("insightsql")
+
+# Modules app.py imports before the first page render: kept free of LangChain / Gemini
+FIRST_PAINT_MODULES = ("function", "database", "session_store", "agent_modes", "startup")
+
+# The agent stack, imported by the prewarm thread while the page renders (or on the first Connect)
+DEFERRED_MODULES = ("engine", "streamlit_callbacks")
+
+# Set INSIGHTSQL_PREWARM=0 to build everything on the first Connect instead (e.g., to save memory)
+PREWARM = os.environ.get("INSIGHTSQL_PREWARM", "1") != "0"
+
+# Default budget (ms) of the first-paint imports checked by 'python startup.py --budget-ms'
+FIRST_PAINT_BUDGET_MS = 500
+
+# Packages listed in the import report
+REPORT_TOP = 12
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+def _import_modules(modules):
+    for module in modules:
+        importlib.import_module(module)
+
+class Prewarmer:
+    """
+    Builds the process-wide resources in a background thread while the page renders
+    and the user types the API key, so Connect (and the first question) find them ready:
+    1. imports the agent stack (DEFERRED_MODULES);
+    2. opens the database pool and loads (or profiles) the schema digest, and loads the prompts;
+    3. once an API key is known, builds the shared engine (Gemini client, tools, agent graph).
+    Every step calls the same cached functions as Connect, so a Connect that comes early
+    simply waits for the step in flight. Each (API key, database) pair is warmed once.
+    Thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = set()
+        self._running = 0
+        self.timings = {}  # step -> ms (the first measurement of each step)
+        self.errors = {}
+
+    def start(self, google_api_key, db_uri):
+        """
+        Warms the resources for this API key (None: everything but the engine) and database. Never blocks.
+        """
+        target = (google_api_key or None, db_uri)
+        with self._lock:
+            if target in self._started:
+                return
+            self._started.add(target)
+            self._running += 1
+        threading.Thread(target=self._run, args=target, name="insightsql-prewarm", daemon=True).start()
+
+    def record(self, step, ms):
+        """
+        Records the duration of a startup step, unless it was already measured (later runs are warm).
+        """
+        with self._lock:
+            self.timings.setdefault(step, round(ms, 1))
+
+    def _step(self, step, func, *args):
+        started = time.perf_counter()
+        try:
+            func(*args)
+        except Exception as e:
+            # Connect repeats the step and reports the error to the user
+            with self._lock:
+                self.errors[step] = f"{type(e).__name__}: {e}"[:300]
+            logger.warning("Prewarm step '%s' failed: %s", step, e)
+            return False
+        self.record(step, (time.perf_counter() - started) * 1000)
+        return True
+
+    def _run(self, google_api_key, db_uri):
+        try:
+            if not self._step("imports", _import_modules, DEFERRED_MODULES):
+                return
+            from agent import load_react_prompt, load_tool_calling_prompt
+            from database import DB_BACKEND, get_database
+            from duckdb_mirror import resolve_backend
+            from engine import get_engine
+            from profiler import get_schema_digest
+
+            def _database():
+                uri, _ = resolve_backend(db_uri, DB_BACKEND)
+                get_schema_digest(get_database(uri), uri)
+
+            def _prompts():
+                load_react_prompt()
+                load_tool_calling_prompt()
+
+            self._step("database", _database)
+            self._step("prompts", _prompts)
+            if google_api_key:
+                # Same arguments as app.py's Connect, so it hits the same cache entry
+                self._step("engine", get_engine, google_api_key, db_uri)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def wait(self, timeout=None):
+        """
+        Blocks until every started warm-up is done (for scripts); returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._running:
+                    return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+    def stats(self):
+        """
+        Returns the measured startup steps (ms), the failed ones, and whether a warm-up is running.
+        """
+        with self._lock:
+            return {"timings": dict(self.timings), "errors": dict(self.errors), "running": self._running > 0}
+
+@st.cache_resource(show_spinner=False)
+def get_prewarmer():
+    """
+    Returns the process-wide prewarmer.
+    """
+    return Prewarmer()
+
+def profile_imports(modules, preload=("streamlit",)):
+    """
+    Imports 'modules' in a fresh interpreter with '-X importtime' (after 'preload', which
+    is not counted) and returns the cumulative ms of each module, their total, and the
+    self time of the packages they pulled in (slowest first).
+    """
+    code = "\n".join(f"import {module}" for module in (*preload, *modules))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {', '.join(modules)} failed:\n{result.stderr[-2000:]}")
+
+    per_module, packages, subtree = {}, {}, []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = int(match[1]), int(match[2]), match[3], match[4]
+        subtree.append((name, self_us))
+        if indent:
+            continue
+        # A top-level line closes the subtree of everything it imported (printed before it)
+        if name in modules:
+            per_module[name] = cumulative_us / 1000
+            for package, us in subtree:
+                top_package = package.split(".")[0]
+                packages[top_package] = packages.get(top_package, 0.0) + us / 1000
+        subtree = []
+
+    return {
+        "modules": {name: round(ms, 1) for name, ms in per_module.items()},
+        "total_ms": round(sum(per_module.values()), 1),
+        "packages": [(name, round(ms, 1)) for name, ms in sorted(packages.items(), key=lambda item: -item[1])],
+    }
+
+def _print_profile(title, profile, top):
+    print(f"{title}: {profile['total_ms']:.0f} ms")
+    for name, ms in profile["modules"].items():
+        print(f"  {name:<28} {ms:9.1f} ms")
+    print("  Slowest packages (self time):")
+    for name, ms in profile["packages"][:top]:
+        print(f"    {name:<26} {ms:9.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup timing report: what the first page render imports, and what the prewarm builds.")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help=f"Exit with status 1 if the first-paint imports take longer (e.g., {FIRST_PAINT_BUDGET_MS}); for CI")
+    parser.add_argument("--top", type=int, default=REPORT_TOP, help="Packages listed per group")
+    parser.add_argument("--prewarm", action="store_true", help="Also run the prewarm steps in this process and time them")
+    parser.add_argument("--db-uri", default=None, help="Database warmed with --prewarm (default: the app's default)")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"), help="With --prewarm, also build the engine for this key")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = {
+        "first_paint": profile_imports(FIRST_PAINT_MODULES),
+        # Measured on top of what the first render already imported
+        "deferred": profile_imports(DEFERRED_MODULES, preload=("streamlit", *FIRST_PAINT_MODULES)),
+    }
+
+    if args.prewarm:
+        warnings.filterwarnings("ignore")
+        from database import DB_URI
+        prewarmer = Prewarmer()
+        prewarmer.start(args.api_key, args.db_uri or DB_URI)
+        prewarmer.wait()
+        report["prewarm"] = prewarmer.stats()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_profile("First paint imports", report["first_paint"], args.top)
+        _print_profile("Deferred imports (prewarm thread)", report["deferred"], args.top)
+        if args.prewarm:
+            print("Prewarm steps:")
+            for step, ms in report["prewarm"]["timings"].items():
+                print(f"  {step:<28} {ms:9.1f} ms")
+            for step, error in report["prewarm"]["errors"].items():
+                print(f"  {step:<28} FAILED: {error}")
+
+    if args.budget_ms is not None and report["first_paint"]["total_ms"] > args.budget_ms:
+        print(f"First paint imports take {report['first_paint']['total_ms']:.0f} ms, over the {args.budget_ms:.0f} ms budget", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import threading
+from streamlit.external.langchain import StreamlitCallbackHandler
+from streamlit.external.langchain.streamlit_callback_handler import LLMThought
+from tool_calling import tool_input_text
+
+class ParallelStreamlitCallbackHandler(StreamlitCallbackHandler):
+    """
+    'StreamlitCallbackHandler' that also renders steps with several tool calls, which
+    the function-calling agent runs at the same time on separate threads.
+    The stock handler keeps a single "current thought", so a second call of the same
+    step has nowhere to go; here each tool run gets its own thought (keyed by run id),
+    and every callback is serialized by a lock.
+    'detach' stops all drawing once the script run owning the container is gone.
+    """
+
+    def __init__(self, parent_container, **kwargs):
+        super().__init__(parent_container, **kwargs)
+        self._lock = threading.RLock()
+        self._tool_thoughts = {}
+        self._detached = False
+
+    def detach(self):
+        """
+        Ignores every later callback: the script was rerun (e.g., a sidebar widget changed)
+        while the question keeps running, and its containers belong to the previous run.
+        """
+        with self._lock:
+            self._detached = True
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        with self._lock:
+            if self._detached:
+                return
+            super().on_llm_start(serialized, prompts, **kwargs)
+
+    def on_llm_new_token(self, token, **kwargs):
+        with self._lock:
+            if self._detached:
+                return
+            super().on_llm_new_token(token, **kwargs)
+
+    def on_llm_end(self, response, **kwargs):
+        with self._lock:
+            if self._detached:
+                return
+            super().on_llm_end(response, **kwargs)
+
+    def on_llm_error(self, error, **kwargs):
+        with self._lock:
+            if self._detached:
+                return
+            super().on_llm_error(error, **kwargs)
+
+    def on_agent_action(self, action, color=None, **kwargs):
+        # The thought is claimed by 'on_tool_start', which follows for every action
+        pass
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        with self._lock:
+            if self._detached:
+                return
+            # The first call of a step takes over the model's thought; the others get a new one
+            thought = self._current_thought or LLMThought(
+                parent_container=self._parent_container,
+                expanded=self._expand_new_thoughts,
+                collapse_on_complete=self._collapse_completed_thoughts,
+                labeler=self._thought_labeler,
+            )
+            self._current_thought = None
+            self._tool_thoughts[run_id] = thought
+            thought.on_tool_start(serialized, tool_input_text(kwargs.get("inputs") or input_str), **kwargs)
+
+    def on_tool_end(self, output, color=None, observation_prefix=None, llm_prefix=None, *, run_id, **kwargs):
+        with self._lock:
+            thought = self._tool_thoughts.pop(run_id, None)
+            if thought is None or self._detached:
+                return
+            thought.on_tool_end(str(output), color, observation_prefix, llm_prefix, **kwargs)
+            self._complete_tool_thought(thought)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            thought = self._tool_thoughts.pop(run_id, None)
+            if thought is None or self._detached:
+                return
+            thought.on_tool_error(error, **kwargs)
+            self._complete_tool_thought(thought)
+
+    def on_agent_finish(self, finish, color=None, **kwargs):
+        with self._lock:
+            if self._detached:
+                return
+            super().on_agent_finish(finish, color, **kwargs)
+
+    def _complete_tool_thought(self, thought):
+        """
+        Marks a finished tool thought as complete (caller holds the lock).
+        """
+        thought.complete()
+        self._completed_thoughts.append(thought)
@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import sqlite3
+import time
+from collections import Counter
+from paths import CACHE_DIR
+
+# The 500-row dataset shipped with the app: the source of every value distribution
+SEED_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dresses.db")
+TABLE = "dresses"
+
+# Rows generated and inserted per transaction
+INSERT_BATCH = 50_000
+
+# Columns sampled jointly (the recommendation label depends on the rating)
+JOINT_COLUMNS = ("Rating", "Recommendation")
+
+def synthetic_db_path(rows):
+    """
+    Default location of a generated database with 'rows' rows (inside the local cache folder).
+    """
+    return os.path.join(CACHE_DIR, "bench", f"dresses_{rows}.db")
+
+def load_distributions(seed_db_path=SEED_DB_PATH):
+    """
+    Reads the seed table's schema and its empirical value distributions.
+    Returns (create_sql, columns, marginals, joint, id_range) where 'marginals'
+    maps each independently sampled column to (values, weights), 'joint' holds the
+    (values, weights) of the JOINT_COLUMNS tuples, and 'id_range' is (min, max) Dress_ID.
+    """
+    conn = sqlite3.connect(f"file:{seed_db_path}?mode=ro", uri=True)
+    try:
+        create_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (TABLE,)).fetchone()[0]
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{TABLE}")')]
+        rows = conn.execute(f'SELECT * FROM "{TABLE}"').fetchall()
+    finally:
+        conn.close()
+
+    marginals = {}
+    for index, column in enumerate(columns):
+        if column == "Dress_ID" or column in JOINT_COLUMNS:
+            continue
+        counts = Counter(row[index] for row in rows)
+        marginals[column] = (list(counts), list(counts.values()))
+
+    joint_indexes = [columns.index(column) for column in JOINT_COLUMNS]
+    joint_counts = Counter(tuple(row[i] for i in joint_indexes) for row in rows)
+    joint = (list(joint_counts), list(joint_counts.values()))
+
+    id_range = (min(row[0] for row in rows), max(row[0] for row in rows))
+    return create_sql, columns, marginals, joint, id_range
+
+def generate(rows, path=None, seed=42, seed_db_path=SEED_DB_PATH):
+    """
+    Writes a database with the seed's schema and 'rows' synthetic rows.
+    Every categorical column follows the seed's value frequencies (NULLs included),
+    rating/recommendation pairs are drawn together, and Dress_IDs stay unique.
+    The same (rows, seed) always produces the same file. Returns its path.
+    """
+    path = path or synthetic_db_path(rows)
+    create_sql, columns, marginals, joint, id_range = load_distributions(seed_db_path)
+    rng = random.Random(seed)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    # Unique IDs in the seed's ID range (widened if the range is too small)
+    low, high = id_range
+    high = max(high, low + rows * 2)
+    dress_ids = rng.sample(range(low, high), rows)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(create_sql)
+        placeholders = ", ".join("?" for _ in columns)
+        insert = f'INSERT INTO "{TABLE}" VALUES ({placeholders})'
+
+        for start in range(0, rows, INSERT_BATCH):
+            size = min(INSERT_BATCH, rows - start)
+            # Sample column by column ('random.choices' is vectorized over k), then zip into rows
+            sampled = {column: rng.choices(values, weights, k=size) for column, (values, weights) in marginals.items()}
+            pairs = rng.choices(joint[0], joint[1], k=size)
+            for position, column in enumerate(JOINT_COLUMNS):
+                sampled[column] = [pair[position] for pair in pairs]
+            sampled["Dress_ID"] = dress_ids[start:start + size]
+
+            conn.executemany(insert, zip(*(sampled[column] for column in columns)))
+            conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, path)
+    return path
+
+def ensure_synthetic_db(rows, seed=42):
+    """
+    Returns the path of the generated database for 'rows', creating it on first use.
+    """
+    path = synthetic_db_path(rows)
+    if not os.path.exists(path):
+        generate(rows, path, seed=seed)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a scaled copy of dresses.db with the same value distributions.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of rows to generate")
+    parser.add_argument("--out", default=None, help="Output database path (default: inside .insightsql_cache/bench)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (same seed = same file)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    out = generate(args.rows, args.out, seed=args.seed)
+    print(f"Wrote {args.rows:,} rows to {out} in {time.perf_counter() - started:.1f}s")
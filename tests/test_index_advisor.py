@@ -0,0 +1,49 @@
+import sqlite3
+
+import index_advisor
+
+
+class _Log:
+    """
+    A query log holding fixed entries, in the shape QueryLog.entries returns.
+    """
+
+    def __init__(self, entries):
+        self._entries = entries
+
+    def entries(self, db_key, since=None):
+        return self._entries
+
+
+def _entry(sql, plan):
+    return {"sql": sql, "normalized_sql": sql, "duration_ms": 50.0, "row_count": 10, "status": "ok",
+            "plan": plan, "created": 0.0}
+
+
+def test_distinct_from_column_is_not_a_table(tmp_path):
+    # 'region' is both a lookup table and an orders column: the comparison must not
+    # make the advisor propose indexes on the region table
+    path = tmp_path / "shop.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE region (region TEXT, name TEXT)")
+    conn.execute("CREATE TABLE orders (id INTEGER, region TEXT, ship_region TEXT, amount REAL)")
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?)",
+                     [(i, f"r{i % 7}", f"r{i % 5}", i * 1.5) for i in range(500)])
+    conn.commit()
+    conn.close()
+
+    sql = "SELECT id, amount FROM orders WHERE region = 'r1' AND ship_region IS DISTINCT FROM region AND amount > 10 ORDER BY id"
+    log = _Log([_entry(sql, ["SCAN orders", "USE TEMP B-TREE FOR ORDER BY"])])
+    report = index_advisor.advise(f"sqlite:///{path}", log=log, runs=1, work_dir=str(tmp_path / "advisor"))
+
+    assert report["scans"] == {"orders": 1}
+    proposed = report["recommendations"] + report["rejected"]
+    assert proposed and {result["table"] for result in proposed} == {"orders"}
+
+
+def test_column_usage_continues_past_distinct_from():
+    sql = "SELECT id FROM orders WHERE ship_region IS DISTINCT FROM region AND amount > 10 ORDER BY id"
+    usage = index_advisor.column_usage(index_advisor.tokenize_sql(sql), ["id", "region", "ship_region", "amount"])
+    assert usage["equality"] == []
+    assert usage["range"] == ["amount"]
+    assert usage["order"] == ["id"]
@@ -0,0 +1,68 @@
+import pytest
+
+import sql_tools
+from sql_tools import referenced_tables, tokenize_sql
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT Style FROM dresses WHERE Style IS DISTINCT FROM Season", ["dresses"]),
+    ("SELECT Style FROM dresses WHERE Style IS NOT DISTINCT FROM Season", ["dresses"]),
+    ("SELECT EXTRACT(year FROM created) FROM dresses", ["dresses"]),
+    ("SELECT SUBSTRING(Style FROM 2) FROM dresses", ["dresses"]),
+    ("SELECT TRIM(' ' FROM Style) FROM dresses", ["dresses"]),
+    ("SELECT date_part('year', d) FROM dresses d JOIN sales s ON EXTRACT(month FROM s.day) = 1", ["dresses", "sales"]),
+])
+def test_from_outside_a_clause_is_not_a_table(query, expected):
+    assert referenced_tables(tokenize_sql(query))[0] == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT * FROM a WHERE x IN (SELECT y FROM b)", ["a", "b"]),
+    ("SELECT COUNT((SELECT 1 FROM c)) FROM a", ["c", "a"]),
+    ("SELECT * FROM (SELECT * FROM inner1) q JOIN inner2 ON 1", ["inner1", "inner2"]),
+    ("SELECT CASE WHEN EXISTS (SELECT 1 FROM e) THEN 1 END FROM a", ["e", "a"]),
+    ("WITH s(x) AS (SELECT Style FROM dresses) SELECT * FROM s, t2", ["dresses", "s", "t2"]),
+])
+def test_subquery_tables_are_collected(query, expected):
+    assert referenced_tables(tokenize_sql(query))[0] == expected
+
+
+class _DuckDBSchema:
+    """
+    Just enough of a DuckDB-backed SQLDatabase for validate_sql, with EXPLAIN stubbed out.
+    """
+
+    dialect = "duckdb"
+
+    def __init__(self, columns):
+        self._columns = columns
+        self._inspector = self
+
+    def get_usable_table_names(self):
+        return list(self._columns)
+
+    def get_columns(self, table):
+        return [{"name": name} for name in self._columns[table]]
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT EXTRACT(year FROM order_date) AS y, COUNT(*) FROM orders GROUP BY y",
+    "SELECT region FROM orders WHERE EXTRACT(month FROM order_date) = 1 AND region IS DISTINCT FROM 'EU'",
+    "SELECT date_trunc('month', order_date) AS m, SUM(amount) FROM orders GROUP BY m",
+])
+def test_duckdb_hint_date_functions_validate(monkeypatch, query):
+    # The DuckDB dialect hint recommends these; the validator must not reject them
+    monkeypatch.setattr(sql_tools, "explain_query_plan", lambda db, q: ["SEQ_SCAN orders"])
+    db = _DuckDBSchema({"orders": ["order_date", "region", "amount"]})
+    result = sql_tools.validate_sql(db, query)
+    assert result["valid"], result["errors"]
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM '/etc/passwd'",
+    "SELECT * FROM orders JOIN 'https://example.com/x.parquet' ON 1",
+    "SELECT COUNT((SELECT 1 FROM 'data.csv')) FROM orders",
+    "SELECT * FROM orders WHERE region IN (SELECT region FROM 'regions.csv')",
+])
+def test_duckdb_file_reads_are_still_refused(query):
+    assert sql_tools.check_read_only(tokenize_sql(query), "duckdb")["code"] == "forbidden_file_access"
@@ -0,0 +1,97 @@
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentStep
+
+# Tool calls of one agent step executed at the same time
+MAX_PARALLEL_TOOLS = 4
+
+# Context-manager factory entered by every thread that runs a tool for the current question
+# (e.g., to lend it Streamlit's script context); set by the engine for each run
+_thread_context = contextvars.ContextVar("insightsql_thread_context", default=None)
+
+# The agent step being executed by this thread: its planned actions and tool pool
+_step = threading.local()
+
+@contextmanager
+def lend_thread_context(factory):
+    """
+    Makes 'factory' the context entered by the parallel tool threads of the code inside the 'with' block.
+    """
+    token = _thread_context.set(factory)
+    try:
+        yield
+    finally:
+        _thread_context.reset(token)
+
+def tool_input_text(tool_input):
+    """
+    The text of a tool input: ReAct passes a string, function calls pass their arguments
+    as a dict (e.g., {"query": "SELECT ..."}), whose single value is the text.
+    """
+    if isinstance(tool_input, dict):
+        return str(next(iter(tool_input.values()))) if len(tool_input) == 1 else str(tool_input)
+    return str(tool_input)
+
+def action_thought(action):
+    """
+    The reasoning that came with an agent action: the "Thought:" of a ReAct step, or
+    the text Gemini returned next to its function calls ("" when there is none).
+    """
+    message_log = getattr(action, "message_log", None)
+    if message_log is not None:
+        content = message_log[0].content if message_log else ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        return str(content).strip()
+    return action.log.split("Action:")[0].replace("Thought:", "").strip()
+
+class ParallelToolExecutor(AgentExecutor):
+    """
+    AgentExecutor that runs the tool calls of one step concurrently when the model
+    asks for several at once (e.g., the schema of three tables), instead of one after
+    the other. A step with a single call runs inline, exactly like AgentExecutor.
+    Each tool thread inherits the question's context (cancellation token) and enters
+    the thread context lent by 'lend_thread_context'. Observations are returned in
+    the order the model requested them.
+    """
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        _step.actions, _step.pool = [], None
+        pending = []
+        try:
+            # The base class yields every planned action first, then performs them in order:
+            # '_perform_agent_action' below turns those into futures when there are several
+            for output in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+                if isinstance(output, AgentAction):
+                    _step.actions.append(output)
+                elif isinstance(output, AgentStep) and isinstance(output.observation, Future):
+                    pending.append(output)
+                    continue
+                yield output
+            for step in pending:
+                yield AgentStep(action=step.action, observation=step.observation.result())
+        finally:
+            if _step.pool is not None:
+                _step.pool.shutdown(wait=False, cancel_futures=True)
+            _step.actions, _step.pool = [], None
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        planned = len(getattr(_step, "actions", ()))
+        if planned <= 1:
+            return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+        if _step.pool is None:
+            _step.pool = ThreadPoolExecutor(max_workers=min(planned, MAX_PARALLEL_TOOLS), thread_name_prefix="insightsql-tool")
+        factory = _thread_context.get()
+
+        def _run():
+            with factory() if factory else nullcontext():
+                step = AgentExecutor._perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager)
+            return step.observation
+
+        # Each call gets its own copy of the context: the RunControl of the question stays active
+        future = _step.pool.submit(contextvars.copy_context().run, _run)
+        return AgentStep(action=agent_action, observation=future)
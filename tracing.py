@@ -0,0 +1,252 @@
+import json
+import os
+import threading
+import time
+import uuid
+from langchain_core.callbacks import BaseCallbackHandler
+from paths import CACHE_DIR
+from tool_calling import tool_input_text
+
+# Where per-question traces are appended (one JSON span per line, OpenTelemetry-style fields)
+TRACE_PATH = os.path.join(CACHE_DIR, "traces.jsonl")
+
+# Tools whose input is a SQL statement (recorded verbatim in the span)
+SQL_TOOLS = {"sql_db_query", "sql_db_query_checker"}
+
+# Custom event dispatched by the query tool with row count / cache status
+SQL_STATS_EVENT = "insightsql_sql_stats"
+
+# Serializes appends from concurrent sessions
+_write_lock = threading.Lock()
+
+def _now_ns():
+    return time.time_ns()
+
+def _token_usage(response):
+    """
+    Extracts (prompt_tokens, completion_tokens) from an LLMResult, if reported.
+    """
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage_metadata") or {}
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+    completion = usage.get("completion_tokens", usage.get("output_tokens"))
+    return prompt, completion
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    Records a span for every LLM call, tool call, prompt build, and memory update
+    of ONE question, with wall time, token counts, SQL text, row count, and cache
+    status. On completion the spans are appended to TRACE_PATH as JSON lines and
+    a per-question timing breakdown is available via 'summary()'.
+    """
+
+    def __init__(self, question="", trace_path=TRACE_PATH):
+        self.trace_id = uuid.uuid4().hex
+        self.question = question
+        self.trace_path = trace_path
+        self.spans = []
+        self._open = {}  # run_id -> span
+        self._passthrough = {}  # run_id of an untraced chain -> span_id of its closest traced ancestor
+        self._root_run_id = None
+        self._agent_finished_ns = None
+        self._lock = threading.Lock()
+
+    # --- Span bookkeeping ---
+
+    def _start(self, run_id, parent_run_id, kind, name, **attributes):
+        span = {
+            "trace_id": self.trace_id,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_span_id": None,
+            "name": name,
+            "kind": kind,
+            "start_time_unix_nano": _now_ns(),
+            "end_time_unix_nano": None,
+            "duration_ms": None,
+            "status": "OK",
+            "attributes": attributes,
+        }
+        with self._lock:
+            span["parent_span_id"] = self._parent_span_id(parent_run_id)
+            self._open[run_id] = span
+        return span
+
+    def _parent_span_id(self, parent_run_id):
+        """
+        Resolves a LangChain parent run to the closest traced span (caller holds the lock).
+        """
+        if parent_run_id is None:
+            return None
+        parent = self._open.get(parent_run_id)
+        if parent is not None:
+            return parent["span_id"]
+        return self._passthrough.get(parent_run_id)
+
+    def _end(self, run_id, error=None, **attributes):
+        with self._lock:
+            span = self._open.pop(run_id, None)
+        if span is None:
+            return None
+        span["end_time_unix_nano"] = _now_ns()
+        span["duration_ms"] = round((span["end_time_unix_nano"] - span["start_time_unix_nano"]) / 1e6, 2)
+        span["attributes"].update(attributes)
+        if error is not None:
+            span["status"] = "ERROR"
+            span["attributes"]["error"] = str(error)[:500]
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    # --- Chains (question root + prompt building) ---
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+        if parent_run_id is None:
+            self._root_run_id = run_id
+            self._start(run_id, None, "question", name, question=self.question)
+        elif name == "PromptTemplate":
+            self._start(run_id, parent_run_id, "prompt", name)
+        else:
+            # Intermediate chains (agent sequence, parsers, ...) are not exported as spans,
+            # but their children are attached to the closest traced ancestor.
+            with self._lock:
+                self._passthrough[run_id] = self._parent_span_id(parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if run_id == self._root_run_id:
+            self._close_memory_span()
+            self._end(run_id)
+            self.flush()
+        else:
+            self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        if run_id == self._root_run_id:
+            self._end(run_id, error=error)
+            self.flush()
+        else:
+            self._end(run_id, error=error)
+
+    # --- Memory update (AgentExecutor saves memory between agent finish and chain end) ---
+
+    def on_agent_finish(self, finish, *, run_id, **kwargs):
+        self._agent_finished_ns = _now_ns()
+
+    def _close_memory_span(self):
+        if self._agent_finished_ns is None:
+            return
+        end = _now_ns()
+        with self._lock:
+            root = self._open.get(self._root_run_id)
+            self.spans.append({
+                "trace_id": self.trace_id,
+                "span_id": uuid.uuid4().hex[:16],
+                "parent_span_id": root["span_id"] if root else None,
+                "name": "memory.save_context",
+                "kind": "memory",
+                "start_time_unix_nano": self._agent_finished_ns,
+                "end_time_unix_nano": end,
+                "duration_ms": round((end - self._agent_finished_ns) / 1e6, 2),
+                "status": "OK",
+                "attributes": {},
+            })
+
+    # --- LLM calls ---
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "llm"
+        self._start(run_id, parent_run_id, "llm", name, prompt_chars=sum(len(p) for p in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chat_model"
+        chars = sum(len(str(m.content)) for batch in messages for m in batch)
+        self._start(run_id, parent_run_id, "llm", name, prompt_chars=chars)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        # Time to first token: the latency users actually feel when answers stream
+        with self._lock:
+            span = self._open.get(run_id)
+            if span is not None and "first_token_ms" not in span["attributes"]:
+                span["attributes"]["first_token_ms"] = round((_now_ns() - span["start_time_unix_nano"]) / 1e6, 2)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = _token_usage(response)
+        self._end(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    # --- Tool calls ---
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        attributes = {"tool": name}
+        if name in SQL_TOOLS:
+            attributes["sql"] = tool_input_text(kwargs.get("inputs") or input_str)
+        self._start(run_id, parent_run_id, "tool", name, **attributes)
+
+    def on_custom_event(self, name, data, *, run_id, **kwargs):
+        # The query tool reports row count / cache status for its own span
+        if name == SQL_STATS_EVENT:
+            with self._lock:
+                span = self._open.get(run_id)
+                if span is not None:
+                    span["attributes"].update(data)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_chars=len(str(output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    # --- Export & summary ---
+
+    def flush(self):
+        """
+        Appends this question's spans to the trace file (one JSON object per line).
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_time_unix_nano"])
+        if not spans or not self.trace_path:
+            return
+        os.makedirs(os.path.dirname(self.trace_path), exist_ok=True)
+        with _write_lock, open(self.trace_path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, default=str) + "\n")
+
+    def summary(self):
+        """
+        Returns the per-question timing breakdown: total wall time, and time,
+        call count, and tokens per span kind. 'overhead' is the wall time not
+        covered by LLM, tool, prompt, or memory spans (framework + parsing).
+        """
+        with self._lock:
+            spans = list(self.spans)
+        root = next((s for s in spans if s["kind"] == "question"), None)
+        breakdown = {}
+        for span in spans:
+            if span["kind"] == "question":
+                continue
+            entry = breakdown.setdefault(span["kind"], {"calls": 0, "ms": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0})
+            entry["calls"] += 1
+            entry["ms"] += span["duration_ms"] or 0.0
+            attributes = span["attributes"]
+            entry["prompt_tokens"] += attributes.get("prompt_tokens") or 0
+            entry["completion_tokens"] += attributes.get("completion_tokens") or 0
+            entry["cache_hits"] += 1 if attributes.get("cache") == "hit" else 0
+
+        total_ms = root["duration_ms"] if root else sum(e["ms"] for e in breakdown.values())
+        # Prompt spans run inside the agent chain, not inside LLM spans, so they do not overlap
+        covered = sum(e["ms"] for e in breakdown.values())
+        return {
+            "trace_id": self.trace_id,
+            "question": self.question,
+            "total_ms": round(total_ms, 2),
+            "overhead_ms": round(max(total_ms - covered, 0.0), 2),
+            "by_kind": {kind: {**e, "ms": round(e["ms"], 2)} for kind, e in breakdown.items()},
+        }